@@ -0,0 +1,312 @@
+"""
+Printable badge sheets
+
+Lays out participant badges (QR code, name, department and dependents
+count) on A4 pages and streams the PDF. Pages are built per department
+batch in a pool, and objects are written as soon as their page is ready,
+so memory use does not grow with the number of badges.
+
+Web requests build pages in threads: forking a web worker mid-request
+would hand its open database cursor and connection pool to the children.
+The offline generator (scripts/generate_badges.py) uses processes, since
+rendering missing QR codes and laying out pages is CPU-bound Python that
+threads serialize on the GIL; workers share the rendered QR codes through
+the QR cache directory.
+"""
+
+import io
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import groupby, islice
+
+from PIL import Image
+from sqlalchemy import func, select
+
+PAGE_WIDTH = 595.28  # A4 in points
+PAGE_HEIGHT = 841.89
+MARGIN = 28.0
+PAGES_PER_BATCH = 10
+
+# Object numbers reserved at the start of every document
+PAGES_OBJ = 1
+CATALOG_OBJ = 2
+FONT_OBJ = 3
+BOLD_FONT_OBJ = 4
+
+
+def iter_badges(department=None):
+    """Stream badge data ordered by department and name"""
+    from app import db
+    from models import Dependent, Participant
+
+    dependents = (
+        select(
+            Dependent.participant_id,
+            func.count(Dependent.id).label("dependents_count"),
+        )
+        .group_by(Dependent.participant_id)
+        .subquery()
+    )
+    stmt = (
+        select(
+            Participant.nome,
+            Participant.departamento,
+            Participant.qr_code,
+            func.coalesce(dependents.c.dependents_count, 0).label("dependents_count"),
+        )
+        .outerjoin(dependents, dependents.c.participant_id == Participant.id)
+        .order_by(Participant.departamento, Participant.nome)
+        .execution_options(yield_per=500)
+    )
+    if department:
+        stmt = stmt.where(Participant.departamento == department)
+
+    for row in db.session.execute(stmt):
+        yield dict(row._mapping)
+
+
+def _pdf_string(text):
+    data = str(text).encode("cp1252", errors="replace")
+    data = data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+    return b"(" + data + b")"
+
+
+def _fit(text, font_size, width):
+    """Truncate text to roughly fit ``width`` points of Helvetica"""
+    max_chars = max(int(width / (font_size * 0.52)), 4)
+    text = str(text or "")
+    return text if len(text) <= max_chars else text[: max_chars - 1] + "…"
+
+
+def qr_image_xobject(png):
+    """Return (dictionary, data) of a PDF image XObject for a cached QR PNG
+
+    1-bit grayscale PNGs (what the QR renderer produces) are embedded
+    without recompression by passing their IDAT data through with the PNG
+    predictor; anything else is decoded and deflated.
+    """
+    if png[:8] == b"\x89PNG\r\n\x1a\n":
+        position = 8
+        idat = []
+        header = None
+        while position < len(png):
+            (length,) = struct.unpack(">I", png[position : position + 4])
+            kind = png[position + 4 : position + 8]
+            body = png[position + 8 : position + 8 + length]
+            position += length + 12
+            if kind == b"IHDR":
+                header = struct.unpack(">IIBBBBB", body)
+            elif kind == b"IDAT":
+                idat.append(body)
+            elif kind == b"IEND":
+                break
+        if header and header[2:5] == (1, 0, 0) and header[6] == 0:
+            width, height = header[:2]
+            dictionary = (
+                b"/Type /XObject /Subtype /Image /Width %d /Height %d "
+                b"/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode "
+                b"/DecodeParms << /Predictor 15 /Colors 1 /BitsPerComponent 1 "
+                b"/Columns %d >>" % (width, height, width)
+            )
+            return dictionary, b"".join(idat)
+
+    img = Image.open(io.BytesIO(png)).convert("1")
+    dictionary = (
+        b"/Type /XObject /Subtype /Image /Width %d /Height %d "
+        b"/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode" % img.size
+    )
+    return dictionary, zlib.compress(img.tobytes())
+
+
+def build_pages(badges, columns, rows):
+    """Lay out badges on pages, returning (content, images) per page
+
+    Runs in a worker thread or process of stream_badge_pdf().
+    """
+    from qr_cache import qr_cache
+
+    cell_width = (PAGE_WIDTH - 2 * MARGIN) / columns
+    cell_height = (PAGE_HEIGHT - 2 * MARGIN) / rows
+    text_height = 46.0
+    qr_side = min(cell_width, cell_height - text_height) - 12
+    per_page = columns * rows
+
+    pages = []
+    for start in range(0, len(badges), per_page):
+        content = [b"0.8 G 0.5 w"]
+        images = []
+        for index, badge in enumerate(badges[start : start + per_page]):
+            column, row = index % columns, index // columns
+            x = MARGIN + column * cell_width
+            y = PAGE_HEIGHT - MARGIN - (row + 1) * cell_height
+            center = x + cell_width / 2
+
+            # Cut guide
+            content.append(
+                b"%.2f %.2f %.2f %.2f re S" % (x, y, cell_width, cell_height)
+            )
+
+            images.append(qr_image_xobject(qr_cache.get(badge["qr_code"])))
+            content.append(
+                b"q %.2f 0 0 %.2f %.2f %.2f cm /Im%d Do Q"
+                % (
+                    qr_side,
+                    qr_side,
+                    center - qr_side / 2,
+                    y + text_height,
+                    len(images) - 1,
+                )
+            )
+
+            lines = (
+                (b"/F2 11", _fit(badge["nome"], 11, cell_width - 8), 32.0),
+                (b"/F1 8", _fit(badge["departamento"] or "-", 8, cell_width - 8), 20.0),
+                (
+                    b"/F1 8",
+                    f"Dependentes: {badge['dependents_count']}  |  {badge['qr_code']}",
+                    9.0,
+                ),
+            )
+            for font, text, offset in lines:
+                size = float(font.split()[1])
+                width = len(text) * size * 0.5
+                content.append(
+                    b"BT %s Tf 0 g %.2f %.2f Td %s Tj ET"
+                    % (font, center - width / 2, y + offset, _pdf_string(text))
+                )
+        pages.append((b"\n".join(content), images))
+    return pages
+
+
+def _batches(badges, per_page):
+    """Split badges into department-aligned batches of whole pages"""
+    batch_size = per_page * PAGES_PER_BATCH
+    for _, group in groupby(badges, key=lambda badge: badge["departamento"]):
+        while batch := list(islice(group, batch_size)):
+            yield batch
+
+
+def _object(number, dictionary, stream=None):
+    if stream is None:
+        return b"%d 0 obj\n<< %s >>\nendobj\n" % (number, dictionary)
+    return (
+        b"%d 0 obj\n<< %s /Length %d >>\nstream\n" % (number, dictionary, len(stream))
+        + stream
+        + b"\nendstream\nendobj\n"
+    )
+
+
+def stream_badge_pdf(badges, columns=3, rows=4, workers=4, processes=False):
+    """Yield a badge sheet PDF chunk by chunk
+
+    ``badges`` is an iterable of dicts with nome, departamento, qr_code and
+    dependents_count, grouped by department. Each department starts on a
+    new page. Pages are built in ``workers`` threads, or processes with
+    ``processes`` (only outside web requests).
+    """
+    offsets = {}
+    position = 0
+    next_number = BOLD_FONT_OBJ + 1
+    kids = []
+
+    def emit(number, chunk):
+        nonlocal position
+        offsets[number] = position
+        position += len(chunk)
+        return chunk
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+    yield emit(
+        FONT_OBJ,
+        _object(
+            FONT_OBJ,
+            b"/Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+            b"/Encoding /WinAnsiEncoding",
+        ),
+    )
+    yield emit(
+        BOLD_FONT_OBJ,
+        _object(
+            BOLD_FONT_OBJ,
+            b"/Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold "
+            b"/Encoding /WinAnsiEncoding",
+        ),
+    )
+
+    def write_page(content, images):
+        nonlocal next_number
+        xobjects = []
+        for index, (dictionary, data) in enumerate(images):
+            yield emit(next_number, _object(next_number, dictionary, data))
+            xobjects.append(b"/Im%d %d 0 R" % (index, next_number))
+            next_number += 1
+
+        content_number = next_number
+        yield emit(
+            content_number,
+            _object(content_number, b"/Filter /FlateDecode", zlib.compress(content)),
+        )
+        page_number = content_number + 1
+        next_number += 2
+        yield emit(
+            page_number,
+            _object(
+                page_number,
+                b"/Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] "
+                b"/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> "
+                b"/XObject << %s >> >> /Contents %d 0 R"
+                % (
+                    PAGES_OBJ,
+                    PAGE_WIDTH,
+                    PAGE_HEIGHT,
+                    FONT_OBJ,
+                    BOLD_FONT_OBJ,
+                    b" ".join(xobjects),
+                    content_number,
+                ),
+            ),
+        )
+        kids.append(page_number)
+
+    pending = deque()
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+        for batch in _batches(badges, columns * rows):
+            pending.append(pool.submit(build_pages, batch, columns, rows))
+            # Keep only a few batches in memory ahead of the writer
+            if len(pending) > workers * 2:
+                for content, images in pending.popleft().result():
+                    yield from write_page(content, images)
+        while pending:
+            for content, images in pending.popleft().result():
+                yield from write_page(content, images)
+
+    if not kids:
+        yield from write_page(b"", [])
+
+    yield emit(
+        PAGES_OBJ,
+        _object(
+            PAGES_OBJ,
+            b"/Type /Pages /Kids [%s] /Count %d"
+            % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)),
+        ),
+    )
+    yield emit(
+        CATALOG_OBJ, _object(CATALOG_OBJ, b"/Type /Catalog /Pages %d 0 R" % PAGES_OBJ)
+    )
+
+    xref = [b"xref\n0 %d\n0000000000 65535 f \n" % next_number]
+    xref.extend(
+        b"%010d 00000 n \n" % offsets[number] for number in range(1, next_number)
+    )
+    yield b"".join(xref)
+    yield b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        next_number,
+        CATALOG_OBJ,
+        position,
+    )
@@ -0,0 +1,144 @@
+"""
+Delivery item catalog
+
+The delivery and inventory pages are opened by every counter operator all
+day long, while the items themselves rarely change. ItemCatalog loads every
+item with one query (plus one aggregate for the units delivered), groups
+them by category and keeps the result per worker process.
+
+Each request first reads the live stock of every item, a narrow
+``SELECT id, estoque_atual`` that is the only query on a cache hit. Any
+stock change (an adjustment, a delivery, an import, in this or any other
+worker) shows up as a difference from the stock the catalog was built with
+and triggers a reload, so the stock numbers served are always current. Item
+changes that leave the stock alone call invalidate(); CATALOG_TTL bounds
+how long other workers may keep serving such a change stale.
+
+The cached rows are plain dicts shared between requests; callers must not
+modify them.
+"""
+
+import os
+import threading
+import time
+
+from sqlalchemy import select
+
+CATALOG_TTL = float(os.environ.get("CATALOG_TTL", "60"))
+
+# Shown on the delivery page even when they have no items yet, in this order
+DELIVERY_CATEGORIES = ("Festa", "Cesta Básica", "Brinquedos", "Material Escolar")
+
+
+def live_stock():
+    """Current stock per item id, from a single narrow query"""
+    from app import db
+    from models import DeliveryItem
+
+    return dict(
+        db.session.execute(select(DeliveryItem.id, DeliveryItem.estoque_atual)).all()
+    )
+
+
+def load_catalog():
+    """Every item as a dict, ordered by category and name"""
+    from app import db
+    from inventory import delivered_quantities
+    from models import DeliveryItem
+
+    columns = (
+        DeliveryItem.id,
+        DeliveryItem.nome,
+        DeliveryItem.categoria,
+        DeliveryItem.descricao,
+        DeliveryItem.estoque_inicial,
+        DeliveryItem.estoque_atual,
+        DeliveryItem.preco_unitario,
+    )
+    rows = db.session.execute(
+        select(*columns).order_by(
+            DeliveryItem.categoria, DeliveryItem.nome, DeliveryItem.id
+        )
+    ).all()
+    delivered = delivered_quantities()
+
+    items = []
+    for row in rows:
+        item = row._asdict()
+        item["items_delivered"] = delivered.get(row.id, 0)
+        items.append(item)
+    return items
+
+
+class ItemCatalog:
+    """Per-process cache of the item catalog, checked against live stock"""
+
+    def __init__(self, ttl=CATALOG_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = None
+        self._by_category = None
+        self._stock = None
+        self._loaded_at = 0.0
+        self._hits = 0
+        self._misses = 0
+
+    def items(self):
+        """Every item, ordered by category and name"""
+        return self._current()[0]
+
+    def by_category(self, categories=DELIVERY_CATEGORIES):
+        """Items grouped by category
+
+        ``categories`` come first, in that order and even when empty,
+        followed by any other category found in the inventory.
+        """
+        grouped = self._current()[1]
+        result = {category: grouped.get(category, []) for category in categories}
+        for category, items in grouped.items():
+            result.setdefault(category, items)
+        return result
+
+    def invalidate(self):
+        """Drop the cached catalog; the next request reloads it"""
+        with self._lock:
+            self._items = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "items": len(self._items) if self._items is not None else 0,
+            }
+
+    def _current(self):
+        stock = live_stock()
+        with self._lock:
+            if self._fresh(stock):
+                self._hits += 1
+                return self._items, self._by_category
+
+            self._misses += 1
+            items = load_catalog()
+            by_category = {}
+            for item in items:
+                by_category.setdefault(item["categoria"], []).append(item)
+
+            self._items = items
+            self._by_category = by_category
+            # The stock the rows were loaded with, which may be newer than
+            # the read above
+            self._stock = {item["id"]: item["estoque_atual"] for item in items}
+            self._loaded_at = time.monotonic()
+            return items, by_category
+
+    def _fresh(self, stock):
+        return (
+            self._items is not None
+            and self._stock == stock
+            and time.monotonic() - self._loaded_at < self.ttl
+        )
+
+
+item_catalog = ItemCatalog()
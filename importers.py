@@ -0,0 +1,701 @@
+"""
+Bulk import of participant rosters and inventory items (CSV/XLSX), and
+batch registration of participants from JSON
+
+Files are streamed and processed in chunks: every chunk is normalized,
+validated, matched against existing participants with a single lookup and
+written with executemany statements before being committed. The sync mode
+compares per-matricula content hashes with the previous export and only
+writes the difference.
+"""
+
+import csv
+import hashlib
+import io
+import math
+import re
+import unicodedata
+from itertools import islice
+
+from sqlalchemy import delete, insert, or_, select, update
+
+CHUNK_SIZE = 1000
+
+# Limits for /api/participants/bulk, mirroring the registration form
+MAX_REGISTRATION_BATCH = 5000
+MAX_DEPENDENTS = 5
+MAX_DEPENDENT_AGE = 120
+
+# Normalized header -> Participant column
+PARTICIPANT_COLUMNS = {
+    "nome": "nome",
+    "name": "nome",
+    "email": "email",
+    "e-mail": "email",
+    "telefone": "telefone",
+    "phone": "telefone",
+    "departamento": "departamento",
+    "department": "departamento",
+    "matricula": "matricula",
+    "registration": "matricula",
+}
+
+# Columns of /api/download_excel_template
+INVENTORY_COLUMNS = {
+    "nome": "nome",
+    "categoria": "categoria",
+    "descricao": "descricao",
+    "estoque_inicial": "estoque_inicial",
+    "estoque_atual": "estoque_atual",
+    "preco_unitario": "preco_unitario",
+}
+
+# Fields that make up a roster row's content hash
+ROSTER_FIELDS = ("nome", "email", "telefone", "departamento", "matricula")
+
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def _normalize_header(header):
+    """Lowercase a header and strip accents ("Matrícula" -> "matricula")"""
+    header = unicodedata.normalize("NFKD", str(header or "").strip().lower())
+    return "".join(c for c in header if not unicodedata.combining(c))
+
+
+def _clean(value):
+    """Convert a raw cell value to a stripped string (None for blanks)"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # Excel stores numeric matriculas/phones as floats
+        value = int(value)
+    value = str(value).strip()
+    return value or None
+
+
+def _iter_csv(stream):
+    text_stream = io.TextIOWrapper(
+        stream, encoding="utf-8-sig", errors="replace", newline=""
+    )
+    try:
+        sample = text_stream.read(4096)
+        text_stream.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(text_stream, dialect)
+    finally:
+        # Leave the upload stream open for werkzeug to clean up
+        text_stream.detach()
+
+
+def _iter_xlsx(stream):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_table_rows(file_storage, column_map, required):
+    """Stream (row_number, raw_row) pairs from an uploaded CSV or XLSX file
+
+    Headers are mapped to field names through ``column_map``. Row numbers
+    match the spreadsheet (header is row 1). Raises ValueError for
+    unsupported formats or files without the ``required`` columns.
+    """
+    filename = (file_storage.filename or "").lower()
+    if filename.endswith(".csv"):
+        rows = _iter_csv(file_storage.stream)
+    elif filename.endswith(".xlsx"):
+        rows = _iter_xlsx(file_storage.stream)
+    else:
+        raise ValueError("Formato de arquivo não suportado (use CSV ou XLSX)")
+
+    rows = iter(rows)
+    header = next(rows, None)
+    if not header:
+        raise ValueError("Arquivo vazio")
+
+    columns = [column_map.get(_normalize_header(h)) for h in header]
+    missing = set(required) - set(columns)
+    if missing:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(sorted(missing))}")
+
+    for row_number, values in enumerate(rows, start=2):
+        raw = {}
+        for field, value in zip(columns, values):
+            if field and field not in raw:
+                raw[field] = _clean(value)
+        if any(raw.values()):
+            yield row_number, raw
+
+
+def iter_roster_rows(file_storage):
+    """Stream participant roster rows from an uploaded CSV or XLSX file"""
+    return iter_table_rows(
+        file_storage, PARTICIPANT_COLUMNS, ("nome", "email", "matricula")
+    )
+
+
+def normalize_participant_row(raw):
+    """Normalize and validate one roster row, returning (row, errors)"""
+    row = {
+        "nome": raw.get("nome"),
+        "email": (raw.get("email") or "").lower() or None,
+        "telefone": raw.get("telefone"),
+        "departamento": raw.get("departamento"),
+        "matricula": raw.get("matricula"),
+    }
+
+    errors = []
+    if not row["nome"]:
+        errors.append("Nome é obrigatório")
+    elif len(row["nome"]) > 100:
+        errors.append("Nome excede 100 caracteres")
+    if not row["email"]:
+        errors.append("Email é obrigatório")
+    elif not EMAIL_PATTERN.match(row["email"]) or len(row["email"]) > 120:
+        errors.append("Email inválido")
+    if not row["matricula"]:
+        errors.append("Matrícula é obrigatória")
+    elif len(row["matricula"]) > 50:
+        errors.append("Matrícula excede 50 caracteres")
+    if row["telefone"] and len(row["telefone"]) > 20:
+        errors.append("Telefone excede 20 caracteres")
+    if row["departamento"] and len(row["departamento"]) > 50:
+        errors.append("Departamento excede 50 caracteres")
+
+    return row, errors
+
+
+def chunked(iterable, size):
+    """Yield lists of at most ``size`` items without materializing the input"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def roster_hash(row):
+    """Content hash of the roster fields of a normalized row"""
+    content = "\x1f".join(row.get(field) or "" for field in ROSTER_FIELDS)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _validated_rows(rows, report, rejected_matriculas=None):
+    """Yield valid (row_number, row) pairs, recording errors in ``report``"""
+    seen_matriculas = set()
+    seen_emails = set()
+
+    for row_number, raw in rows:
+        report["processed"] += 1
+        row, errors = normalize_participant_row(raw)
+        if not errors:
+            if row["matricula"] in seen_matriculas:
+                errors.append("Matrícula duplicada no arquivo")
+            elif row["email"] in seen_emails:
+                errors.append("Email duplicado no arquivo")
+        if errors:
+            report["errors"].append({"row": row_number, "errors": errors})
+            if rejected_matriculas is not None and row["matricula"]:
+                rejected_matriculas.add(row["matricula"])
+            continue
+        seen_matriculas.add(row["matricula"])
+        seen_emails.add(row["email"])
+        yield row_number, row
+
+
+def _upsert_chunk(rows):
+    """Upsert one chunk of validated (row_number, row) pairs
+
+    Returns (created, updated) counts. The caller owns the transaction.
+    """
+    from app import db
+    from models import Participant
+    from utils import generate_unique_qr_codes
+
+    matriculas = [row["matricula"] for _, row in rows]
+    emails = [row["email"] for _, row in rows]
+
+    # One lookup per chunk to match existing participants
+    existing = db.session.execute(
+        select(Participant.id, Participant.matricula, Participant.email).where(
+            or_(
+                Participant.matricula.in_(matriculas),
+                Participant.email.in_(emails),
+            )
+        )
+    ).all()
+    by_matricula = {p.matricula: p.id for p in existing if p.matricula}
+    by_email = {p.email: p.id for p in existing}
+
+    inserts = []
+    updates = []
+    for _, row in rows:
+        participant_id = by_matricula.get(row["matricula"]) or by_email.get(
+            row["email"]
+        )
+        if participant_id:
+            updates.append({"id": participant_id, **row})
+        else:
+            inserts.append(dict(row))
+
+    for row, qr_code in zip(inserts, generate_unique_qr_codes(len(inserts))):
+        row["qr_code"] = qr_code
+
+    if inserts:
+        db.session.execute(insert(Participant), inserts)
+    if updates:
+        db.session.execute(update(Participant), updates)
+
+    return len(inserts), len(updates)
+
+
+def _record_chunk_failure(report, rows, error):
+    for row_number, _ in rows:
+        report["errors"].append(
+            {"row": row_number, "errors": [f"Erro ao gravar lote: {error}"]}
+        )
+
+
+def import_participants(rows, chunk_size=CHUNK_SIZE):
+    """Import (row_number, raw_row) pairs into Participant in chunks
+
+    Existing participants are matched by matricula, then by email, and
+    updated in place; new ones get a fresh QR code. Returns a report with
+    created/updated counts and a per-row error list.
+    """
+    from app import db
+
+    report = {"processed": 0, "created": 0, "updated": 0, "errors": []}
+
+    for chunk in chunked(_validated_rows(rows, report), chunk_size):
+        try:
+            created, updated = _upsert_chunk(chunk)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            _record_chunk_failure(report, chunk, e)
+            continue
+        report["created"] += created
+        report["updated"] += updated
+
+    return report
+
+
+def import_participant_file(file_storage, chunk_size=CHUNK_SIZE):
+    """Stream an uploaded roster file into Participant"""
+    return import_participants(iter_roster_rows(file_storage), chunk_size=chunk_size)
+
+
+def sync_participants(rows, dry_run=False, chunk_size=CHUNK_SIZE):
+    """Apply only the differences between a roster file and the last sync
+
+    Incoming rows are hashed and compared with the stored RosterEntry
+    hashes: matriculas only in the file are added, those whose hash changed
+    are updated and those missing from the file are removed from the
+    delivery roster (their matricula is cleared, history is kept). Rows
+    rejected by validation are never treated as removals. With ``dry_run``
+    only the diff counts are computed.
+    """
+    from app import db
+    from models import Participant, RosterEntry
+
+    report = {
+        "processed": 0,
+        "added": 0,
+        "changed": 0,
+        "removed": 0,
+        "unchanged": 0,
+        "errors": [],
+        "dry_run": dry_run,
+    }
+    rejected = set()
+
+    incoming = {
+        row["matricula"]: (row_number, row, roster_hash(row))
+        for row_number, row in _validated_rows(rows, report, rejected)
+    }
+    if not incoming:
+        raise ValueError("Nenhuma linha válida no arquivo")
+
+    stored = dict(
+        db.session.execute(
+            select(RosterEntry.matricula, RosterEntry.content_hash)
+        ).all()
+    )
+
+    added = incoming.keys() - stored.keys()
+    removed = stored.keys() - incoming.keys() - rejected
+    changed = {
+        matricula
+        for matricula in incoming.keys() & stored.keys()
+        if incoming[matricula][2] != stored[matricula]
+    }
+
+    report["added"] = len(added)
+    report["changed"] = len(changed)
+    report["removed"] = len(removed)
+    report["unchanged"] = len(incoming) - len(added) - len(changed)
+
+    if dry_run:
+        return report
+
+    for matriculas in chunked(sorted(added | changed), chunk_size):
+        chunk = [incoming[matricula][:2] for matricula in matriculas]
+        try:
+            _upsert_chunk(chunk)
+            participant_ids = dict(
+                db.session.execute(
+                    select(Participant.matricula, Participant.id).where(
+                        Participant.matricula.in_(matriculas)
+                    )
+                ).all()
+            )
+            db.session.execute(
+                delete(RosterEntry).where(RosterEntry.matricula.in_(matriculas))
+            )
+            db.session.execute(
+                insert(RosterEntry),
+                [
+                    {
+                        "matricula": matricula,
+                        "participant_id": participant_ids[matricula],
+                        "content_hash": incoming[matricula][2],
+                    }
+                    for matricula in matriculas
+                ],
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            _record_chunk_failure(report, chunk, e)
+
+    for matriculas in chunked(sorted(removed), chunk_size):
+        db.session.execute(
+            update(Participant)
+            .where(Participant.matricula.in_(matriculas))
+            .values(matricula=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            delete(RosterEntry).where(RosterEntry.matricula.in_(matriculas))
+        )
+        db.session.commit()
+
+    return report
+
+
+def sync_participant_file(file_storage, dry_run=False, chunk_size=CHUNK_SIZE):
+    """Sync the delivery roster with an uploaded HR export"""
+    return sync_participants(
+        iter_roster_rows(file_storage), dry_run=dry_run, chunk_size=chunk_size
+    )
+
+
+def _parse_number(value):
+    """Parse a cell as a finite float, accepting decimal commas ("19,90")"""
+    if isinstance(value, str):
+        value = value.replace(",", ".")
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(value)
+    return number
+
+
+def _parse_quantity(value, label, errors):
+    if value is None:
+        return None
+    try:
+        number = _parse_number(value)
+    except (TypeError, ValueError, OverflowError):
+        number = None
+    if number is None or not number.is_integer():
+        errors.append(f"{label} deve ser um número inteiro")
+        return None
+    quantity = int(number)
+    if quantity < 0:
+        errors.append(f"{label} não pode ser negativo")
+        return None
+    return quantity
+
+
+def normalize_inventory_row(raw):
+    """Normalize and validate one inventory template row, returning (row, errors)"""
+    errors = []
+    row = {
+        "nome": raw.get("nome"),
+        "categoria": raw.get("categoria"),
+        "descricao": raw.get("descricao") or "",
+        "estoque_inicial": _parse_quantity(
+            raw.get("estoque_inicial"), "Estoque inicial", errors
+        ),
+        "estoque_atual": _parse_quantity(
+            raw.get("estoque_atual"), "Estoque atual", errors
+        ),
+        "preco_unitario": 0.0,
+    }
+
+    if not row["nome"]:
+        errors.append("Nome é obrigatório")
+    elif len(row["nome"]) > 100:
+        errors.append("Nome excede 100 caracteres")
+    if not row["categoria"]:
+        errors.append("Categoria é obrigatória")
+    elif len(row["categoria"]) > 50:
+        errors.append("Categoria excede 50 caracteres")
+
+    if raw.get("preco_unitario"):
+        try:
+            row["preco_unitario"] = _parse_number(raw["preco_unitario"])
+        except (TypeError, ValueError, OverflowError):
+            errors.append("Preço unitário inválido")
+
+    if row["estoque_inicial"] is None:
+        row["estoque_inicial"] = row["estoque_atual"] or 0
+    if row["estoque_atual"] is None:
+        row["estoque_atual"] = row["estoque_inicial"]
+
+    return row, errors
+
+
+def import_inventory(rows, update_stock=False):
+    """Upsert (row_number, raw_row) pairs into DeliveryItem by (nome, categoria)
+
+    Existing items are loaded with one query and all valid rows are written
+    with executemany statements in a single transaction. The current stock
+    of existing items is only overwritten with ``update_stock``, since that
+    undoes every delivery made since the file was exported. Returns a
+    report with created/updated counts and a per-row error list.
+    """
+    from app import db
+    from catalog import item_catalog
+    from inventory import record_movements
+    from models import DeliveryItem
+
+    report = {"processed": 0, "created": 0, "updated": 0, "errors": []}
+    valid = {}
+
+    for row_number, raw in rows:
+        report["processed"] += 1
+        row, errors = normalize_inventory_row(raw)
+        key = (row["nome"], row["categoria"])
+        if not errors and key in valid:
+            errors.append("Item duplicado no arquivo")
+        if errors:
+            report["errors"].append({"row": row_number, "errors": errors})
+            continue
+        valid[key] = row
+
+    if not valid:
+        return report
+
+    existing = {
+        (item.nome, item.categoria): item.id
+        for item in db.session.execute(
+            select(DeliveryItem.id, DeliveryItem.nome, DeliveryItem.categoria).where(
+                DeliveryItem.nome.in_({nome for nome, _ in valid})
+            )
+        )
+    }
+
+    inserts = []
+    updates = []
+    stock = {}
+    for key, row in valid.items():
+        if key in existing:
+            item_id = existing[key]
+            updates.append(
+                {
+                    "id": item_id,
+                    **{k: v for k, v in row.items() if k != "estoque_atual"},
+                }
+            )
+            if update_stock:
+                stock[item_id] = row["estoque_atual"]
+        else:
+            inserts.append(row)
+
+    try:
+        movements = []
+        if inserts:
+            ids = db.session.scalars(
+                insert(DeliveryItem).returning(
+                    DeliveryItem.id, sort_by_parameter_order=True
+                ),
+                inserts,
+            ).all()
+            movements.extend(
+                {
+                    "item_id": item_id,
+                    "kind": "initial",
+                    "quantidade": row["estoque_atual"],
+                    "estoque_atual": row["estoque_atual"],
+                }
+                for item_id, row in zip(ids, inserts)
+            )
+        if updates:
+            db.session.execute(update(DeliveryItem), updates)
+        if stock:
+            # The UPDATE above already locked these rows (the whole database
+            # on SQLite), so no delivery can change the stock read here
+            # before the commit and the ledger records the exact change
+            previous = dict(
+                db.session.execute(
+                    select(DeliveryItem.id, DeliveryItem.estoque_atual)
+                    .where(DeliveryItem.id.in_(list(stock)))
+                    .with_for_update()
+                ).all()
+            )
+            db.session.execute(
+                update(DeliveryItem),
+                [
+                    {"id": item_id, "estoque_atual": quantity}
+                    for item_id, quantity in stock.items()
+                ],
+            )
+            movements.extend(
+                {
+                    "item_id": item_id,
+                    "kind": "import",
+                    "quantidade": quantity - (previous[item_id] or 0),
+                    "estoque_atual": quantity,
+                }
+                for item_id, quantity in stock.items()
+            )
+        record_movements(movements)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    item_catalog.invalidate()
+
+    report["created"] = len(inserts)
+    report["updated"] = len(updates)
+    return report
+
+
+def import_inventory_file(file_storage, update_stock=False):
+    """Import an uploaded inventory template (CSV/XLSX) into DeliveryItem"""
+    return import_inventory(
+        iter_table_rows(file_storage, INVENTORY_COLUMNS, ("nome", "categoria")),
+        update_stock=update_stock,
+    )
+
+
+def normalize_registration(entry):
+    """Normalize one bulk registration entry
+
+    Returns (participant, dependents, errors).
+    """
+    if not isinstance(entry, dict):
+        return None, [], ["Registro deve ser um objeto"]
+
+    raw = {
+        field: _clean(entry.get(field))
+        for field in ("nome", "email", "telefone", "departamento", "matricula")
+    }
+    participant, errors = normalize_participant_row(raw)
+    # Matricula is only mandatory for the delivery roster
+    errors = [e for e in errors if e != "Matrícula é obrigatória"]
+
+    dependents = []
+    raw_dependents = entry.get("dependents") or []
+    if not isinstance(raw_dependents, list):
+        errors.append("Dependentes devem ser uma lista")
+        raw_dependents = []
+    elif len(raw_dependents) > MAX_DEPENDENTS:
+        errors.append(f"Máximo de {MAX_DEPENDENTS} dependentes")
+
+    for position, dependent in enumerate(raw_dependents[:MAX_DEPENDENTS], start=1):
+        nome = _clean(dependent.get("nome")) if isinstance(dependent, dict) else None
+        if not nome:
+            errors.append(f"Dependente {position}: nome é obrigatório")
+            continue
+        if len(nome) > 100:
+            errors.append(f"Dependente {position}: nome excede 100 caracteres")
+            continue
+        try:
+            idade = int(dependent.get("idade") or 0)
+        except (TypeError, ValueError, OverflowError):
+            idade = None
+        if idade is None or not 0 <= idade <= MAX_DEPENDENT_AGE:
+            errors.append(f"Dependente {position}: idade inválida")
+            continue
+        dependents.append({"nome": nome, "idade": idade})
+
+    return participant, dependents, errors
+
+
+def register_participants_bulk(entries):
+    """Register a batch of participants with nested dependents
+
+    The batch is all-or-nothing: if any entry is invalid, or repeats the
+    email of an earlier entry, nothing is written and the per-entry errors
+    are returned. Otherwise QR codes are reserved
+    for the whole batch at once, participants are inserted with one
+    executemany INSERT ... RETURNING and dependents with another.
+    """
+    from app import db
+    from models import Dependent, Participant
+    from utils import generate_unique_qr_codes
+
+    report = {"created": [], "errors": []}
+    normalized = []
+    emails = set()
+    for index, entry in enumerate(entries):
+        participant, dependents, errors = normalize_registration(entry)
+        email = participant["email"] if participant else None
+        if email in emails:
+            errors.append("Email duplicado no lote")
+        elif email:
+            emails.add(email)
+        if errors:
+            report["errors"].append({"index": index, "errors": errors})
+        else:
+            normalized.append((participant, dependents))
+
+    if report["errors"] or not normalized:
+        return report
+
+    rows = [participant for participant, _ in normalized]
+    for row, qr_code in zip(rows, generate_unique_qr_codes(len(rows))):
+        row["qr_code"] = qr_code
+
+    try:
+        created = db.session.execute(
+            insert(Participant).returning(
+                Participant.id, Participant.qr_code, sort_by_parameter_order=True
+            ),
+            rows,
+        ).all()
+
+        dependent_rows = [
+            {**dependent, "participant_id": participant.id}
+            for participant, (_, dependents) in zip(created, normalized)
+            for dependent in dependents
+        ]
+        if dependent_rows:
+            db.session.execute(insert(Dependent), dependent_rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    report["created"] = [
+        {
+            "index": index,
+            "id": participant.id,
+            "qr_code": participant.qr_code,
+            "email": row["email"],
+            "dependents_count": len(dependents),
+        }
+        for index, (participant, row, (_, dependents)) in enumerate(
+            zip(created, rows, normalized)
+        )
+    ]
+    return report
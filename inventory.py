@@ -0,0 +1,653 @@
+"""
+Inventory stock changes
+
+Every change is a single UPDATE computed by the database
+(``estoque_atual = estoque_atual - :n``), so concurrent delivery counters
+never overwrite each other's decrements. Removals are conditional on
+enough stock being left and raise OutOfStock instead of clamping at zero.
+The new stock is read back with RETURNING where the database supports it.
+
+deliver_items() records a QR-scanned delivery on top of these: entitlement
+and earlier deliveries are checked with plain column queries, stock is
+taken atomically and the DeliveryLog rows are inserted in one statement.
+
+Every change is also appended to the StockMovement ledger in the same
+transaction, with its signed quantity and the resulting stock. Periodic
+StockSnapshot rows hold each item's ledger balance up to a movement, so the
+stock at any point in time is the nearest snapshot plus the movements after
+it (stock_at), and reconcile_stock() checks estoque_atual against the
+ledger with a single aggregate query per category.
+
+None of these functions commit.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    and_,
+    case,
+    exists,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    update,
+)
+
+# Movements younger than this are left out of new snapshots, so that
+# transactions still in flight cannot commit a movement below the cut
+SNAPSHOT_SETTLE = float(os.environ.get("STOCK_SNAPSHOT_SETTLE", "60"))
+
+# set_stock() gives up after this many changes made by others in between
+SET_STOCK_ATTEMPTS = 5
+
+
+class OutOfStock(Exception):
+    """Not enough stock left for a removal"""
+
+    def __init__(self, item_id, requested, available):
+        super().__init__(f"Item {item_id}: {requested} requested, {available} in stock")
+        self.item_id = item_id
+        self.requested = requested
+        self.available = available
+
+
+class StockConflict(Exception):
+    """The stock kept changing while it was being overwritten"""
+
+    def __init__(self, item_id, attempts):
+        super().__init__(f"Item {item_id}: stock changed during {attempts} attempts")
+        self.item_id = item_id
+        self.attempts = attempts
+
+
+class DeliveryRefused(Exception):
+    """A scanned delivery that must not be recorded"""
+
+    def __init__(self, message, **details):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+
+def _apply(item_id, value, *criteria):
+    """Run a stock UPDATE; returns the new stock or None if no row matched"""
+    from app import db
+    from models import DeliveryItem
+
+    statement = (
+        update(DeliveryItem)
+        .where(DeliveryItem.id == item_id, *criteria)
+        .values(estoque_atual=value)
+        .execution_options(synchronize_session=False)
+    )
+    if db.engine.dialect.update_returning:
+        return db.session.scalar(statement.returning(DeliveryItem.estoque_atual))
+
+    # Still atomic: the UPDATE holds the row until the transaction ends
+    if db.session.execute(statement).rowcount == 0:
+        return None
+    return current_stock(item_id)
+
+
+def _check_quantity(quantity):
+    if quantity < 0:
+        raise ValueError("Quantidade não pode ser negativa")
+
+
+def current_stock(item_id):
+    """Stock of an item, or None if it does not exist"""
+    from app import db
+    from models import DeliveryItem
+
+    return db.session.scalar(
+        select(DeliveryItem.estoque_atual).where(DeliveryItem.id == item_id)
+    )
+
+
+def record_movements(movements):
+    """Append dicts of StockMovement columns to the ledger in one statement
+
+    Changes of zero units are not recorded.
+    """
+    from app import db
+    from models import StockMovement
+
+    movements = [movement for movement in movements if movement["quantidade"]]
+    if movements:
+        db.session.execute(insert(StockMovement), movements)
+
+
+def _record(item_id, kind, change, stock, operator=None, participant_id=None):
+    record_movements(
+        [
+            {
+                "item_id": item_id,
+                "kind": kind,
+                "quantidade": change,
+                "estoque_atual": stock,
+                "operator": operator,
+                "participant_id": participant_id,
+            }
+        ]
+    )
+
+
+def add_stock(item_id, quantity, kind="add", operator=None, participant_id=None):
+    """Add ``quantity`` units; returns the new stock (None for unknown items)"""
+    from models import DeliveryItem
+
+    _check_quantity(quantity)
+    stock = _apply(item_id, DeliveryItem.estoque_atual + quantity)
+    if stock is not None:
+        _record(item_id, kind, quantity, stock, operator, participant_id)
+    return stock
+
+
+def remove_stock(
+    item_id, quantity, kind="subtract", operator=None, participant_id=None
+):
+    """Take ``quantity`` units if that many are left
+
+    Returns the remaining stock, or None for unknown items. Raises
+    OutOfStock when fewer than ``quantity`` units are left.
+    """
+    from models import DeliveryItem
+
+    _check_quantity(quantity)
+    remaining = _apply(
+        item_id,
+        DeliveryItem.estoque_atual - quantity,
+        DeliveryItem.estoque_atual >= quantity,
+    )
+    if remaining is None:
+        available = current_stock(item_id)
+        if available is not None:
+            raise OutOfStock(item_id, quantity, available)
+        return None
+    _record(item_id, kind, -quantity, remaining, operator, participant_id)
+    return remaining
+
+
+def set_stock(item_id, quantity, operator=None, attempts=SET_STOCK_ATTEMPTS):
+    """Overwrite the stock; returns it (None for unknown items)
+
+    The ledger needs the change, so the UPDATE only applies to the stock
+    read just before it and is retried if another change came in between.
+    Raises StockConflict after ``attempts`` such retries.
+    """
+    from models import DeliveryItem
+
+    _check_quantity(quantity)
+    for _ in range(attempts):
+        previous = current_stock(item_id)
+        if previous is None:
+            return None
+        stock = _apply(item_id, quantity, DeliveryItem.estoque_atual == previous)
+        if stock is not None:
+            _record(item_id, "set", stock - previous, stock, operator)
+            return stock
+    raise StockConflict(item_id, attempts)
+
+
+def delivered_quantities(item_ids=None):
+    """Units delivered per item id, from one GROUP BY query
+
+    Covers every item with deliveries when ``item_ids`` is None.
+    """
+    from app import db
+    from models import DeliveryLog
+
+    query = (
+        select(DeliveryLog.item_id, func.sum(DeliveryLog.quantidade))
+        .where(DeliveryLog.status == "delivered")
+        .group_by(DeliveryLog.item_id)
+    )
+    if item_ids is not None:
+        query = query.where(DeliveryLog.item_id.in_(item_ids))
+    return {item_id: int(total or 0) for item_id, total in db.session.execute(query)}
+
+
+def lookup_delivery_participant(qr_code):
+    """Roster fields of the participant with ``qr_code``, or None
+
+    A single query, dependents counted in SQL rather than lazy loaded.
+    """
+    from app import db
+    from models import Dependent, Participant
+
+    return db.session.execute(
+        select(
+            Participant.id,
+            Participant.nome,
+            Participant.email,
+            Participant.departamento,
+            Participant.matricula,
+            select(func.count(Dependent.id))
+            .where(Dependent.participant_id == Participant.id)
+            .scalar_subquery()
+            .label("dependents_count"),
+        ).where(Participant.qr_code == qr_code)
+    ).first()
+
+
+def deliver_items(
+    qr_code, item_ids, quantity=1, operator=None, notes=None, check_only=False
+):
+    """Deliver ``quantity`` of each item to the participant with ``qr_code``
+
+    Only participants on the delivery list (those with a matricula) are
+    entitled, and each item is delivered to them once. Raises
+    DeliveryRefused or OutOfStock, in which case the caller must roll back.
+    With ``check_only`` nothing is written. Returns the participant and,
+    per item, the remaining stock.
+    """
+    from app import db
+    from models import DeliveryItem, DeliveryLog
+
+    item_ids = list(dict.fromkeys(item_ids))
+    if quantity < 1:
+        raise ValueError("Quantidade deve ser maior que zero")
+
+    participant = lookup_delivery_participant(qr_code)
+    if participant is None:
+        raise DeliveryRefused("QR Code inválido")
+    if not participant.matricula:
+        raise DeliveryRefused(
+            "Participante não está na lista de entregas", not_entitled=True
+        )
+
+    items = dict(
+        db.session.execute(
+            select(DeliveryItem.id, DeliveryItem.nome).where(
+                DeliveryItem.id.in_(item_ids)
+            )
+        ).all()
+    )
+    missing = [item_id for item_id in item_ids if item_id not in items]
+    if missing:
+        raise DeliveryRefused("Item não encontrado", item_ids=missing)
+
+    delivered = db.session.scalars(
+        select(DeliveryLog.item_id).where(
+            DeliveryLog.participant_id == participant.id,
+            DeliveryLog.item_id.in_(item_ids),
+            DeliveryLog.status == "delivered",
+        )
+    ).all()
+    if delivered:
+        raise DeliveryRefused(
+            "Item já entregue: " + ", ".join(items[item_id] for item_id in delivered),
+            already_delivered=True,
+            item_ids=delivered,
+        )
+
+    result = {
+        "participant": {
+            "nome": participant.nome,
+            "email": participant.email,
+            "departamento": participant.departamento,
+            "matricula": participant.matricula,
+            "dependents_count": participant.dependents_count,
+        },
+        "items": [],
+    }
+    if check_only:
+        result["items"] = [
+            {"item_id": item_id, "nome": items[item_id]} for item_id in item_ids
+        ]
+        return result
+
+    for item_id in item_ids:
+        result["items"].append(
+            {
+                "item_id": item_id,
+                "nome": items[item_id],
+                "quantidade": quantity,
+                "estoque_atual": remove_stock(
+                    item_id,
+                    quantity,
+                    kind="delivery",
+                    operator=operator,
+                    participant_id=participant.id,
+                ),
+            }
+        )
+
+    db.session.execute(
+        insert(DeliveryLog),
+        [
+            {
+                "participant_id": participant.id,
+                "item_id": item_id,
+                "matricula": participant.matricula,
+                "quantidade": quantity,
+                "status": "delivered",
+                "operator": operator,
+                "notes": notes,
+            }
+            for item_id in item_ids
+        ],
+    )
+    return result
+
+
+def cancel_delivery(qr_code, item_id, operator=None):
+    """Cancel the delivery of an item and put its units back in stock
+
+    Raises DeliveryRefused when the participant has no delivery of the
+    item to cancel. Returns the item's new stock.
+    """
+    from app import db
+    from models import DeliveryLog, Participant
+
+    participant_id = select(Participant.id).where(Participant.qr_code == qr_code)
+    delivered = (
+        DeliveryLog.participant_id == participant_id.scalar_subquery(),
+        DeliveryLog.item_id == item_id,
+        DeliveryLog.status == "delivered",
+    )
+    delivery = db.session.execute(
+        select(DeliveryLog.participant_id, DeliveryLog.quantidade).where(*delivered)
+    ).first()
+    # Conditional, so two operators cannot both cancel the same delivery
+    if (
+        delivery is None
+        or db.session.execute(
+            update(DeliveryLog)
+            .where(*delivered)
+            .values(status="cancelled")
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        == 0
+    ):
+        raise DeliveryRefused("Entrega não encontrada")
+
+    return add_stock(
+        item_id,
+        delivery.quantidade or 0,
+        kind="cancel",
+        operator=operator,
+        participant_id=delivery.participant_id,
+    )
+
+
+def delivery_roster_page(page=1, per_page=50, search=None):
+    """One page of the delivery list with its statistics
+
+    A single statement joins the employees on the delivery list (those
+    with a matricula) to a per-participant delivery summary; window
+    functions compute the list statistics and number the rows matching
+    ``search`` before the page is cut out. Only a page with no rows needs
+    a second query for the statistics.
+
+    Returns (rows, stats, matching) where ``matching`` is the number of
+    rows matching ``search``.
+    """
+    from app import db
+    from models import DeliveryItem, DeliveryLog, Participant
+
+    summary = (
+        select(
+            DeliveryLog.participant_id,
+            func.max(case((DeliveryLog.status == "delivered", 1), else_=0)).label(
+                "delivered"
+            ),
+            func.aggregate_strings(DeliveryItem.nome, ", ").label("item_names"),
+        )
+        .join(DeliveryItem, DeliveryItem.id == DeliveryLog.item_id)
+        .group_by(DeliveryLog.participant_id)
+        .subquery()
+    )
+
+    delivered = func.coalesce(summary.c.delivered, 0)
+    matches = literal(True)
+    if search:
+        matches = or_(
+            Participant.nome.icontains(search, autoescape=True),
+            Participant.matricula.icontains(search, autoescape=True),
+        )
+    is_match = case((matches, 1), else_=0)
+
+    roster = (
+        select(
+            Participant.id,
+            Participant.nome,
+            Participant.matricula,
+            Participant.email,
+            Participant.qr_code,
+            delivered.label("delivered"),
+            summary.c.item_names,
+            is_match.label("is_match"),
+            func.row_number()
+            .over(partition_by=is_match, order_by=(Participant.nome, Participant.id))
+            .label("position"),
+            func.count().over().label("total_employees"),
+            func.sum(case((Participant.qr_code != "", 1), else_=0))
+            .over()
+            .label("qr_generated"),
+            func.sum(delivered).over().label("delivered_count"),
+            func.sum(is_match).over().label("matching"),
+        )
+        .outerjoin(summary, summary.c.participant_id == Participant.id)
+        .where(Participant.matricula.isnot(None))
+        .subquery()
+    )
+
+    offset = (page - 1) * per_page
+    rows = db.session.execute(
+        select(roster)
+        .where(
+            roster.c.is_match == 1,
+            roster.c.position > offset,
+            roster.c.position <= offset + per_page,
+        )
+        .order_by(roster.c.position)
+    ).all()
+
+    totals = rows[0] if rows else db.session.execute(select(roster).limit(1)).first()
+    total_employees = totals.total_employees if totals else 0
+    delivered_count = int(totals.delivered_count or 0) if totals else 0
+    stats = {
+        "total_employees": total_employees,
+        "qr_generated": int(totals.qr_generated or 0) if totals else 0,
+        "pending_delivery": total_employees - delivered_count,
+        "delivered": delivered_count,
+    }
+    matching = int(totals.matching or 0) if totals else 0
+    return rows, stats, matching
+
+
+def _ledger(movement_criteria=(), snapshot_criteria=()):
+    """Latest snapshot of each item and the movements after it
+
+    Returns two subqueries keyed by item_id: ``snapshot`` (movement_id,
+    estoque_atual) and ``tail`` (summed quantidade and last id of the
+    later movements). The criteria restrict the rows considered.
+    """
+    from models import StockMovement, StockSnapshot
+
+    latest = (
+        select(
+            StockSnapshot.item_id,
+            func.max(StockSnapshot.movement_id).label("movement_id"),
+        )
+        .where(*snapshot_criteria)
+        .group_by(StockSnapshot.item_id)
+        .subquery()
+    )
+    snapshot = (
+        select(
+            StockSnapshot.item_id,
+            StockSnapshot.movement_id,
+            StockSnapshot.estoque_atual,
+        )
+        .join(
+            latest,
+            and_(
+                latest.c.item_id == StockSnapshot.item_id,
+                latest.c.movement_id == StockSnapshot.movement_id,
+            ),
+        )
+        .subquery()
+    )
+    tail = (
+        select(
+            StockMovement.item_id,
+            func.sum(StockMovement.quantidade).label("quantidade"),
+            func.max(StockMovement.id).label("movement_id"),
+        )
+        .outerjoin(snapshot, snapshot.c.item_id == StockMovement.item_id)
+        .where(
+            StockMovement.id > func.coalesce(snapshot.c.movement_id, 0),
+            *movement_criteria,
+        )
+        .group_by(StockMovement.item_id)
+        .subquery()
+    )
+    return snapshot, tail
+
+
+def _balance(snapshot, tail):
+    return func.coalesce(snapshot.c.estoque_atual, 0) + func.coalesce(
+        tail.c.quantidade, 0
+    )
+
+
+def stock_at(item_id, at=None):
+    """Stock of an item according to the ledger, as of ``at`` (default: now)
+
+    Returns None for unknown items.
+    """
+    from app import db
+    from models import DeliveryItem, StockMovement, StockSnapshot
+
+    movement_criteria = [StockMovement.item_id == item_id]
+    snapshot_criteria = [StockSnapshot.item_id == item_id]
+    if at is not None:
+        movement_criteria.append(StockMovement.created_at <= at)
+        snapshot_criteria.append(StockSnapshot.created_at <= at)
+    snapshot, tail = _ledger(movement_criteria, snapshot_criteria)
+
+    return db.session.scalar(
+        select(_balance(snapshot, tail))
+        .select_from(DeliveryItem)
+        .outerjoin(snapshot, snapshot.c.item_id == DeliveryItem.id)
+        .outerjoin(tail, tail.c.item_id == DeliveryItem.id)
+        .where(DeliveryItem.id == item_id)
+    )
+
+
+def take_snapshots(settle=SNAPSHOT_SETTLE):
+    """Snapshot the ledger balance of every item with new movements
+
+    Movements from the last ``settle`` seconds are left for the next
+    snapshot. Returns the number of snapshots written.
+    """
+    from app import db
+    from models import StockMovement, StockSnapshot
+
+    now = datetime.utcnow()
+    cut = db.session.scalar(
+        select(func.max(StockMovement.id)).where(
+            StockMovement.created_at <= now - timedelta(seconds=settle)
+        )
+    )
+    if cut is None:
+        return 0
+
+    snapshot, tail = _ledger([StockMovement.id <= cut])
+    return db.session.execute(
+        insert(StockSnapshot).from_select(
+            ["item_id", "movement_id", "estoque_atual", "created_at"],
+            select(
+                tail.c.item_id,
+                tail.c.movement_id,
+                _balance(snapshot, tail),
+                literal(now),
+            ).outerjoin(snapshot, snapshot.c.item_id == tail.c.item_id),
+        )
+    ).rowcount
+
+
+def record_baseline(operator=None):
+    """Start the ledger of items that have none with their current stock
+
+    For items created before the ledger existed. Returns the number of
+    items recorded.
+    """
+    from app import db
+    from models import DeliveryItem, StockMovement, StockSnapshot
+
+    return db.session.execute(
+        insert(StockMovement).from_select(
+            [
+                "item_id",
+                "kind",
+                "quantidade",
+                "estoque_atual",
+                "operator",
+                "created_at",
+            ],
+            select(
+                DeliveryItem.id,
+                literal("initial"),
+                DeliveryItem.estoque_atual,
+                DeliveryItem.estoque_atual,
+                literal(operator),
+                literal(datetime.utcnow()),
+            ).where(
+                DeliveryItem.estoque_atual != 0,
+                ~exists().where(StockMovement.item_id == DeliveryItem.id),
+                ~exists().where(StockSnapshot.item_id == DeliveryItem.id),
+            ),
+        )
+    ).rowcount
+
+
+def reconcile_stock(category=None):
+    """Compare estoque_atual with the ledger, one aggregate row per category
+
+    A single GROUP BY statement; each row has the category's item count,
+    stock and ledger totals, and the number and names of the items whose
+    stock does not match the ledger.
+    """
+    from app import db
+    from models import DeliveryItem
+
+    snapshot, tail = _ledger()
+    ledger = _balance(snapshot, tail)
+    mismatch = func.coalesce(DeliveryItem.estoque_atual, 0) != ledger
+
+    query = (
+        select(
+            DeliveryItem.categoria,
+            func.count(DeliveryItem.id).label("items"),
+            func.coalesce(func.sum(DeliveryItem.estoque_atual), 0).label(
+                "estoque_atual"
+            ),
+            func.sum(ledger).label("ledger"),
+            func.sum(case((mismatch, 1), else_=0)).label("mismatched"),
+            func.aggregate_strings(case((mismatch, DeliveryItem.nome)), ", ").label(
+                "mismatched_items"
+            ),
+        )
+        .outerjoin(snapshot, snapshot.c.item_id == DeliveryItem.id)
+        .outerjoin(tail, tail.c.item_id == DeliveryItem.id)
+        .group_by(DeliveryItem.categoria)
+        .order_by(DeliveryItem.categoria)
+    )
+    if category is not None:
+        query = query.where(DeliveryItem.categoria == category)
+
+    return [
+        {
+            **row._asdict(),
+            "mismatched_items": (
+                row.mismatched_items.split(", ") if row.mismatched_items else []
+            ),
+        }
+        for row in db.session.execute(query)
+    ]
@@ -0,0 +1,374 @@
+"""
+Pooled SMTP sending
+
+Keeps a few authenticated SMTP connections open per process and sends many
+messages over each, instead of connecting, running STARTTLS and logging in
+for every email. Connections are recycled after SMTP_MAX_MESSAGES messages,
+replaced when they sit idle too long, and re-established transparently when
+the server drops them (421 or timeout).
+
+Campaigns go through dispatch(), which sends over several connections at
+once within the provider's per-second and per-day limits.
+"""
+
+import atexit
+import os
+import smtplib
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from email import policy
+from email.parser import BytesHeaderParser
+from email.utils import getaddresses
+
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", "2"))
+SMTP_MAX_MESSAGES = int(os.environ.get("SMTP_MAX_MESSAGES", "100"))
+SMTP_IDLE_TIMEOUT = 60
+SMTP_TIMEOUT = 30
+
+# First wait after a throttling reply, doubled on every retry
+THROTTLE_BACKOFF = 1.0
+
+# Errors after which the connection is gone and the message can be resent
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, TimeoutError, ConnectionError)
+
+
+def _should_reconnect(error):
+    if isinstance(error, RECONNECT_ERRORS):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code == 421
+
+
+def _connection_usable(error):
+    """Whether the session survived a failed send
+
+    smtplib resets the transaction after a refused sender, recipient or
+    message, so the connection can be reused.
+    """
+    if _should_reconnect(error):
+        return False
+    return isinstance(
+        error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException)
+    )
+
+
+class RawMessage:
+    """An already rendered RFC 5322 message, sent without re-serializing
+
+    Headers are parsed for the envelope and logging; ``msg["Subject"]``
+    works as for email.message objects.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._headers = BytesHeaderParser(policy=policy.SMTP).parsebytes(data)
+        self.sender = getaddresses([self._headers["From"]])[0][1]
+        self.recipients = [
+            address
+            for _, address in getaddresses(
+                self._headers.get_all("To", []) + self._headers.get_all("Cc", [])
+            )
+        ]
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "rb") as message_file:
+            return cls(message_file.read())
+
+    def __getitem__(self, name):
+        return self._headers[name]
+
+
+def _send(server, msg):
+    if isinstance(msg, RawMessage):
+        server.sendmail(msg.sender, msg.recipients, msg.data)
+    else:
+        server.send_message(msg)
+
+
+class _Connection:
+    def __init__(self, server):
+        self.server = server
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """Thread-safe pool of persistent, authenticated SMTP connections"""
+
+    def __init__(
+        self,
+        host,
+        port,
+        username=None,
+        password=None,
+        size=SMTP_POOL_SIZE,
+        max_messages=SMTP_MAX_MESSAGES,
+        idle_timeout=SMTP_IDLE_TIMEOUT,
+        timeout=SMTP_TIMEOUT,
+        starttls=True,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.starttls = starttls
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._stats = {"connections": 0, "messages": 0, "reconnects": 0}
+
+    def send_message(self, msg):
+        """Send ``msg`` on a pooled connection, reconnecting once if it dropped
+
+        ``msg`` is an email.message object or a RawMessage.
+        """
+        with self._slots:
+            connection = self._checkout()
+            try:
+                _send(connection.server, msg)
+            except Exception as e:
+                if not _should_reconnect(e):
+                    self._checkin(connection, healthy=_connection_usable(e))
+                    raise
+                self._close(connection)
+                self._count("reconnects")
+                connection = self._connect()
+                try:
+                    _send(connection.server, msg)
+                except Exception as retry_error:
+                    self._checkin(connection, healthy=_connection_usable(retry_error))
+                    raise
+
+            connection.sent += 1
+            self._count("messages")
+            self._checkin(connection)
+
+    def close(self):
+        """Quit every idle connection"""
+        with self._lock:
+            connections = list(self._idle)
+            self._idle.clear()
+        for connection in connections:
+            self._close(connection)
+
+    def stats(self):
+        """Connection and message counters for this pool"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+        return stats
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self._count("connections")
+        return _Connection(server)
+
+    def _checkout(self):
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is None:
+            return self._connect()
+        if time.monotonic() - connection.last_used > self.idle_timeout:
+            # Servers drop idle sessions; replace it rather than fail mid-send
+            self._close(connection)
+            return self._connect()
+        return connection
+
+    def _checkin(self, connection, healthy=True):
+        if not healthy or connection.sent >= self.max_messages:
+            self._close(connection)
+            return
+        connection.last_used = time.monotonic()
+        with self._lock:
+            self._idle.append(connection)
+
+    def _close(self, connection):
+        try:
+            connection.server.quit()
+        except Exception:
+            connection.server.close()
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def smtp_settings():
+    """SMTP configuration from the environment"""
+    return {
+        "host": os.environ.get("SMTP_SERVER", "smtp.gmail.com"),
+        "port": int(os.environ.get("SMTP_PORT", "587")),
+        "username": os.environ.get("SMTP_USERNAME"),
+        "password": os.environ.get("SMTP_PASSWORD"),
+        # Only local relays and test servers run without TLS
+        "starttls": os.environ.get("SMTP_STARTTLS", "1") != "0",
+    }
+
+
+def get_smtp_pool(size=SMTP_POOL_SIZE):
+    """Pool for the configured SMTP server, or None without credentials"""
+    settings = smtp_settings()
+    if not all([settings["username"], settings["password"]]):
+        return None
+
+    key = (*settings.values(), size)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SMTPPool(**settings, size=size)
+    return pool
+
+
+def close_smtp_pools():
+    """Quit the idle connections of every pool"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_smtp_pools)
+
+
+class DailyLimitReached(Exception):
+    """The provider's daily sending quota is used up"""
+
+
+def is_throttled(error):
+    """Whether a send failed with a temporary (4xx) reply worth retrying later"""
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    return False
+
+
+class TokenBucket:
+    """Limits sends per second and per day
+
+    Throttling replies halve the rate and each accepted message adds a
+    small step back, up to the configured rate (additive increase,
+    multiplicative decrease).
+    """
+
+    def __init__(self, rate, burst=None, daily_limit=None, sent_today=0):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.daily_limit = daily_limit
+        self.sent_today = sent_today
+        self._day = datetime.utcnow().date()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a message may be sent
+
+        Raises DailyLimitReached once the daily quota is used up.
+        """
+        while True:
+            with self._lock:
+                today = datetime.utcnow().date()
+                if today != self._day:
+                    self._day = today
+                    self.sent_today = 0
+                if self.daily_limit is not None and self.sent_today >= self.daily_limit:
+                    raise DailyLimitReached(
+                        f"Daily limit of {self.daily_limit} messages reached"
+                    )
+
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.sent_today += 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+    def throttled(self):
+        """Slow down after a throttling reply; the message did not count"""
+        with self._lock:
+            self.rate = max(self.max_rate / 64, self.rate / 2)
+            self.sent_today = max(0, self.sent_today - 1)
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def dispatch(items, send, bucket, concurrency=4, max_retries=3, backoff=None):
+    """Call ``send(item)`` for every item from ``concurrency`` threads
+
+    Yields (item, error) as sends finish, error being None on success.
+    Throttled sends are retried with exponential backoff. Once the daily
+    quota runs out, the in-flight items are yielded with DailyLimitReached
+    and the rest of ``items`` is left unconsumed.
+
+    ``items`` is consumed from the calling thread, so it may lazily load
+    from the database.
+    """
+    backoff = THROTTLE_BACKOFF if backoff is None else backoff
+
+    def deliver(item):
+        for attempt in range(max_retries + 1):
+            try:
+                bucket.acquire()
+            except DailyLimitReached as e:
+                return e
+            try:
+                send(item)
+            except Exception as e:
+                if not is_throttled(e) or attempt == max_retries:
+                    return e
+                bucket.throttled()
+                time.sleep(backoff * 2**attempt)
+            else:
+                bucket.succeeded()
+                return None
+
+    items = iter(items)
+    pending = {}
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            # Keep every thread busy without queueing the whole campaign
+            while not exhausted and len(pending) < concurrency * 2:
+                item = next(items, StopIteration)
+                if item is StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(deliver, item)] = item
+            if not pending:
+                return
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                error = future.result()
+                if isinstance(error, DailyLimitReached):
+                    exhausted = True
+                yield item, error
@@ -10,10 +10,10 @@ class Participant(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(120), nullable=False)
+    email = db.Column(db.String(120), nullable=False, index=True)
     telefone = db.Column(db.String(20))
     departamento = db.Column(db.String(50))
-    matricula = db.Column(db.String(50))  # Employee registration number
+    matricula = db.Column(db.String(50), index=True)  # Employee registration number
     qr_code = db.Column(db.String(50), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -28,6 +28,20 @@ class Participant(db.Model):
         return f"<Participant {self.nome}>"
 
 
+class RosterEntry(db.Model):
+    """Content hash of the last synced HR roster row, keyed by matricula"""
+
+    matricula = db.Column(db.String(50), primary_key=True)
+    participant_id = db.Column(
+        db.Integer, db.ForeignKey("participant.id"), nullable=False
+    )
+    content_hash = db.Column(db.String(64), nullable=False)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<RosterEntry {self.matricula}>"
+
+
 class Dependent(db.Model):
     """Model for participant dependents"""
 
@@ -77,9 +91,16 @@ class DeliveryItem(db.Model):
 
     @property
     def items_delivered(self):
-        return sum(
-            log.quantidade for log in self.delivery_logs if log.status == "delivered"
-        )
+        """Units delivered, summed in SQL
+
+        One query per item; pages listing items read ``items_delivered``
+        from catalog.item_catalog, which loads it for all of them at once.
+        """
+        if not self.id:
+            return 0
+        from inventory import delivered_quantities
+
+        return delivered_quantities([self.id]).get(self.id, 0)
 
     @property
     def items_remaining(self):
@@ -92,11 +113,25 @@ class DeliveryItem(db.Model):
 class DeliveryLog(db.Model):
     """Model for delivery tracking"""
 
+    # An item is delivered to a participant at most once
+    __table_args__ = (
+        db.Index(
+            "ux_delivery_log_delivered",
+            "participant_id",
+            "item_id",
+            unique=True,
+            sqlite_where=db.text("status = 'delivered'"),
+            postgresql_where=db.text("status = 'delivered'"),
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     participant_id = db.Column(
         db.Integer, db.ForeignKey("participant.id"), nullable=False
     )
-    item_id = db.Column(db.Integer, db.ForeignKey("delivery_item.id"), nullable=False)
+    item_id = db.Column(
+        db.Integer, db.ForeignKey("delivery_item.id"), nullable=False, index=True
+    )
     matricula = db.Column(db.String(50))  # Employee registration for delivery
     delivery_time = db.Column(db.DateTime, default=datetime.utcnow)
     quantidade = db.Column(db.Integer, default=1)
@@ -110,6 +145,47 @@ class DeliveryLog(db.Model):
         return f"<DeliveryLog {self.participant.nome} - {self.item.nome}>"
 
 
+class StockMovement(db.Model):
+    """Append-only ledger of stock changes, written by inventory.py"""
+
+    __table_args__ = (db.Index("ix_stock_movement_item", "item_id", "id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey("delivery_item.id"), nullable=False)
+    kind = db.Column(
+        db.String(20), nullable=False
+    )  # initial, add, subtract, set, delivery, cancel, import
+    quantidade = db.Column(db.Integer, nullable=False)  # Signed change
+    estoque_atual = db.Column(db.Integer, nullable=False)  # Stock after the change
+    participant_id = db.Column(db.Integer, db.ForeignKey("participant.id"))
+    operator = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<StockMovement {self.item_id} {self.kind} {self.quantidade:+d}>"
+
+
+class StockSnapshot(db.Model):
+    """Ledger stock of an item up to and including ``movement_id``"""
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "item_id", "movement_id", name="ux_stock_snapshot_item_movement"
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey("delivery_item.id"), nullable=False)
+    movement_id = db.Column(db.Integer, nullable=False)
+    estoque_atual = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return (
+            f"<StockSnapshot {self.item_id} @{self.movement_id}: {self.estoque_atual}>"
+        )
+
+
 class EmailLog(db.Model):
     """Model for email tracking"""
 
@@ -117,6 +193,7 @@ class EmailLog(db.Model):
     participant_id = db.Column(
         db.Integer, db.ForeignKey("participant.id"), nullable=False
     )
+    outbox_id = db.Column(db.Integer, db.ForeignKey("email_outbox.id"), index=True)
     email_type = db.Column(
         db.String(50), nullable=False
     )  # qr_delivery, reminder, confirmation
@@ -130,3 +207,47 @@ class EmailLog(db.Model):
 
     def __repr__(self):
         return f"<EmailLog {self.email_type} to {self.participant_email.email}>"
+
+
+class EmailCampaign(db.Model):
+    """Model for a batch of outbox emails queued together"""
+
+    id = db.Column(db.Integer, primary_key=True)
+    email_type = db.Column(db.String(50), nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    created_by = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<EmailCampaign {self.id} {self.email_type}>"
+
+
+class EmailOutbox(db.Model):
+    """Model for emails queued for the outbox worker"""
+
+    __table_args__ = (db.Index("ix_email_outbox_due", "status", "next_attempt_at"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    participant_id = db.Column(
+        db.Integer, db.ForeignKey("participant.id"), nullable=False, index=True
+    )
+    campaign_id = db.Column(db.Integer, db.ForeignKey("email_campaign.id"), index=True)
+    email_type = db.Column(
+        db.String(50), nullable=False
+    )  # qr_delivery, delivery_qr, reminder
+    payload_ref = db.Column(db.String(255))  # Builder-specific payload reference
+    status = db.Column(
+        db.String(20), nullable=False, default="pending"
+    )  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    lease_token = db.Column(db.String(36))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationship
+    participant = db.relationship("Participant")
+
+    def __repr__(self):
+        return f"<EmailOutbox {self.email_type} {self.status}>"
@@ -0,0 +1,387 @@
+"""
+Email outbox
+
+Emails are queued as EmailOutbox rows and sent by a worker, so a crash or
+restart never loses track of who was sent what. Workers claim due rows
+with a lease: on Postgres the candidates are locked with
+SELECT ... FOR UPDATE SKIP LOCKED, and the claiming UPDATE re-checks the
+row state so concurrent workers are also safe on SQLite. Rows whose lease
+expires (worker died mid-batch) become claimable again; a live worker
+renews the lease of its batch while sending, however slow the rate, so a
+batch is never reclaimed while it is still going out. Failed sends are
+retried with exponential backoff, and results are written back per batch
+with executemany statements, EmailLog rows included.
+"""
+
+import smtplib
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, exists, func, insert, or_, select, update
+from sqlalchemy.orm import selectinload
+
+from mailer import DailyLimitReached, dispatch, is_throttled
+
+CLAIM_BATCH_SIZE = 200
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 5
+
+# Delay before the first retry, doubled on every further attempt
+RETRY_BACKOFF = timedelta(minutes=1)
+
+ACTIVE_STATUSES = ("pending", "sending")
+
+
+def enqueue_emails(participant_ids, email_type, payload_ref=None, campaign_id=None):
+    """Queue one email per participant, skipping those already queued
+
+    Only active rows with the same ``payload_ref`` count as queued, so a
+    participant can have one reminder per day count pending at a time. QR
+    code emails are the exception: the spooler replaces their payload_ref
+    with the spool file name, so any active row of the type counts. Does
+    not commit. Returns the number of rows queued.
+    """
+    from app import db
+    from models import EmailOutbox
+    from spool import SPOOLED_TYPES
+
+    if email_type in SPOOLED_TYPES:
+        same_payload = True
+    elif payload_ref is None:
+        same_payload = EmailOutbox.payload_ref.is_(None)
+    else:
+        same_payload = EmailOutbox.payload_ref == payload_ref
+    participant_ids = list(dict.fromkeys(participant_ids))
+    queued = set()
+    for start in range(0, len(participant_ids), CLAIM_BATCH_SIZE):
+        chunk = participant_ids[start : start + CLAIM_BATCH_SIZE]
+        queued.update(
+            db.session.scalars(
+                select(EmailOutbox.participant_id).where(
+                    EmailOutbox.participant_id.in_(chunk),
+                    EmailOutbox.email_type == email_type,
+                    EmailOutbox.status.in_(ACTIVE_STATUSES),
+                    same_payload,
+                )
+            )
+        )
+
+    now = datetime.utcnow()
+    rows = [
+        {
+            "participant_id": participant_id,
+            "email_type": email_type,
+            "campaign_id": campaign_id,
+            "payload_ref": payload_ref,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+        for participant_id in participant_ids
+        if participant_id not in queued
+    ]
+    if rows:
+        db.session.execute(insert(EmailOutbox), rows)
+    return len(rows)
+
+
+def campaign_progress(campaign_id):
+    """Outbox row counts of a campaign per status, from one grouped query"""
+    from app import db
+    from models import EmailOutbox
+
+    counts = dict.fromkeys(ACTIVE_STATUSES + ("sent", "failed"), 0)
+    counts.update(
+        db.session.execute(
+            select(EmailOutbox.status, func.count())
+            .where(EmailOutbox.campaign_id == campaign_id)
+            .group_by(EmailOutbox.status)
+        ).all()
+    )
+    return counts
+
+
+def not_queued(email_type, payload_ref=None, statuses=ACTIVE_STATUSES):
+    """Criterion excluding participants with an outbox row of a type
+
+    Only rows in ``statuses`` count, and only those with ``payload_ref``
+    when one is given.
+    """
+    from models import EmailOutbox, Participant
+
+    criteria = [
+        EmailOutbox.participant_id == Participant.id,
+        EmailOutbox.email_type == email_type,
+        EmailOutbox.status.in_(statuses),
+    ]
+    if payload_ref is not None:
+        criteria.append(EmailOutbox.payload_ref == payload_ref)
+    return ~exists().where(*criteria)
+
+
+def _claimable(now):
+    from models import EmailOutbox
+
+    return or_(
+        and_(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == "sending", EmailOutbox.locked_until < now),
+    )
+
+
+def due_count():
+    """Number of rows a worker could claim right now"""
+    from app import db
+    from models import EmailOutbox
+
+    return db.session.scalar(
+        select(func.count())
+        .select_from(EmailOutbox)
+        .where(_claimable(datetime.utcnow()))
+    )
+
+
+def claim_batch(limit=CLAIM_BATCH_SIZE, lease_seconds=LEASE_SECONDS):
+    """Lease up to ``limit`` due rows to this worker and commit the claim"""
+    from app import db
+    from models import EmailOutbox
+
+    now = datetime.utcnow()
+    candidates = db.session.scalars(
+        select(EmailOutbox.id)
+        .where(_claimable(now))
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not candidates:
+        db.session.commit()
+        return []
+
+    token = str(uuid.uuid4())
+    # Re-checking claimability makes a concurrent claim of the same rows a
+    # no-op where FOR UPDATE is not available (SQLite)
+    db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(candidates), _claimable(now))
+        .values(
+            status="sending",
+            lease_token=token,
+            locked_until=now + timedelta(seconds=lease_seconds),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return db.session.scalars(
+        select(EmailOutbox)
+        .where(EmailOutbox.lease_token == token, EmailOutbox.status == "sending")
+        .order_by(EmailOutbox.id)
+    ).all()
+
+
+def renew_lease(token, lease_seconds=LEASE_SECONDS):
+    """Push back the expiry of the rows still leased with ``token``
+
+    Runs on its own connection and commits there, leaving the caller's
+    session and the rows it loaded untouched. Returns the rows renewed.
+    """
+    from app import db
+    from models import EmailOutbox
+
+    outbox = EmailOutbox.__table__
+    with db.engine.begin() as connection:
+        return connection.execute(
+            update(outbox)
+            .where(outbox.c.lease_token == token, outbox.c.status == "sending")
+            .values(locked_until=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        ).rowcount
+
+
+def _is_permanent(error):
+    """Rejections that retrying will not fix (5xx replies, bad addresses)"""
+    if isinstance(
+        error, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)
+    ):
+        return not is_throttled(error)
+    return isinstance(error, (KeyError, ValueError))
+
+
+def complete_batch(results, max_attempts=MAX_ATTEMPTS, leases=None):
+    """Record the outcome of a claimed batch and commit
+
+    ``results`` holds (row, subject, error) tuples and ``leases`` maps row
+    ids to the lease token they were claimed with (default: the rows'
+    current token). Rows whose lease expired and was taken over by another
+    worker are left to that worker. Returns counters.
+    """
+    from app import db
+    from models import EmailLog, EmailOutbox
+
+    if leases is None:
+        leases = {row.id: row.lease_token for row, _, _ in results}
+    # Checked again by the UPDATE, this keeps lost rows out of the counters
+    # and the EmailLog
+    held = {
+        outbox_id
+        for outbox_id, token in db.session.execute(
+            select(EmailOutbox.id, EmailOutbox.lease_token).where(
+                EmailOutbox.id.in_(list(leases))
+            )
+        )
+        if token is not None and token == leases[outbox_id]
+    }
+
+    now = datetime.utcnow()
+    updates = []
+    logs = []
+    counts = {"sent": 0, "retry": 0, "failed": 0, "deferred": 0}
+
+    for row, subject, error in results:
+        if row.id not in held:
+            continue
+        done = {
+            "b_id": row.id,
+            "b_lease_token": leases[row.id],
+            "b_attempts": row.attempts,
+            "b_last_error": row.last_error,
+            "b_next_attempt_at": row.next_attempt_at,
+        }
+        if isinstance(error, DailyLimitReached):
+            # Not attempted: hand the row back untouched
+            updates.append({**done, "b_status": "pending"})
+            counts["deferred"] += 1
+            continue
+
+        attempts = row.attempts + 1
+        if error is None:
+            updates.append({**done, "b_status": "sent", "b_attempts": attempts})
+            counts["sent"] += 1
+        elif attempts >= max_attempts or _is_permanent(error):
+            updates.append(
+                {
+                    **done,
+                    "b_status": "failed",
+                    "b_attempts": attempts,
+                    "b_last_error": str(error)[:255],
+                }
+            )
+            counts["failed"] += 1
+        else:
+            updates.append(
+                {
+                    **done,
+                    "b_status": "pending",
+                    "b_attempts": attempts,
+                    "b_last_error": str(error)[:255],
+                    "b_next_attempt_at": now + RETRY_BACKOFF * 2 ** (attempts - 1),
+                }
+            )
+            counts["retry"] += 1
+            continue
+
+        logs.append(
+            {
+                "participant_id": row.participant_id,
+                "outbox_id": row.id,
+                "email_type": row.email_type,
+                "subject": subject,
+                "sent_at": now,
+                "status": "sent" if error is None else "failed",
+            }
+        )
+
+    if updates:
+        outbox = EmailOutbox.__table__
+        db.session.execute(
+            update(outbox)
+            .where(
+                outbox.c.id == bindparam("b_id"),
+                outbox.c.lease_token == bindparam("b_lease_token"),
+            )
+            .values(
+                status=bindparam("b_status"),
+                attempts=bindparam("b_attempts"),
+                last_error=bindparam("b_last_error"),
+                next_attempt_at=bindparam("b_next_attempt_at"),
+                lease_token=None,
+                locked_until=None,
+            ),
+            updates,
+        )
+    if logs:
+        db.session.execute(insert(EmailLog), logs)
+    db.session.commit()
+    return counts
+
+
+def process_outbox(
+    builders,
+    pool,
+    bucket,
+    concurrency=4,
+    batch_size=CLAIM_BATCH_SIZE,
+    lease_seconds=LEASE_SECONDS,
+    max_attempts=MAX_ATTEMPTS,
+):
+    """Send due outbox rows until none are left or the daily quota runs out
+
+    ``builders`` maps an email type to ``build(participant, sender,
+    payload_ref)`` returning the message. Returns the summed counters.
+    """
+    from app import db
+    from models import Participant
+
+    totals = {"sent": 0, "retry": 0, "failed": 0, "deferred": 0}
+    while True:
+        rows = claim_batch(batch_size, lease_seconds)
+        if not rows:
+            return totals
+        leases = {row.id: row.lease_token for row in rows}
+        token = rows[0].lease_token
+
+        participants = {
+            participant.id: participant
+            for participant in db.session.scalars(
+                select(Participant)
+                .where(Participant.id.in_({row.participant_id for row in rows}))
+                .options(selectinload(Participant.dependents))
+            )
+        }
+
+        results = []
+        messages = []
+        for row in rows:
+            try:
+                msg = builders[row.email_type](
+                    participants[row.participant_id], pool.username, row.payload_ref
+                )
+            except Exception as e:
+                results.append((row, None, e))
+            else:
+                messages.append((row, msg))
+
+        renewed_at = time.monotonic()
+        for (row, msg), error in dispatch(
+            messages, lambda item: pool.send_message(item[1]), bucket, concurrency
+        ):
+            results.append((row, msg["Subject"], error))
+            # A slow or throttled batch outlives its lease; renew it well
+            # before it expires so no other worker re-sends these rows
+            if time.monotonic() - renewed_at >= lease_seconds / 3:
+                renew_lease(token, lease_seconds)
+                renewed_at = time.monotonic()
+
+        # Rows never handed to the dispatcher after the quota ran out
+        dispatched = {row.id for row, _, _ in results}
+        quota = DailyLimitReached()
+        results.extend(
+            (row, None, quota) for row, _ in messages if row.id not in dispatched
+        )
+
+        counts = complete_batch(results, max_attempts, leases)
+        for counter, value in counts.items():
+            totals[counter] += value
+        if counts["deferred"]:
+            return totals
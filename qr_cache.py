@@ -0,0 +1,246 @@
+"""
+Rendered QR code cache
+
+QR images are cached in two tiers keyed by (data, size, error correction,
+border, format): a bounded in-memory LRU per worker process, and a
+content-addressed directory shared by every worker. Rendering only happens
+on a miss in both. Error correction and quiet zone come from the QR profile
+selected with QR_PROFILE.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import qrcode
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy ships with pandas
+    np = None
+
+QR_CACHE_DIR = os.environ.get(
+    "QR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "qr_codes"),
+)
+QR_CACHE_SIZE = int(os.environ.get("QR_CACHE_SIZE", "2048"))
+
+# Bump when rendering changes so cached files and ETags are invalidated
+RENDERER_VERSION = 3
+
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+# Error correction level and quiet zone (in modules) of each preset
+QR_PROFILES = {
+    "compact": {"error_correction": "L", "border": 2},
+    "standard": {"error_correction": "L", "border": 4},
+    "balanced": {"error_correction": "M", "border": 4},
+    "robust": {"error_correction": "Q", "border": 4},
+}
+QR_PROFILE = os.environ.get("QR_PROFILE", "standard")
+
+
+def resolve_profile(profile=None, border=None):
+    """Return (error correction level, quiet zone) for a profile name
+
+    An explicit ``border`` overrides the profile's quiet zone.
+    """
+    name = profile or QR_PROFILE
+    if name not in QR_PROFILES:
+        raise ValueError(f"Unknown QR profile: {name}")
+    settings = QR_PROFILES[name]
+    return settings["error_correction"], (
+        settings["border"] if border is None else border
+    )
+
+
+def qr_matrix(data, border=None, profile=None):
+    """Encode ``data`` and return its module matrix (True = dark), quiet zone included
+
+    The smallest version that fits the profile's error correction level is
+    used. Participant codes are uppercase hex, so they are encoded in
+    alphanumeric mode (5.5 bits per character instead of 8).
+    """
+    level, border = resolve_profile(profile, border)
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=ERROR_CORRECTION[level],
+        box_size=1,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def rasterize_png(matrix, size=10):
+    """Scale a module matrix to a 1-bit PNG in a single PIL call"""
+    if np is not None:
+        # Light pixels are True in a mode "1" image
+        pixels = ~np.asarray(matrix, dtype=bool)
+        pixels = np.repeat(np.repeat(pixels, size, axis=0), size, axis=1)
+        img = Image.fromarray(pixels)
+    else:
+        count = len(matrix)
+        img = Image.new("1", (count, count))
+        img.putdata([0 if dark else 1 for row in matrix for dark in row])
+        img = img.resize((count * size, count * size), Image.NEAREST)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def render_svg(matrix, size=10):
+    """Render a module matrix as one SVG path of run-length merged rectangles"""
+    count = len(matrix)
+    segments = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < count:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < count and row[x]:
+                x += 1
+            segments.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+
+    pixels = count * size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" '
+        f'height="{pixels}" viewBox="0 0 {count} {count}" '
+        'shape-rendering="crispEdges">'
+        '<rect width="100%" height="100%" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(segments)}"/></svg>'
+    ).encode("utf-8")
+
+
+def render_qr(data, size=10, border=None, fmt="png", profile=None):
+    """Render a QR code image and return its bytes"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported QR format: {fmt}")
+
+    matrix = qr_matrix(data, border, profile)
+    if fmt == "svg":
+        return render_svg(matrix, size)
+    return rasterize_png(matrix, size)
+
+
+def cache_key(data, size=10, border=None, fmt="png", profile=None):
+    """Content address of a rendered QR image"""
+    level, border = resolve_profile(profile, border)
+    raw = f"{RENDERER_VERSION}\x1f{fmt}\x1f{size}\x1f{level}\x1f{border}\x1f{data}"
+    raw = raw.encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class QRCache:
+    """Two-tier (memory LRU + shared directory) cache of rendered QR images"""
+
+    def __init__(self, directory=QR_CACHE_DIR, max_entries=QR_CACHE_SIZE):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def path_for(self, key, fmt="png"):
+        """Location of a cached image in the shared directory"""
+        return os.path.join(self.directory, key[:2], f"{key}.{fmt}")
+
+    def get(self, data, size=10, border=None, fmt="png", profile=None):
+        """Return the image bytes, rendering and storing them on a miss"""
+        key = cache_key(data, size, border, fmt, profile)
+
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return image
+
+        image = self._read(key, fmt)
+        if image is not None:
+            self._count("disk_hits")
+        else:
+            self._count("misses")
+            image = render_qr(data, size, border, fmt, profile)
+            self.store(key, fmt, image)
+
+        self._remember(key, image)
+        return image
+
+    def store(self, key, fmt, image):
+        """Atomically write an image to the shared directory"""
+        if not self.directory:
+            return
+        path = self.path_for(key, fmt)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(image)
+            os.replace(tmp_path, path)
+        except OSError:
+            # The disk tier is an optimization; serve from memory if it fails
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def contains(self, data, size=10, border=None, fmt="png", profile=None):
+        """Whether the image is already in the shared directory"""
+        key = cache_key(data, size, border, fmt, profile)
+        return bool(self.directory) and os.path.exists(self.path_for(key, fmt))
+
+    def stats(self):
+        """Hit/miss counters for this process"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        )
+        return stats
+
+    def clear(self):
+        """Drop the in-memory tier and reset the counters"""
+        with self._lock:
+            self._memory.clear()
+            for counter in self._stats:
+                self._stats[counter] = 0
+
+    def _read(self, key, fmt):
+        if not self.directory:
+            return None
+        try:
+            with open(self.path_for(key, fmt), "rb") as cached:
+                return cached.read()
+        except OSError:
+            return None
+
+    def _remember(self, key, image):
+        with self._lock:
+            self._memory[key] = image
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+
+qr_cache = QRCache()
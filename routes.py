@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 
 import qrcode
 from flask import (
+    Response,
     flash,
     jsonify,
     make_response,
@@ -12,12 +13,14 @@ from flask import (
     render_template,
     request,
     session,
+    stream_with_context,
     url_for,
 )
+from sqlalchemy import insert
 
 from app import app, db
 from auth import check_admin_credentials, is_admin, login_required
-from utils import generate_qr_code, send_qr_email
+from utils import fetch_selected_participants
 
 
 @app.route("/")
@@ -110,52 +113,30 @@ def admin_logout():
 @app.route("/entregas")
 @login_required
 def entregas_list():
-    from models import Participant
-
-    """List of pre-selected employees for deliveries"""
-    # Get all participants with matricula (pre-selected for deliveries)
-    deliveries = Participant.query.filter(Participant.matricula.isnot(None)).all()
-
-    # Calculate statistics
-    stats = {
-        "total_employees": len(deliveries),
-        "qr_generated": sum(1 for d in deliveries if d.qr_code),
-        "pending_delivery": sum(
-            1
-            for d in deliveries
-            if not any(log.status == "delivered" for log in d.deliveries)
-        ),
-        "delivered": sum(
-            1
-            for d in deliveries
-            if any(log.status == "delivered" for log in d.deliveries)
-        ),
+    """List of pre-selected employees for deliveries, one page at a time"""
+    from inventory import delivery_roster_page
+
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", 50, type=int), 1), 200)
+    search = request.args.get("q", "").strip()
+
+    deliveries, stats, matching = delivery_roster_page(page, per_page, search)
+
+    pagination = {
+        "page": page,
+        "per_page": per_page,
+        "total": matching,
+        "pages": max((matching + per_page - 1) // per_page, 1),
+        "first": (page - 1) * per_page + 1 if deliveries else 0,
+        "last": (page - 1) * per_page + len(deliveries),
     }
-
-    # Format delivery data
-    delivery_data = []
-    for participant in deliveries:
-        # Get items for this participant
-        items = []
-        for log in participant.deliveries:
-            if log.item:
-                items.append(log.item.nome)
-
-        delivery_data.append(
-            {
-                "id": participant.id,
-                "nome": participant.nome,
-                "matricula": participant.matricula,
-                "email": participant.email,
-                "items": items,
-                "qr_code": participant.qr_code,
-                "delivered": any(
-                    log.status == "delivered" for log in participant.deliveries
-                ),
-            }
-        )
-
-    return render_template("entregas_list.html", deliveries=delivery_data, stats=stats)
+    return render_template(
+        "entregas_list.html",
+        deliveries=deliveries,
+        stats=stats,
+        pagination=pagination,
+        search=search,
+    )
 
 
 @app.route("/index")
@@ -187,11 +168,6 @@ def lookup_participant_by_email():
         if not participant:
             return jsonify({"success": False, "message": "Participante não encontrado"})
 
-        # Generate QR code image
-        from utils import generate_qr_code
-
-        qr_image = generate_qr_code(participant.qr_code)
-
         return jsonify(
             {
                 "success": True,
@@ -201,7 +177,7 @@ def lookup_participant_by_email():
                     "qr_code": participant.qr_code,
                     "dependents_count": len(participant.dependents),
                 },
-                "qr_image": qr_image,
+                "qr_image": url_for("qr_image", code=participant.qr_code, fmt="png"),
             }
         )
 
@@ -261,6 +237,57 @@ def register():
     return render_template("register.html")
 
 
+@app.route("/api/participants/bulk", methods=["POST"])
+@login_required
+def register_bulk():
+    """Register a batch of participants (with dependents) from JSON"""
+    from importers import MAX_REGISTRATION_BATCH, register_participants_bulk
+
+    try:
+        data = request.get_json()
+        entries = data.get("participants") if isinstance(data, dict) else data
+
+        if not isinstance(entries, list) or not entries:
+            return jsonify(
+                {"success": False, "message": "Lista de participantes é obrigatória"}
+            )
+        if len(entries) > MAX_REGISTRATION_BATCH:
+            return jsonify(
+                {
+                    "success": False,
+                    "message": f"Máximo de {MAX_REGISTRATION_BATCH} "
+                    "participantes por lote",
+                }
+            )
+
+        report = register_participants_bulk(entries)
+
+        if report["errors"]:
+            return jsonify(
+                {
+                    "success": False,
+                    "message": f"{len(report['errors'])} registros inválidos, "
+                    "nenhuma inscrição realizada",
+                    "errors": report["errors"],
+                }
+            )
+
+        app.logger.info(f"Bulk registration: {len(report['created'])} participants")
+
+        return jsonify(
+            {
+                "success": True,
+                "message": f"{len(report['created'])} inscrições realizadas",
+                "participants": report["created"],
+            }
+        )
+
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Bulk registration error: {str(e)}")
+        return jsonify({"success": False, "message": "Erro interno do sistema"})
+
+
 @app.route("/success/<int:participant_id>")
 def success(participant_id):
     from models import Participant
@@ -268,12 +295,37 @@ def success(participant_id):
     """Registration success page with QR code"""
     participant = Participant.query.get_or_404(participant_id)
 
-    # Generate QR code image
-    qr_img = generate_qr_code(participant.qr_code)
+    qr_img = url_for("qr_image", code=participant.qr_code, fmt="png")
 
     return render_template("success.html", participant=participant, qr_image=qr_img)
 
 
+@app.route("/qr/<code>.png", defaults={"fmt": "png"})
+@app.route("/qr/<code>.svg", defaults={"fmt": "svg"})
+def qr_image(code, fmt):
+    """Serve a participant QR code image with immutable caching"""
+    from models import Participant
+    from qr_cache import FORMATS, cache_key, qr_cache
+
+    # The ETag only depends on the URL, so revalidation needs no lookup
+    etag = cache_key(code, fmt=fmt)
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        exists = (
+            db.session.query(Participant.id).filter_by(qr_code=code).first() is not None
+        )
+        if not exists:
+            return render_template("404.html"), 404
+
+        response = make_response(qr_cache.get(code, fmt=fmt))
+        response.headers["Content-Type"] = FORMATS[fmt]
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
 @app.route("/scanner")
 @login_required
 def scanner():
@@ -333,27 +385,21 @@ def dashboard():
 @app.route("/delivery")
 @login_required
 def delivery():
-    from models import DeliveryItem
+    from catalog import item_catalog
 
     """Delivery management interface"""
-    items_by_category = {}
-    categories = ["Festa", "Cesta Básica", "Brinquedos", "Material Escolar"]
-
-    for category in categories:
-        items = DeliveryItem.query.filter_by(categoria=category).all()
-        items_by_category[category] = items
-
-    return render_template("delivery.html", items_by_category=items_by_category)
+    return render_template(
+        "delivery.html", items_by_category=item_catalog.by_category()
+    )
 
 
 @app.route("/inventory")
 @login_required
 def inventory():
-    from models import DeliveryItem
+    from catalog import item_catalog
 
     """Inventory management"""
-    items = DeliveryItem.query.order_by(DeliveryItem.categoria, DeliveryItem.nome).all()
-    return render_template("inventory.html", items=items)
+    return render_template("inventory.html", items=item_catalog.items())
 
 
 # API Routes
@@ -671,7 +717,7 @@ def send_report():
 @app.route("/api/bulk_checkin", methods=["POST"])
 @login_required
 def bulk_checkin():
-    from models import CheckIn, Participant
+    from models import CheckIn
 
     """Perform bulk check-in for selected participants"""
     try:
@@ -689,33 +735,42 @@ def bulk_checkin():
         error_count = 0
         already_checked = 0
 
+        # One query for the whole selection instead of two per participant
+        selected = {
+            row["id"]: row for row in fetch_selected_participants(participant_ids)
+        }
+
+        new_checkins = []
+        seen = set()
         for participant_id in participant_ids:
             try:
-                participant = Participant.query.get(participant_id)
-                if not participant:
-                    error_count += 1
-                    continue
-
-                # Check if already checked in
-                existing_checkin = CheckIn.query.filter_by(
-                    participant_id=participant.id
-                ).first()
-                if existing_checkin:
-                    already_checked += 1
-                    continue
-
-                # Create check-in
-                checkin = CheckIn(
-                    participant_id=participant.id, station=station, operator=operator
-                )
-                db.session.add(checkin)
-                success_count += 1
+                participant_id = int(participant_id)
+            except (TypeError, ValueError):
+                error_count += 1
+                continue
 
-            except Exception as e:
-                app.logger.error(
-                    f"Bulk checkin error for participant {participant_id}: {str(e)}"
-                )
+            row = selected.get(participant_id)
+            if row is None:
                 error_count += 1
+                continue
+
+            # Check if already checked in (or repeated in the selection)
+            if row["checkin_time"] is not None or participant_id in seen:
+                already_checked += 1
+                continue
+
+            seen.add(participant_id)
+            new_checkins.append(
+                {
+                    "participant_id": participant_id,
+                    "station": station,
+                    "operator": operator,
+                }
+            )
+
+        if new_checkins:
+            db.session.execute(insert(CheckIn), new_checkins)
+        success_count = len(new_checkins)
 
         db.session.commit()
 
@@ -778,8 +833,6 @@ def participants_list():
 @app.route("/api/export_selected", methods=["POST"])
 @login_required
 def export_selected():
-    from models import CheckIn, Participant
-
     """Export selected participants to Excel"""
     try:
         from io import BytesIO
@@ -794,35 +847,29 @@ def export_selected():
                 {"success": False, "message": "Nenhum participante selecionado"}
             )
 
-        # Get selected participants with check-in data
-        participants = (
-            db.session.query(Participant)
-            .filter(Participant.id.in_(participant_ids))
-            .all()
-        )
+        # Get selected participants with check-in data in a single statement
+        participants = fetch_selected_participants(participant_ids)
 
         # Prepare data for Excel
         export_data = []
         for participant in participants:
-            checkin = CheckIn.query.filter_by(participant_id=participant.id).first()
+            checkin_time = participant["checkin_time"]
             export_data.append(
                 {
-                    "Nome": participant.nome,
-                    "Email": participant.email,
-                    "Telefone": participant.telefone or "",
-                    "Departamento": participant.departamento or "",
-                    "Matrícula": participant.matricula or "",
-                    "Status": "Check-in realizado" if checkin else "Aguardando",
+                    "Nome": participant["nome"],
+                    "Email": participant["email"],
+                    "Telefone": participant["telefone"] or "",
+                    "Departamento": participant["departamento"] or "",
+                    "Matrícula": participant["matricula"] or "",
+                    "Status": "Check-in realizado" if checkin_time else "Aguardando",
                     "Horário Check-in": (
-                        checkin.checkin_time.strftime("%d/%m/%Y %H:%M:%S")
-                        if checkin
+                        checkin_time.strftime("%d/%m/%Y %H:%M:%S")
+                        if checkin_time
                         else ""
                     ),
-                    "Estação": checkin.station if checkin else "",
-                    "Dependentes": (
-                        len(participant.dependents) if participant.dependents else 0
-                    ),
-                    "QR Code": participant.qr_code,
+                    "Estação": participant["station"] if checkin_time else "",
+                    "Dependentes": participant["dependents_count"],
+                    "QR Code": participant["qr_code"],
                 }
             )
 
@@ -866,6 +913,8 @@ def export_selected():
 
 @app.route("/api/add_item", methods=["POST"])
 def add_item():
+    from catalog import item_catalog
+    from inventory import record_movements
     from models import DeliveryItem
 
     """Add new inventory item"""
@@ -890,7 +939,20 @@ def add_item():
         )
 
         db.session.add(item)
+        db.session.flush()
+        record_movements(
+            [
+                {
+                    "item_id": item.id,
+                    "kind": "initial",
+                    "quantidade": item.estoque_atual,
+                    "estoque_atual": item.estoque_atual,
+                    "operator": session.get("admin_username"),
+                }
+            ]
+        )
         db.session.commit()
+        item_catalog.invalidate()
 
         app.logger.info(f"New item added: {item.nome} ({item.categoria})")
         return jsonify({"success": True, "message": "Item adicionado com sucesso!"})
@@ -929,37 +991,201 @@ def get_item(item_id):
 
 @app.route("/api/adjust_stock", methods=["POST"])
 def adjust_stock():
-    from models import DeliveryItem
+    """Adjust inventory stock
+
+    Subtractions never go below zero: when fewer units are left the stock
+    is unchanged and the response reports ``out_of_stock``.
+    """
+    from inventory import (
+        OutOfStock,
+        StockConflict,
+        add_stock,
+        remove_stock,
+        set_stock,
+    )
+
+    adjustments = {"add": add_stock, "subtract": remove_stock, "set": set_stock}
 
-    """Adjust inventory stock"""
     try:
         data = request.get_json()
         item_id = int(data["stock_item_id"])
         adjustment_type = data["adjustment_type"]
         adjustment_quantity = int(data["adjustment_quantity"])
 
-        item = DeliveryItem.query.get_or_404(item_id)
+        if adjustment_type not in adjustments:
+            return jsonify({"success": False, "message": "Tipo de ajuste inválido"})
 
-        if adjustment_type == "add":
-            item.estoque_atual += adjustment_quantity
-        elif adjustment_type == "subtract":
-            item.estoque_atual = max(0, item.estoque_atual - adjustment_quantity)
-        elif adjustment_type == "set":
-            item.estoque_atual = adjustment_quantity
+        estoque_atual = adjustments[adjustment_type](
+            item_id, adjustment_quantity, operator=session.get("admin_username")
+        )
+        if estoque_atual is None:
+            db.session.rollback()
+            return jsonify({"success": False, "message": "Item não encontrado"}), 404
 
         db.session.commit()
 
         app.logger.info(
-            f"Stock adjusted for {item.nome}: {adjustment_type} {adjustment_quantity}"
+            f"Stock adjusted for item {item_id}: "
+            f"{adjustment_type} {adjustment_quantity} -> {estoque_atual}"
+        )
+        return jsonify(
+            {
+                "success": True,
+                "message": "Estoque ajustado com sucesso!",
+                "estoque_atual": estoque_atual,
+            }
         )
-        return jsonify({"success": True, "message": "Estoque ajustado com sucesso!"})
 
+    except OutOfStock as e:
+        db.session.rollback()
+        return jsonify(
+            {
+                "success": False,
+                "out_of_stock": True,
+                "message": f"Estoque insuficiente: {e.available} disponível(is)",
+                "estoque_atual": e.available,
+            }
+        )
+    except StockConflict:
+        db.session.rollback()
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "message": "Estoque alterado por outra operação, tente novamente",
+                }
+            ),
+            409,
+        )
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e)})
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Stock adjustment error: {str(e)}")
         return jsonify({"success": False, "message": "Erro ao ajustar estoque"})
 
 
+@app.route("/api/deliver", methods=["POST"])
+@login_required
+def deliver():
+    """Record the delivery of one or more items to a scanned participant
+
+    Takes ``qr_code`` and ``item_ids`` (or ``item_id``), plus optional
+    ``quantity``, ``operator`` and ``notes``. Everything happens in one
+    transaction; ``check_only`` validates the scan without delivering.
+    """
+    from sqlalchemy.exc import IntegrityError
+
+    from inventory import DeliveryRefused, OutOfStock, deliver_items
+
+    try:
+        data = request.get_json()
+        qr_code = str(data.get("qr_code", "")).strip().upper()
+        item_ids = data.get("item_ids") or [data.get("item_id")]
+        item_ids = [int(item_id) for item_id in item_ids if item_id is not None]
+        check_only = bool(data.get("check_only"))
+
+        if not qr_code:
+            return jsonify({"success": False, "message": "QR Code é obrigatório"})
+        if not item_ids:
+            return jsonify({"success": False, "message": "Nenhum item informado"})
+
+        result = deliver_items(
+            qr_code,
+            item_ids,
+            quantity=int(data.get("quantity") or 1),
+            operator=data.get("operator") or "Sistema",
+            notes=data.get("notes") or None,
+            check_only=check_only,
+        )
+        if check_only:
+            db.session.rollback()
+            return jsonify({"success": True, **result})
+
+        db.session.commit()
+
+        app.logger.info(
+            f"Delivery: {result['participant']['nome']} ({qr_code}) "
+            f"items {item_ids}"
+        )
+        return jsonify(
+            {"success": True, "message": "Entrega registrada com sucesso!", **result}
+        )
+
+    except DeliveryRefused as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": e.message, **e.details})
+    except OutOfStock as e:
+        db.session.rollback()
+        return jsonify(
+            {
+                "success": False,
+                "out_of_stock": True,
+                "message": f"Estoque insuficiente: {e.available} disponível(is)",
+                "item_id": e.item_id,
+                "estoque_atual": e.available,
+            }
+        )
+    except IntegrityError:
+        # Another counter delivered the same item in the meantime
+        db.session.rollback()
+        return jsonify(
+            {
+                "success": False,
+                "already_delivered": True,
+                "message": "Item já entregue",
+            }
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": f"Dados inválidos: {str(e)}"})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Delivery error: {str(e)}")
+        return jsonify({"success": False, "message": "Erro ao registrar entrega"})
+
+
+@app.route("/api/cancel_delivery", methods=["POST"])
+@login_required
+def cancel_delivery():
+    """Cancel the delivery of ``item_id`` to ``qr_code``, returning its stock"""
+    from inventory import DeliveryRefused
+    from inventory import cancel_delivery as cancel_item_delivery
+
+    try:
+        data = request.get_json()
+        qr_code = str(data.get("qr_code", "")).strip().upper()
+        item_id = int(data["item_id"])
+
+        estoque_atual = cancel_item_delivery(
+            qr_code,
+            item_id,
+            operator=data.get("operator") or session.get("admin_username"),
+        )
+        db.session.commit()
+
+        app.logger.info(f"Delivery cancelled: {qr_code} item {item_id}")
+        return jsonify(
+            {
+                "success": True,
+                "message": "Entrega cancelada com sucesso!",
+                "estoque_atual": estoque_atual,
+            }
+        )
+
+    except DeliveryRefused as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": e.message, **e.details})
+    except (KeyError, TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": f"Dados inválidos: {str(e)}"})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Cancel delivery error: {str(e)}")
+        return jsonify({"success": False, "message": "Erro ao cancelar entrega"})
+
+
 @app.route("/api/download_excel_template")
 def download_excel_template():
     """Download Excel template for inventory import"""
@@ -1034,66 +1260,186 @@ def download_excel_template():
         return jsonify({"success": False, "message": "Erro ao gerar template"})
 
 
-@app.route("/api/send_delivery_qrcodes", methods=["POST"])
+@app.route("/api/import_inventory", methods=["POST"])
 @login_required
-def send_delivery_qrcodes():
-    from models import EmailLog, Participant
+def import_inventory():
+    """Import inventory items from the download_excel_template format
 
-    """Send QR codes to all employees selected for deliveries"""
-    try:
-        # Get all participants with matricula (pre-selected for deliveries)
-        employees = Participant.query.filter(Participant.matricula.isnot(None)).all()
+    The stock of items that already exist is kept unless the form sends
+    ``update_stock=1``.
+    """
+    from importers import import_inventory_file
 
-        sent_count = 0
-        failed_count = 0
+    try:
+        if "file" not in request.files:
+            return jsonify({"success": False, "message": "Nenhum arquivo enviado"})
 
-        for employee in employees:
-            # Generate QR code if not exists
-            if not employee.qr_code:
-                employee.qr_code = str(uuid.uuid4())[:8].upper()
-                db.session.add(employee)
+        file = request.files["file"]
+        if file.filename == "":
+            return jsonify({"success": False, "message": "Arquivo não selecionado"})
 
-            # Send email with QR code
-            try:
-                if send_qr_email(employee.email, employee.nome, employee.qr_code):
-                    sent_count += 1
-                    # Log email sent
-                    email_log = EmailLog(
-                        participant_id=employee.id,
-                        email_type="delivery_qr",
-                        subject="UNDOKAI 2025 - QR Code para Retirada",
-                        status="sent",
-                    )
-                    db.session.add(email_log)
-                else:
-                    failed_count += 1
-            except Exception as e:
-                failed_count += 1
-                app.logger.error(f"Failed to send QR to {employee.email}: {str(e)}")
+        report = import_inventory_file(
+            file, update_stock=request.form.get("update_stock") == "1"
+        )
 
-        db.session.commit()
+        app.logger.info(
+            f"Inventory imported: {report['created']} created, "
+            f"{report['updated']} updated, {len(report['errors'])} rejected"
+        )
 
         return jsonify(
             {
                 "success": True,
-                "message": f"QR codes enviados: {sent_count} sucesso, {failed_count} falhas",
-                "sent": sent_count,
-                "failed": failed_count,
+                "message": f"{report['created']} itens criados, "
+                f"{report['updated']} atualizados",
+                "imported_count": report["created"] + report["updated"],
+                "created": report["created"],
+                "updated": report["updated"],
+                "errors": report["errors"],
             }
         )
 
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Import inventory error: {str(e)}")
+        return jsonify({"success": False, "message": "Erro ao importar estoque"})
+
+
+@app.route("/api/send_delivery_qrcodes", methods=["POST"])
+@login_required
+def send_delivery_qrcodes():
+    """Queue QR codes for all employees selected for deliveries
+
+    Emails are sent by the email worker (``scripts/send_qr_emails.py
+    --type worker``); the returned job ID can be polled for progress.
+    """
+    from sqlalchemy import or_, select, update
+
+    from models import EmailCampaign, Participant
+    from outbox import enqueue_emails
+    from utils import generate_unique_qr_codes
+
+    try:
+        # Employees with a matricula are pre-selected for deliveries
+        selected = Participant.matricula.isnot(None)
+
+        # Generate missing QR codes in one executemany UPDATE
+        missing = db.session.scalars(
+            select(Participant.id).where(
+                selected, or_(Participant.qr_code.is_(None), Participant.qr_code == "")
+            )
+        ).all()
+        if missing:
+            db.session.execute(
+                update(Participant),
+                [
+                    {"id": participant_id, "qr_code": qr_code}
+                    for participant_id, qr_code in zip(
+                        missing, generate_unique_qr_codes(len(missing))
+                    )
+                ],
+            )
+
+        campaign = EmailCampaign(
+            email_type="delivery_qr", created_by=session.get("admin_username")
+        )
+        db.session.add(campaign)
+        db.session.flush()
+        campaign.total = enqueue_emails(
+            db.session.scalars(
+                select(Participant.id).where(selected).order_by(Participant.id)
+            ).all(),
+            "delivery_qr",
+            campaign_id=campaign.id,
+        )
+        db.session.commit()
+
+        app.logger.info(
+            f"Delivery QR campaign {campaign.id}: {campaign.total} emails queued"
+        )
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "message": f"{campaign.total} QR codes na fila de envio",
+                    "job_id": campaign.id,
+                    "queued": campaign.total,
+                    "generated": len(missing),
+                    "progress_url": url_for(
+                        "delivery_qrcodes_progress", job_id=campaign.id
+                    ),
+                }
+            ),
+            202,
+        )
+
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Send delivery QR codes error: {str(e)}")
         return jsonify({"success": False, "message": "Erro ao enviar QR codes"})
 
 
+@app.route("/api/send_delivery_qrcodes/<int:job_id>")
+@login_required
+def delivery_qrcodes_progress(job_id):
+    """Per-state email counts of a delivery QR campaign
+
+    ``state`` is "queued" while no email has been picked up by the email
+    worker yet, "sending" while some are left and "done" afterwards.
+    """
+    from models import EmailCampaign
+    from outbox import campaign_progress
+
+    campaign = db.session.get(EmailCampaign, job_id)
+    if campaign is None:
+        return jsonify({"success": False, "message": "Envio não encontrado"}), 404
+
+    counts = campaign_progress(job_id)
+    done = counts["pending"] + counts["sending"] == 0
+    if done:
+        state = "done"
+    elif counts["sending"] + counts["sent"] + counts["failed"] == 0:
+        state = "queued"
+    else:
+        state = "sending"
+    return jsonify(
+        {
+            "success": True,
+            "job_id": job_id,
+            "total": campaign.total,
+            "counts": counts,
+            "state": state,
+            "done": done,
+        }
+    )
+
+
+@app.route("/email/open/<token>.gif")
+def email_open_pixel(token):
+    """Open-tracking pixel; opens are buffered and written in batches"""
+    from tracking import PIXEL_GIF, open_tracker, read_open_token
+
+    outbox_id = read_open_token(token)
+    if outbox_id is not None:
+        open_tracker.record(outbox_id)
+
+    response = Response(PIXEL_GIF, mimetype="image/gif")
+    response.headers["Cache-Control"] = "no-store, max-age=0"
+    return response
+
+
 @app.route("/api/import_delivery_list", methods=["POST"])
 @login_required
 def import_delivery_list():
-    from models import Participant
+    """Import delivery list from Excel/CSV
+
+    With ``mode=sync`` only the differences from the previous HR export are
+    applied; ``dry_run=1`` returns the diff counts without writing.
+    """
+    from importers import import_participant_file, sync_participant_file
 
-    """Import delivery list from Excel/CSV"""
     try:
         if "file" not in request.files:
             return jsonify({"success": False, "message": "Nenhum arquivo enviado"})
@@ -1102,32 +1448,90 @@ def import_delivery_list():
         if file.filename == "":
             return jsonify({"success": False, "message": "Arquivo não selecionado"})
 
-        # Process the file (simplified for now)
-        # In production, use pandas to read Excel/CSV
-        imported_count = 0
+        if request.form.get("mode") == "sync":
+            dry_run = request.form.get("dry_run") in ("1", "true")
+            report = sync_participant_file(file, dry_run=dry_run)
 
-        # Example: Process CSV data
-        # df = pd.read_csv(file)
-        # for _, row in df.iterrows():
-        #     participant = Participant(...)
-        #     db.session.add(participant)
-        #     imported_count += 1
+            if not dry_run:
+                app.logger.info(
+                    f"Delivery list synced: {report['added']} added, "
+                    f"{report['changed']} changed, {report['removed']} removed"
+                )
 
-        db.session.commit()
+            return jsonify(
+                {
+                    "success": True,
+                    "message": (
+                        "Prévia da sincronização"
+                        if dry_run
+                        else "Sincronização concluída"
+                    )
+                    + f": {report['added']} novos, {report['changed']} alterados, "
+                    f"{report['removed']} removidos, "
+                    f"{report['unchanged']} sem alteração",
+                    **report,
+                }
+            )
+
+        report = import_participant_file(file)
+        imported_count = report["created"] + report["updated"]
+
+        app.logger.info(
+            f"Delivery list imported: {report['created']} created, "
+            f"{report['updated']} updated, {len(report['errors'])} rejected"
+        )
 
         return jsonify(
             {
                 "success": True,
-                "message": f"{imported_count} registros importados com sucesso",
+                "message": f"{imported_count} registros importados com sucesso"
+                + (
+                    f", {len(report['errors'])} linhas com erro"
+                    if report["errors"]
+                    else ""
+                ),
+                "created": report["created"],
+                "updated": report["updated"],
+                "errors": report["errors"],
             }
         )
 
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e)})
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Import delivery list error: {str(e)}")
         return jsonify({"success": False, "message": "Erro ao importar lista"})
 
 
+@app.route("/api/qr_cache/stats")
+@login_required
+def qr_cache_stats():
+    """Hit/miss metrics of the rendered QR cache for this worker"""
+    from qr_cache import qr_cache
+
+    return jsonify({"success": True, "stats": qr_cache.stats()})
+
+
+@app.route("/admin/badges.pdf")
+@login_required
+def badge_sheet():
+    """Stream printable badge sheets, optionally for a single department"""
+    from badges import iter_badges, stream_badge_pdf
+
+    department = request.args.get("department") or None
+    columns = min(max(request.args.get("columns", 3, type=int), 1), 6)
+    rows = min(max(request.args.get("rows", 4, type=int), 1), 8)
+
+    pdf = stream_badge_pdf(iter_badges(department), columns=columns, rows=rows)
+    response = Response(stream_with_context(pdf), mimetype="application/pdf")
+    response.headers["Content-Disposition"] = (
+        f'attachment; filename=crachas_{datetime.now().strftime("%Y%m%d_%H%M")}.pdf'
+    )
+    return response
+
+
 @app.route("/health")
 def health():
     """Health check endpoint"""
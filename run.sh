@@ -112,7 +112,8 @@ print_status "Diretórios criados"
 
 # Initialize database
 print_header "🗄️ Inicializando banco de dados..."
-python -c "from app import app, db; app.app_context().push(); db.create_all(); print('Database tables created')" 2>/dev/null
+# Creates missing tables and adds columns/indexes of newer versions
+python scripts/setup_database.py --upgrade
 if [ $? -eq 0 ]; then
     print_status "Banco de dados inicializado"
 else
@@ -200,5 +201,19 @@ print_status "Servidor iniciando em http://localhost:5000"
 print_info "Pressione Ctrl+C para parar o servidor"
 echo ""
 
+# Start the email worker: emails queued by the app (QR codes for the
+# delivery list, reminders) are only sent while it runs
+if [ -f ".env" ]; then
+    export $(grep -E '^SMTP_[A-Z_]+=' .env | xargs)
+fi
+if [ -n "$SMTP_SERVER" ] && [ -n "$SMTP_USERNAME" ] && [ -n "$SMTP_PASSWORD" ]; then
+    python scripts/send_qr_emails.py --type worker >> logs/email_worker.log 2>&1 &
+    EMAIL_WORKER_PID=$!
+    trap 'kill $EMAIL_WORKER_PID 2>/dev/null' EXIT
+    print_status "Processador de emails iniciado (logs/email_worker.log)"
+else
+    print_warning "SMTP não configurado: emails ficam na fila até o processador ser iniciado"
+fi
+
 # Run the Flask application
 python app.py
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Email Throughput Benchmark
+Runs the real sending paths (utils.send_qr_email and the send_qr_emails
+campaigns) against a local aiosmtpd stand-in on a throwaway database, and
+reports messages per second, retries and end-to-end campaign time. The
+stand-in can add latency, throttle (421/451) and reject (550) messages.
+
+Needs aiosmtpd: pip install aiosmtpd
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+
+from benchmark_smtp import start_stand_in
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("send_qr_email", "qr_campaign", "reminder_campaign")
+
+
+def configure_environment(workdir, port, qr_cache_dir=None):
+    """Point the app at a scratch database, spool and the stand-in
+
+    Must run before the app is imported, which reads these on import.
+    """
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["EMAIL_SPOOL_DIR"] = os.path.join(workdir, "spool")
+    os.environ["QR_CACHE_DIR"] = qr_cache_dir or os.path.join(workdir, "qr")
+    os.environ["SMTP_SERVER"] = "127.0.0.1"
+    os.environ["SMTP_PORT"] = str(port)
+    os.environ["SMTP_USERNAME"] = "undokai@lightera.com"
+    os.environ["SMTP_PASSWORD"] = "benchmark"
+    os.environ["SMTP_STARTTLS"] = "0"
+
+
+def seed_participants(count):
+    """Recreate the tables with ``count`` participants, every third with a
+    dependent"""
+    from sqlalchemy import insert, select
+
+    from app import app, db
+    from models import Dependent, Participant
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(
+            insert(Participant),
+            [
+                {
+                    "nome": f"Participante {index}",
+                    "email": f"participante{index}@lightera.com",
+                    "departamento": f"Departamento {index % 10}",
+                    "qr_code": f"BENCH{index:06d}",
+                }
+                for index in range(count)
+            ],
+        )
+        ids = db.session.scalars(select(Participant.id).order_by(Participant.id))
+        db.session.execute(
+            insert(Dependent),
+            [
+                {"nome": "Dependente", "idade": 8, "participant_id": participant_id}
+                for position, participant_id in enumerate(ids)
+                if position % 3 == 0
+            ],
+        )
+        db.session.commit()
+
+
+def run_send_qr_email():
+    """utils.send_qr_email for every participant, one after the other"""
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+
+    from app import app, db
+    from models import Participant
+    from utils import send_qr_email
+
+    failed = 0
+    with app.app_context():
+        participants = db.session.scalars(
+            select(Participant)
+            .options(selectinload(Participant.dependents))
+            .order_by(Participant.id)
+            .execution_options(yield_per=500)
+        )
+        for participant in participants:
+            if not send_qr_email(participant):
+                failed += 1
+    return {"failed": failed, "retry": 0}
+
+
+def run_campaign(scenario, rate, concurrency, workers):
+    """Queue, render and send a whole campaign through send_qr_emails"""
+    import send_qr_emails
+    from sqlalchemy import func, select
+
+    from app import app, db
+    from models import EmailOutbox
+
+    if scenario == "qr_campaign":
+        send_qr_emails.send_batch_emails(
+            rate=rate, concurrency=concurrency, workers=workers
+        )
+    else:
+        send_qr_emails.send_reminder_emails(rate=rate, concurrency=concurrency)
+
+    with app.app_context():
+        counts = dict(
+            db.session.execute(
+                select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status)
+            ).all()
+        )
+    return {"failed": counts.get("failed", 0), "retry": counts.get("pending", 0)}
+
+
+def benchmark(args):
+    """Run every scenario for every size; returns one result row per run"""
+    try:
+        import aiosmtpd  # noqa: F401
+    except ImportError:
+        logger.error("aiosmtpd is required: pip install aiosmtpd")
+        sys.exit(1)
+
+    controller, handler, port = start_stand_in(
+        args.handshake_latency,
+        latency=args.latency,
+        max_rate=args.server_rate,
+        throttle_ratio=args.throttle_ratio,
+        fail_ratio=args.fail_ratio,
+        seed=args.seed,
+    )
+    workdir = tempfile.mkdtemp(prefix="undokai-email-bench-")
+    configure_environment(workdir, port, args.qr_cache_dir)
+
+    from mailer import close_smtp_pools
+
+    # Per-message and per-campaign logging would dominate the timings
+    logging.getLogger("app").setLevel(logging.WARNING)
+    logging.getLogger("send_qr_emails").setLevel(logging.WARNING)
+    logging.getLogger("mail.log").setLevel(logging.WARNING)
+
+    results = []
+    try:
+        for size in args.sizes:
+            for scenario in args.scenarios:
+                seed_participants(size)
+                close_smtp_pools()
+                handler.reset()
+
+                start = time.perf_counter()
+                if scenario == "send_qr_email":
+                    outcome = run_send_qr_email()
+                else:
+                    outcome = run_campaign(
+                        scenario, args.rate, args.concurrency, args.workers
+                    )
+                elapsed = time.perf_counter() - start
+
+                results.append(
+                    {
+                        "scenario": scenario,
+                        "recipients": size,
+                        "seconds": elapsed,
+                        "messages_per_second": handler.received / elapsed,
+                        "accepted": handler.received,
+                        "throttled": handler.throttled,
+                        "rejected": handler.rejected,
+                        **outcome,
+                    }
+                )
+                logger.info(
+                    f"{scenario} x {size}: {elapsed:.1f}s, "
+                    f"{handler.received / elapsed:.1f} msgs/s"
+                )
+    finally:
+        close_smtp_pools()
+        controller.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark email sending against a local SMTP stand-in"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000],
+        help="Recipients per run (default: 1000 10000)",
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        choices=SCENARIOS,
+        default=list(SCENARIOS),
+        help="Sending paths to run (default: all)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.01,
+        help="Seconds the server takes per message (default: 0.01)",
+    )
+    parser.add_argument(
+        "--handshake-latency",
+        type=float,
+        default=0.05,
+        help="Seconds added to each SMTP handshake (default: 0.05)",
+    )
+    parser.add_argument(
+        "--server-rate",
+        type=float,
+        help="Messages per second before the server answers 451 (default: none)",
+    )
+    parser.add_argument(
+        "--throttle-ratio",
+        type=float,
+        default=0.0,
+        help="Share of messages answered with 421 (default: 0)",
+    )
+    parser.add_argument(
+        "--fail-ratio",
+        type=float,
+        default=0.0,
+        help="Share of messages rejected with 550 (default: 0)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed for injected replies (default: 0)"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1000.0,
+        help="Campaign sending rate limit, emails/s (default: 1000)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Campaign SMTP connections (default: 4)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processes rendering the QR campaign spool (default: CPU count)",
+    )
+    parser.add_argument(
+        "--qr-cache-dir",
+        help="Reuse a warmed QR cache instead of rendering every code",
+    )
+    args = parser.parse_args()
+
+    results = benchmark(args)
+
+    logger.info(
+        f"\n{'scenario':<18} {'recipients':>10} {'seconds':>8} {'msgs/s':>8} "
+        f"{'accepted':>8} {'throttled':>9} {'rejected':>8} {'failed':>7} "
+        f"{'retry':>6}"
+    )
+    for result in results:
+        logger.info(
+            f"{result['scenario']:<18} {result['recipients']:>10} "
+            f"{result['seconds']:>8.1f} {result['messages_per_second']:>8.1f} "
+            f"{result['accepted']:>8} {result['throttled']:>9} "
+            f"{result['rejected']:>8} {result['failed']:>7} {result['retry']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
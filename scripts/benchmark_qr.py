@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+QR Code Rendering Benchmark
+Compares ms per code and output size of the QR renderers
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import io
+import logging
+import time
+import uuid
+
+import qrcode
+from qrcode.image.svg import SvgPathImage
+
+from qr_cache import qr_matrix, rasterize_png, render_svg
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+def legacy_qr(data, size, border):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def legacy_png(data, size=10, border=4):
+    """The original generate_qr_code rendering (PIL image factory)"""
+    img = legacy_qr(data, size, border).make_image(
+        fill_color="black", back_color="white"
+    )
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def legacy_svg(data, size=10, border=4):
+    """qrcode's own SVG path factory"""
+    buffer = io.BytesIO()
+    legacy_qr(data, size, border).make_image(image_factory=SvgPathImage).save(buffer)
+    return buffer.getvalue()
+
+
+def fast_png(data, size=10, border=4):
+    return rasterize_png(qr_matrix(data, border), size)
+
+
+def fast_svg(data, size=10, border=4):
+    return render_svg(qr_matrix(data, border), size)
+
+
+def encode_only(data, size=10, border=4):
+    """Matrix encoding shared by every renderer, for reference"""
+    qr_matrix(data, border)
+    return b""
+
+
+RENDERERS = {
+    "legacy-png": legacy_png,
+    "fast-png": fast_png,
+    "legacy-svg": legacy_svg,
+    "fast-svg": fast_svg,
+    "encode-only": encode_only,
+}
+
+
+def benchmark(count=500, size=10, border=4, renderers=RENDERERS):
+    """Render ``count`` random participant codes with every renderer"""
+    codes = [str(uuid.uuid4())[:8].upper() for _ in range(count)]
+    results = []
+
+    for name, render in renderers.items():
+        render(codes[0], size, border)  # warm-up
+
+        total_bytes = 0
+        start = time.perf_counter()
+        for code in codes:
+            total_bytes += len(render(code, size, border))
+        elapsed = time.perf_counter() - start
+
+        results.append(
+            {
+                "renderer": name,
+                "ms_per_code": elapsed * 1000 / count,
+                "avg_bytes": total_bytes / count,
+            }
+        )
+
+    return results
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description="Benchmark QR code renderers")
+    parser.add_argument(
+        "--count", type=int, default=500, help="Codes per renderer (default: 500)"
+    )
+    parser.add_argument(
+        "--size", type=int, default=10, help="Box size in pixels (default: 10)"
+    )
+    parser.add_argument(
+        "--border", type=int, default=4, help="Quiet zone in modules (default: 4)"
+    )
+    args = parser.parse_args()
+
+    results = benchmark(count=args.count, size=args.size, border=args.border)
+    baseline = results[0]["ms_per_code"]
+
+    logger.info(f"{'renderer':<12} {'ms/code':>9} {'bytes':>8} {'speedup':>8}")
+    for result in results:
+        logger.info(
+            f"{result['renderer']:<12} {result['ms_per_code']:>9.3f} "
+            f"{result['avg_bytes']:>8.0f} "
+            f"{baseline / result['ms_per_code']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
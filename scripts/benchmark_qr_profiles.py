@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+QR Profile Scan Benchmark
+Decodes codes rendered with every QR profile at several scales, blur levels
+and contrasts, and reports decode success rate and time per profile.
+
+Needs a local decoder: pyzbar (zbar) or OpenCV.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+import time
+import uuid
+
+from PIL import Image, ImageFilter
+
+from qr_cache import QR_PROFILES, qr_matrix
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+# Background around the code, so a short quiet zone has to do its job
+BACKGROUND = 128
+MARGIN = 24
+
+
+def load_decoder():
+    """Return a function decoding a grayscale image to text, or None"""
+    try:
+        from pyzbar.pyzbar import ZBarSymbol
+        from pyzbar.pyzbar import decode as zbar_decode
+
+        def decode(img):
+            results = zbar_decode(img, symbols=[ZBarSymbol.QRCODE])
+            return results[0].data.decode("utf-8") if results else None
+
+        return decode
+    except ImportError:
+        pass
+
+    try:
+        import cv2
+        import numpy as np
+
+        detector = cv2.QRCodeDetector()
+
+        def decode(img):
+            text, _, _ = detector.detectAndDecode(np.asarray(img))
+            return text or None
+
+        return decode
+    except ImportError:
+        return None
+
+
+def capture(matrix, scale, blur, contrast):
+    """Simulate a camera frame of a code shown at ``scale`` pixels per module"""
+    count = len(matrix)
+    dark = round(255 * (1 - contrast) / 2)
+    light = 255 - dark
+
+    img = Image.new("L", (count, count))
+    img.putdata([dark if module else light for row in matrix for module in row])
+    side = max(round(count * scale), count)
+    img = img.resize((side, side), Image.BILINEAR)
+
+    frame = Image.new("L", (side + 2 * MARGIN, side + 2 * MARGIN), BACKGROUND)
+    frame.paste(img, (MARGIN, MARGIN))
+    if blur:
+        # Blur radius is given in modules
+        frame = frame.filter(ImageFilter.GaussianBlur(blur * scale))
+    return frame
+
+
+def benchmark(decode, count, scales, blurs, contrasts, profiles=QR_PROFILES):
+    """Decode ``count`` random codes per profile under every condition"""
+    codes = [str(uuid.uuid4())[:8].upper() for _ in range(count)]
+    results = []
+
+    for profile in profiles:
+        matrices = [(code, qr_matrix(code, profile=profile)) for code in codes]
+        attempts = decoded = 0
+        elapsed = 0.0
+        failures = {}
+
+        for scale in scales:
+            for blur in blurs:
+                for contrast in contrasts:
+                    for code, matrix in matrices:
+                        frame = capture(matrix, scale, blur, contrast)
+                        start = time.perf_counter()
+                        text = decode(frame)
+                        elapsed += time.perf_counter() - start
+                        attempts += 1
+                        if text == code:
+                            decoded += 1
+                        else:
+                            condition = (scale, blur, contrast)
+                            failures[condition] = failures.get(condition, 0) + 1
+
+        results.append(
+            {
+                "profile": profile,
+                "modules": len(matrices[0][1]),
+                "success_rate": decoded / attempts,
+                "ms_per_decode": elapsed * 1000 / attempts,
+                "failures": failures,
+            }
+        )
+
+    return results
+
+
+def _floats(value):
+    return [float(item) for item in value.split(",")]
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description="Benchmark QR profile scanning")
+    parser.add_argument(
+        "--count", type=int, default=50, help="Codes per profile (default: 50)"
+    )
+    parser.add_argument(
+        "--scales",
+        type=_floats,
+        default=[1.5, 2.0, 3.0, 4.0],
+        help="Pixels per module, comma separated (default: 1.5,2,3,4)",
+    )
+    parser.add_argument(
+        "--blurs",
+        type=_floats,
+        default=[0.0, 0.3, 0.6],
+        help="Gaussian blur radius in modules (default: 0,0.3,0.6)",
+    )
+    parser.add_argument(
+        "--contrasts",
+        type=_floats,
+        default=[1.0, 0.4],
+        help="Dark/light contrast from 0 to 1 (default: 1,0.4)",
+    )
+    args = parser.parse_args()
+
+    decode = load_decoder()
+    if decode is None:
+        logger.error("No QR decoder found: pip install pyzbar or opencv-python")
+        sys.exit(1)
+
+    results = benchmark(decode, args.count, args.scales, args.blurs, args.contrasts)
+
+    logger.info(f"{'profile':<10} {'modules':>8} {'success':>8} {'ms/decode':>10}")
+    for result in results:
+        logger.info(
+            f"{result['profile']:<10} {result['modules']:>8} "
+            f"{result['success_rate']:>7.1%} {result['ms_per_decode']:>10.3f}"
+        )
+    for result in results:
+        for (scale, blur, contrast), failed in sorted(result["failures"].items()):
+            logger.info(
+                f"  {result['profile']}: {failed}/{args.count} failed at "
+                f"scale {scale}, blur {blur}, contrast {contrast}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+SMTP Sending Benchmark
+Compares a new connection per message with the pooled sender against a
+local aiosmtpd stand-in. The stand-in delays EHLO to mimic the TLS and
+login round trips of a real provider.
+
+Needs aiosmtpd: pip install aiosmtpd
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import logging
+import random
+import smtplib
+import socket
+import time
+from collections import deque
+from email.mime.text import MIMEText
+
+from mailer import SMTPPool
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+
+class StandInHandler:
+    """Stand-in SMTP provider
+
+    Delays the handshake by ``handshake_latency`` and every message by
+    ``latency`` seconds. Answers 451 once more than ``max_rate`` messages
+    arrive within a second, and 421 (closing the session) or 550 for a
+    ``throttle_ratio`` or ``fail_ratio`` share of messages.
+    """
+
+    def __init__(
+        self,
+        handshake_latency=0.0,
+        latency=0.0,
+        max_rate=None,
+        throttle_ratio=0.0,
+        fail_ratio=0.0,
+        seed=0,
+    ):
+        self.handshake_latency = handshake_latency
+        self.latency = latency
+        self.max_rate = max_rate
+        self.throttle_ratio = throttle_ratio
+        self.fail_ratio = fail_ratio
+        self.random = random.Random(seed)
+        self.received = 0
+        self.throttled = 0
+        self.rejected = 0
+        self._window = deque()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.handshake_latency)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= 1:
+            self._window.popleft()
+        if self.max_rate and len(self._window) >= self.max_rate:
+            self.throttled += 1
+            return "451 4.7.1 Rate limit exceeded, try again later"
+
+        draw = self.random.random()
+        if draw < self.throttle_ratio:
+            self.throttled += 1
+            return "421 4.7.0 Too many messages, closing connection"
+        if draw < self.throttle_ratio + self.fail_ratio:
+            self.rejected += 1
+            return "550 5.1.1 Mailbox unavailable"
+
+        self._window.append(now)
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+    def reset(self):
+        self.received = self.throttled = self.rejected = 0
+        self._window.clear()
+
+
+def start_stand_in(handshake_latency=0.0, **options):
+    """Start a local SMTP server and return (controller, handler, port)
+
+    ``options`` are passed to StandInHandler. Any credentials are accepted
+    without TLS, so the app's pooled sender can log in as configured.
+    """
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import AuthResult
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    handler = StandInHandler(handshake_latency, **options)
+    controller = Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=port,
+        authenticator=lambda *args: AuthResult(success=True),
+        auth_require_tls=False,
+    )
+    controller.start()
+    return controller, handler, port
+
+
+def make_message(index):
+    msg = MIMEText(f"Mensagem de teste {index}", "plain")
+    msg["From"] = "undokai@lightera.com"
+    msg["To"] = f"participante{index}@lightera.com"
+    msg["Subject"] = "UNDOKAI - benchmark"
+    return msg
+
+
+def send_per_message(port, count):
+    """The previous behaviour: one SMTP session per email"""
+    for index in range(count):
+        with smtplib.SMTP("127.0.0.1", port) as server:
+            server.send_message(make_message(index))
+
+
+def send_pooled(port, count, max_messages):
+    pool = SMTPPool(
+        "127.0.0.1", port, size=1, max_messages=max_messages, starttls=False
+    )
+    for index in range(count):
+        pool.send_message(make_message(index))
+    pool.close()
+    return pool.stats()
+
+
+def benchmark(count=500, handshake_latency=0.05, max_messages=100):
+    controller, handler, port = start_stand_in(handshake_latency)
+    results = []
+    try:
+        for name, send in (
+            ("per-message", lambda: send_per_message(port, count)),
+            ("pooled", lambda: send_pooled(port, count, max_messages)),
+        ):
+            start = time.perf_counter()
+            stats = send()
+            elapsed = time.perf_counter() - start
+            results.append(
+                {
+                    "sender": name,
+                    "messages_per_second": count / elapsed,
+                    "connections": stats["connections"] if stats else count,
+                }
+            )
+    finally:
+        controller.stop()
+    return results
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description="Benchmark pooled SMTP sending")
+    parser.add_argument(
+        "--count", type=int, default=500, help="Messages per sender (default: 500)"
+    )
+    parser.add_argument(
+        "--handshake-latency",
+        type=float,
+        default=0.05,
+        help="Seconds added to each SMTP handshake (default: 0.05)",
+    )
+    parser.add_argument(
+        "--max-messages",
+        type=int,
+        default=100,
+        help="Messages per pooled connection (default: 100)",
+    )
+    args = parser.parse_args()
+
+    try:
+        import aiosmtpd  # noqa: F401
+    except ImportError:
+        logger.error("aiosmtpd is required: pip install aiosmtpd")
+        sys.exit(1)
+
+    results = benchmark(args.count, args.handshake_latency, args.max_messages)
+    baseline = results[0]["messages_per_second"]
+
+    logger.info(f"{'sender':<12} {'msgs/s':>9} {'connections':>12} {'speedup':>8}")
+    for result in results:
+        logger.info(
+            f"{result['sender']:<12} {result['messages_per_second']:>9.1f} "
+            f"{result['connections']:>12} "
+            f"{result['messages_per_second'] / baseline:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Generate Badge Sheets
+Writes printable participant badges (QR code, name, department and
+dependents count) to a PDF, streaming pages to disk as they are built
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+import time
+
+from app import app
+from badges import iter_badges, stream_badge_pdf
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def generate_badges(output, department=None, columns=3, rows=4, workers=None):
+    """Write the badge sheet PDF to ``output`` and return its size in bytes"""
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    written = 0
+
+    with app.app_context():
+        tmp_path = f"{output}.tmp"
+        with open(tmp_path, "wb") as pdf_file:
+            for chunk in stream_badge_pdf(
+                iter_badges(department),
+                columns=columns,
+                rows=rows,
+                workers=workers,
+                processes=True,
+            ):
+                pdf_file.write(chunk)
+                written += len(chunk)
+        os.replace(tmp_path, output)
+
+    logger.info(
+        f"Wrote {written / 1024:.0f} KiB to {output} "
+        f"in {time.perf_counter() - start:.1f}s ({workers} workers)"
+    )
+    return written
+
+
+def main():
+    """Main badge generation function"""
+    parser = argparse.ArgumentParser(description="Generate printable badge sheets")
+    parser.add_argument(
+        "--output", default="crachas.pdf", help="PDF file (default: crachas.pdf)"
+    )
+    parser.add_argument("--department", help="Only badges for this department")
+    parser.add_argument(
+        "--columns", type=int, default=3, help="Badges per row (default: 3)"
+    )
+    parser.add_argument(
+        "--rows", type=int, default=4, help="Badge rows per page (default: 4)"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Page builder processes (default: CPU count)"
+    )
+    args = parser.parse_args()
+
+    generate_badges(
+        args.output,
+        department=args.department,
+        columns=args.columns,
+        rows=args.rows,
+        workers=args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
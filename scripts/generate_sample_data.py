@@ -15,6 +15,7 @@ import uuid
 from datetime import datetime, timedelta
 
 from app import app, db
+from inventory import record_baseline
 from models import CheckIn, DeliveryItem, DeliveryLog, Dependent, EmailLog, Participant
 
 logging.basicConfig(level=logging.INFO)
@@ -290,6 +291,9 @@ def create_sample_deliveries(participants, items):
                     # Update item stock
                     item.estoque_atual = max(0, item.estoque_atual - 1)
 
+            db.session.flush()
+            # Start the stock ledger from the stock left after the samples
+            record_baseline(operator="Sistema")
             db.session.commit()
             logger.info(f"Created {len(created_deliveries)} sample deliveries")
 
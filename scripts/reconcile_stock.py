@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Reconcile Inventory Stock
+Checks every item's estoque_atual against the StockMovement ledger and
+reports the categories that do not match. Run it periodically (e.g. hourly
+from cron) with --snapshot so the ledger tail behind each snapshot stays
+short. Exits with status 1 when any item does not match.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+
+from app import app, db
+from inventory import SNAPSHOT_SETTLE, reconcile_stock, record_baseline, take_snapshots
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def reconcile(category=None, snapshot=False, baseline=False, settle=SNAPSHOT_SETTLE):
+    """Report mismatches per category; returns the number of mismatched items"""
+    with app.app_context():
+        if baseline:
+            recorded = record_baseline(operator="reconcile_stock")
+            db.session.commit()
+            logger.info(f"Started the ledger of {recorded} items")
+
+        mismatched = 0
+        for row in reconcile_stock(category):
+            mismatched += row["mismatched"]
+            status = "OK" if not row["mismatched"] else "MISMATCH"
+            logger.info(
+                f"{row['categoria']}: {row['items']} items, "
+                f"stock {row['estoque_atual']}, ledger {row['ledger']} - {status}"
+            )
+            if row["mismatched"]:
+                logger.warning(f"  Not matching: {', '.join(row['mismatched_items'])}")
+
+        if snapshot:
+            written = take_snapshots(settle)
+            db.session.commit()
+            logger.info(f"Wrote {written} snapshots")
+
+        return mismatched
+
+
+def main():
+    """Main reconciliation function"""
+    parser = argparse.ArgumentParser(
+        description="Verify inventory stock against the stock movement ledger"
+    )
+    parser.add_argument("--category", help="Only reconcile this category")
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Snapshot the ledger balance of items with new movements",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=SNAPSHOT_SETTLE,
+        help="Leave movements of the last N seconds out of snapshots "
+        f"(default: {SNAPSHOT_SETTLE:g})",
+    )
+    parser.add_argument(
+        "--baseline",
+        action="store_true",
+        help="Record the current stock of items that have no ledger yet",
+    )
+    args = parser.parse_args()
+
+    mismatched = reconcile(args.category, args.snapshot, args.baseline, args.settle)
+    if mismatched:
+        logger.error(f"{mismatched} items do not match the ledger")
+        sys.exit(1)
+    logger.info("Stock matches the ledger")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,22 +10,40 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import argparse
-import base64
+import json
 import logging
-import smtplib
 import time
-from datetime import datetime, timedelta
-from email.mime.image import MimeImage
-from email.mime.multipart import MimeMultipart
-from email.mime.text import MimeText
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
 
 from app import app, db
+from mailer import TokenBucket, get_smtp_pool, smtp_settings
 from models import EmailLog, Participant
-from utils import generate_qr_code, send_qr_email
+from outbox import (
+    ACTIVE_STATUSES,
+    due_count,
+    enqueue_emails,
+    not_queued,
+    process_outbox,
+)
+from spool import (
+    EMAIL_SPOOL_DIR,
+    compose_qr_message,
+    load_spooled_message,
+    prune_spool,
+    spool_pending,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+REMINDER_CHUNK_SIZE = 500
+WORKER_POLL_INTERVAL = 5.0
+REMINDER_CHECKPOINT = os.path.join(
+    os.path.dirname(EMAIL_SPOOL_DIR), ".reminder_checkpoint.json"
+)
+
 
 def validate_email_config():
     """Validate email configuration"""
@@ -46,226 +64,127 @@ def validate_email_config():
     return True
 
 
-def create_email_template(participant, qr_image_data):
-    """Create HTML email template"""
-    html_template = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                line-height: 1.6;
-                color: #333;
-                max-width: 600px;
-                margin: 0 auto;
-                padding: 20px;
-            }}
-            .header {{
-                background: linear-gradient(135deg, #6f42c1, #5a359a);
-                color: white;
-                padding: 30px;
-                text-align: center;
-                border-radius: 10px 10px 0 0;
-            }}
-            .content {{
-                background: #f8f9fa;
-                padding: 30px;
-                border-radius: 0 0 10px 10px;
-            }}
-            .qr-container {{
-                text-align: center;
-                background: white;
-                padding: 20px;
-                border-radius: 10px;
-                margin: 20px 0;
-                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-            }}
-            .qr-code {{
-                max-width: 200px;
-                height: auto;
-            }}
-            .info-box {{
-                background: white;
-                padding: 20px;
-                border-radius: 10px;
-                margin: 20px 0;
-                border-left: 4px solid #6f42c1;
-            }}
-            .footer {{
-                text-align: center;
-                color: #666;
-                font-size: 12px;
-                margin-top: 20px;
-                padding-top: 20px;
-                border-top: 1px solid #ddd;
-            }}
-            .btn {{
-                display: inline-block;
-                background: #6f42c1;
-                color: white;
-                padding: 12px 24px;
-                text-decoration: none;
-                border-radius: 5px;
-                margin: 10px 0;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>🎉 UNDOKAI 2024</h1>
-            <p>Seu QR Code de Acesso</p>
-        </div>
-        
-        <div class="content">
-            <h2>Olá, {participant.nome}! 👋</h2>
-            
-            <p>Sua inscrição para o <strong>UNDOKAI 2024</strong> foi confirmada com sucesso!</p>
-            
-            <div class="qr-container">
-                <h3>Seu QR Code de Acesso</h3>
-                <img src="data:image/png;base64,{qr_image_data}" alt="QR Code" class="qr-code">
-                <p><strong>Código: {participant.qr_code}</strong></p>
-                <p><small>Apresente este código na entrada do evento</small></p>
-            </div>
-            
-            <div class="info-box">
-                <h4>📋 Detalhes da sua Inscrição</h4>
-                <p><strong>Nome:</strong> {participant.nome}</p>
-                <p><strong>Email:</strong> {participant.email}</p>
-                {f"<p><strong>Departamento:</strong> {participant.departamento}</p>" if participant.departamento else ""}
-                <p><strong>Dependentes:</strong> {len(participant.dependents)} pessoa(s)</p>
-                {f"<p><strong>Lista de Dependentes:</strong></p><ul>{''.join([f'<li>{dep.nome} ({dep.idade} anos)</li>' for dep in participant.dependents])}</ul>" if participant.dependents else ""}
-            </div>
-            
-            <div class="info-box">
-                <h4>📅 Informações do Evento</h4>
-                <p><strong>Data:</strong> 15 de Dezembro de 2024</p>
-                <p><strong>Local:</strong> Centro de Convenções Lightera</p>
-                <p><strong>Horário:</strong> 14h00 às 18h00</p>
-                <p><strong>Dress Code:</strong> Casual</p>
-            </div>
-            
-            <div class="info-box">
-                <h4>🎁 O que esperar?</h4>
-                <ul>
-                    <li>🍕 Festa com comidas e bebidas</li>
-                    <li>🎮 Atividades para toda família</li>
-                    <li>🎁 Distribuição de presentes</li>
-                    <li>🏆 Sorteios especiais</li>
-                    <li>📸 Espaço para fotos</li>
-                </ul>
-            </div>
-            
-            <div style="text-align: center;">
-                <p><strong>⚠️ IMPORTANTE: Guarde este QR Code com cuidado!</strong></p>
-                <p>Você precisará dele para:</p>
-                <ul style="text-align: left;">
-                    <li>✅ Fazer check-in na entrada do evento</li>
-                    <li>🎁 Retirar presentes e kits</li>
-                    <li>🍽️ Participar das atividades</li>
-                </ul>
-            </div>
-        </div>
-        
-        <div class="footer">
-            <p>Este email foi enviado automaticamente pelo sistema Lightera UNDOKAI.</p>
-            <p>Em caso de dúvidas, entre em contato conosco.</p>
-            <p>&copy; 2024 Lightera / Furukawa Electric - Todos os direitos reservados</p>
-        </div>
-    </body>
-    </html>
+def build_qr_message(participant, sender, payload_ref=None):
+    """QR code email of a participant, from the spool when already rendered"""
+    if payload_ref:
+        return load_spooled_message(payload_ref)
+    return compose_qr_message(participant, sender)
+
+
+def build_reminder_message(participant, sender, days_before):
+    """Build the reminder email of a participant"""
+    msg = MIMEMultipart()
+    msg["From"] = sender
+    msg["To"] = participant.email
+    msg["Subject"] = f"UNDOKAI 2024 - Lembrete: Evento em {days_before} dia(s)!"
+
+    body = f"""
+    Olá {participant.nome}!
+    
+    Este é um lembrete amigável sobre o UNDOKAI 2024!
+    
+    📅 O evento acontece em {days_before} dia(s)
+    🕐 Data: 15 de Dezembro de 2024
+    🏢 Local: Centro de Convenções Lightera
+    ⏰ Horário: 14h00 às 18h00
+    
+    🎫 Seu QR Code: {participant.qr_code}
+    
+    Não se esqueça de trazer seu QR Code para fazer o check-in!
+    
+    Nos vemos lá! 🎉
+    
+    Equipe Lightera
     """
 
-    return html_template
-
+    msg.attach(MIMEText(body, "plain"))
+    return msg
 
-def send_single_email(participant, dry_run=False):
-    """Send QR code email to a single participant"""
-    try:
-        # Generate QR code
-        qr_image = generate_qr_code(participant.qr_code)
 
-        # Extract base64 data
-        qr_base64 = qr_image.split(",")[1] if "," in qr_image else qr_image
+def report_dry_run(participant):
+    """Log the QR code email a dry run would send to a participant"""
+    logger.info(
+        f"[DRY RUN] Would send email to {participant.nome} ({participant.email})"
+    )
 
-        if dry_run:
-            logger.info(
-                f"[DRY RUN] Would send email to {participant.nome} ({participant.email})"
-            )
-            return True
 
-        # Email configuration
-        smtp_server = os.environ.get("SMTP_SERVER")
-        smtp_port = int(os.environ.get("SMTP_PORT", 587))
-        smtp_username = os.environ.get("SMTP_USERNAME")
-        smtp_password = os.environ.get("SMTP_PASSWORD")
-
-        # Create message
-        msg = MimeMultipart("related")
-        msg["From"] = smtp_username
-        msg["To"] = participant.email
-        msg["Subject"] = "UNDOKAI 2024 - Seu QR Code de Acesso"
-
-        # Create HTML body
-        html_body = create_email_template(participant, qr_base64)
-        msg.attach(MimeText(html_body, "html"))
-
-        # Send email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.send_message(msg)
-
-        # Log email in database
-        with app.app_context():
-            email_log = EmailLog(
-                participant_id=participant.id,
-                email_type="qr_delivery",
-                subject=msg["Subject"],
-                status="sent",
-            )
-            db.session.add(email_log)
-            db.session.commit()
+def sent_today():
+    """Messages already accepted today, counted against the daily limit"""
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    return EmailLog.query.filter(
+        EmailLog.status == "sent", EmailLog.sent_at >= today
+    ).count()
+
+
+# Email type -> build(participant, sender, payload_ref) for the outbox worker
+BUILDERS = {
+    "qr_delivery": build_qr_message,
+    "delivery_qr": build_qr_message,
+    "reminder": lambda participant, sender, payload_ref: build_reminder_message(
+        participant, sender, int(payload_ref or 1)
+    ),
+}
+
+
+def spool_queue(workers=None):
+    """Stage one: render queued QR code emails into the spool"""
+    start = time.perf_counter()
+    spooled = spool_pending(smtp_settings()["username"], workers=workers)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"📝 Spooled {spooled} emails in {elapsed:.1f}s "
+        f"({spooled / elapsed if elapsed else 0:.0f} emails/s)"
+    )
+    return spooled
 
-        logger.info(f"✅ Email sent to {participant.nome} ({participant.email})")
-        return True
 
-    except Exception as e:
-        logger.error(f"❌ Failed to send email to {participant.nome}: {str(e)}")
+def process_queue(rate=5.0, concurrency=4, daily_limit=None):
+    """Stage two: send every due email in the outbox within the rate limits"""
+    pool = get_smtp_pool(size=concurrency)
+    bucket = TokenBucket(rate, daily_limit=daily_limit, sent_today=sent_today())
 
-        # Log failed email
-        try:
-            with app.app_context():
-                email_log = EmailLog(
-                    participant_id=participant.id,
-                    email_type="qr_delivery",
-                    subject="UNDOKAI 2024 - Seu QR Code de Acesso",
-                    status="failed",
-                )
-                db.session.add(email_log)
-                db.session.commit()
-        except:
-            pass
+    logger.info(f"Sending at up to {rate:g} emails/s over {concurrency} connections")
+    start = time.perf_counter()
+    totals = process_outbox(BUILDERS, pool, bucket, concurrency)
+    elapsed = time.perf_counter() - start
+    prune_spool()
 
-        return False
-
-
-def send_batch_emails(batch_size=10, delay=1, dry_run=False, filter_department=None):
-    """Send emails in batches to avoid overwhelming SMTP server"""
+    logger.info("\n📊 Email sending completed!")
+    logger.info(
+        f"⏱️ {totals['sent']} sent in {elapsed:.1f}s "
+        f"({totals['sent'] / elapsed if elapsed else 0:.1f} emails/s)"
+    )
+    logger.info(f"✅ Sent: {totals['sent']}")
+    logger.info(f"🔁 Retrying later: {totals['retry']}")
+    logger.info(f"❌ Failed: {totals['failed']}")
+    if totals["deferred"]:
+        logger.warning("Daily limit reached: the remaining emails stay queued")
+
+    return totals["failed"] == 0
+
+
+def send_batch_emails(
+    rate=5.0,
+    concurrency=4,
+    daily_limit=None,
+    dry_run=False,
+    filter_department=None,
+    workers=None,
+):
+    """Queue QR code emails for everyone who has not received one, render
+    them into the spool, then send"""
 
     with app.app_context():
-        # Get participants who haven't received QR emails yet
+        # Participants who haven't received QR emails yet and aren't queued
         query = (
-            db.session.query(Participant)
+            db.session.query(Participant.id, Participant.nome, Participant.email)
             .outerjoin(
                 EmailLog,
                 (EmailLog.participant_id == Participant.id)
                 & (EmailLog.email_type == "qr_delivery")
                 & (EmailLog.status == "sent"),
             )
-            .filter(EmailLog.id.is_(None))
+            .filter(EmailLog.id.is_(None), not_queued("qr_delivery"))
         )
 
         # Filter by department if specified
@@ -274,145 +193,133 @@ def send_batch_emails(batch_size=10, delay=1, dry_run=False, filter_department=N
 
         participants = query.all()
 
-        if not participants:
-            logger.info("No participants found who need QR code emails.")
-            return True
-
-        logger.info(f"Found {len(participants)} participants to send emails to")
-
         if dry_run:
             logger.info("DRY RUN MODE - No emails will actually be sent")
+            for participant in participants:
+                report_dry_run(participant)
+            return True
 
-        success_count = 0
-        error_count = 0
-
-        # Process in batches
-        for i in range(0, len(participants), batch_size):
-            batch = participants[i : i + batch_size]
-            logger.info(f"Processing batch {i//batch_size + 1}: {len(batch)} emails")
-
-            for participant in batch:
-                success = send_single_email(participant, dry_run=dry_run)
-
-                if success:
-                    success_count += 1
-                else:
-                    error_count += 1
-
-                # Small delay between emails
-                if not dry_run:
-                    time.sleep(delay)
-
-            # Longer delay between batches
-            if i + batch_size < len(participants):
-                logger.info(f"Waiting {delay * 5} seconds before next batch...")
-                if not dry_run:
-                    time.sleep(delay * 5)
-
-        logger.info(f"\n📊 Email sending completed!")
-        logger.info(f"✅ Successful: {success_count}")
-        logger.info(f"❌ Failed: {error_count}")
-        logger.info(
-            f"📈 Success rate: {(success_count / len(participants)) * 100:.1f}%"
-        )
+        if participants:
+            queued = enqueue_emails([p.id for p in participants], "qr_delivery")
+            db.session.commit()
+            logger.info(f"Queued {queued} QR code emails")
+        else:
+            logger.info("No new participants need QR code emails.")
 
-        return error_count == 0
+        spool_queue(workers)
+        return process_queue(rate, concurrency, daily_limit)
 
 
-def send_reminder_emails(days_before=1, dry_run=False):
-    """Send reminder emails before the event"""
+def run_worker(
+    rate=5.0,
+    concurrency=4,
+    daily_limit=None,
+    workers=None,
+    poll_interval=WORKER_POLL_INTERVAL,
+    cycles=None,
+):
+    """Keep rendering and sending queued emails until interrupted
 
-    with app.app_context():
-        # Get all participants
-        participants = Participant.query.all()
+    Emails queued by the web app (e.g. /api/send_delivery_qrcodes) are only
+    sent while a worker runs. The outbox is checked every ``poll_interval``
+    seconds; ``cycles`` limits the number of checks.
+    """
+    logger.info(f"Email worker started, checking the outbox every {poll_interval:g}s")
+    cycle = 0
+    while cycles is None or cycle < cycles:
+        cycle += 1
+        with app.app_context():
+            if due_count():
+                spool_queue(workers)
+                process_queue(rate, concurrency, daily_limit)
+        if cycles is None or cycle < cycles:
+            time.sleep(poll_interval)
 
-        if not participants:
-            logger.info("No participants found.")
-            return True
 
-        logger.info(f"Sending reminder emails to {len(participants)} participants")
-
-        success_count = 0
-        error_count = 0
-
-        for participant in participants:
-            try:
-                if dry_run:
-                    logger.info(f"[DRY RUN] Would send reminder to {participant.nome}")
-                    success_count += 1
-                    continue
-
-                # Email configuration
-                smtp_server = os.environ.get("SMTP_SERVER")
-                smtp_port = int(os.environ.get("SMTP_PORT", 587))
-                smtp_username = os.environ.get("SMTP_USERNAME")
-                smtp_password = os.environ.get("SMTP_PASSWORD")
-
-                # Create reminder message
-                msg = MimeMultipart()
-                msg["From"] = smtp_username
-                msg["To"] = participant.email
-                msg["Subject"] = (
-                    f"UNDOKAI 2024 - Lembrete: Evento em {days_before} dia(s)!"
-                )
+def load_reminder_checkpoint(days_before, path=REMINDER_CHECKPOINT):
+    """Last participant id already queued for this reminder"""
+    try:
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return 0
+    if checkpoint.get("days_before") != days_before:
+        return 0
+    return checkpoint.get("last_id", 0)
+
+
+def save_reminder_checkpoint(days_before, last_id, path=REMINDER_CHECKPOINT):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as checkpoint_file:
+        json.dump({"days_before": days_before, "last_id": last_id}, checkpoint_file)
+    os.replace(tmp_path, path)
+
+
+def queue_reminders(
+    days_before, chunk_size=REMINDER_CHUNK_SIZE, checkpoint_path=REMINDER_CHECKPOINT
+):
+    """Queue this reminder for every participant who has not had it
+
+    Participants are streamed in id order; one anti-join per chunk skips
+    those already queued or sent the reminder. Each chunk is committed and
+    checkpointed, so a rerun resumes after the last queued chunk. The
+    checkpoint is removed once every participant has been scanned.
+    """
+    payload_ref = str(days_before)
+    last_id = load_reminder_checkpoint(days_before, checkpoint_path)
+    if last_id:
+        logger.info(f"Resuming reminders after participant id {last_id}")
+
+    queued = 0
+    while True:
+        ids = db.session.scalars(
+            db.select(Participant.id)
+            .where(
+                Participant.id > last_id,
+                not_queued(
+                    "reminder", payload_ref, statuses=ACTIVE_STATUSES + ("sent",)
+                ),
+            )
+            .order_by(Participant.id)
+            .limit(chunk_size)
+        ).all()
+        if not ids:
+            break
 
-                body = f"""
-                Olá {participant.nome}!
-                
-                Este é um lembrete amigável sobre o UNDOKAI 2024!
-                
-                📅 O evento acontece em {days_before} dia(s)
-                🕐 Data: 15 de Dezembro de 2024
-                🏢 Local: Centro de Convenções Lightera
-                ⏰ Horário: 14h00 às 18h00
-                
-                🎫 Seu QR Code: {participant.qr_code}
-                
-                Não se esqueça de trazer seu QR Code para fazer o check-in!
-                
-                Nos vemos lá! 🎉
-                
-                Equipe Lightera
-                """
-
-                msg.attach(MimeText(body, "plain"))
-
-                # Send email
-                with smtplib.SMTP(smtp_server, smtp_port) as server:
-                    server.starttls()
-                    server.login(smtp_username, smtp_password)
-                    server.send_message(msg)
-
-                # Log email
-                email_log = EmailLog(
-                    participant_id=participant.id,
-                    email_type="reminder",
-                    subject=msg["Subject"],
-                    status="sent",
-                )
-                db.session.add(email_log)
+        queued += enqueue_emails(ids, "reminder", payload_ref=payload_ref)
+        db.session.commit()
+        last_id = ids[-1]
+        save_reminder_checkpoint(days_before, last_id, checkpoint_path)
 
-                success_count += 1
-                logger.info(f"✅ Reminder sent to {participant.nome}")
+    if os.path.exists(checkpoint_path):
+        os.unlink(checkpoint_path)
+    return queued
 
-                time.sleep(0.5)  # Small delay
 
-            except Exception as e:
-                logger.error(
-                    f"❌ Failed to send reminder to {participant.nome}: {str(e)}"
-                )
-                error_count += 1
+def send_reminder_emails(
+    days_before=1, dry_run=False, rate=5.0, concurrency=4, daily_limit=None
+):
+    """Queue reminder emails for every participant, then send"""
 
-        try:
-            db.session.commit()
-        except:
-            pass
+    with app.app_context():
+        if dry_run:
+            pending = db.session.scalar(
+                db.select(db.func.count(Participant.id)).where(
+                    not_queued(
+                        "reminder",
+                        str(days_before),
+                        statuses=ACTIVE_STATUSES + ("sent",),
+                    )
+                )
+            )
+            logger.info(f"[DRY RUN] Would send reminders to {pending} participants")
+            return True
 
-        logger.info(f"\n📊 Reminder emails completed!")
-        logger.info(f"✅ Successful: {success_count}")
-        logger.info(f"❌ Failed: {error_count}")
+        queued = queue_reminders(days_before)
+        logger.info(f"Queued {queued} reminder emails")
 
-        return error_count == 0
+        return process_queue(rate, concurrency, daily_limit)
 
 
 def main():
@@ -422,21 +329,28 @@ def main():
     )
     parser.add_argument(
         "--type",
-        choices=["qr", "reminder"],
+        choices=["qr", "reminder", "spool", "outbox", "worker"],
         default="qr",
-        help="Type of email to send (default: qr)",
+        help="Type of email to send; spool only renders queued QR emails, "
+        "outbox only sends queued emails, worker keeps sending queued emails "
+        "until interrupted (default: qr)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=5.0,
+        help="Maximum emails per second (default: 5)",
     )
     parser.add_argument(
-        "--batch-size",
+        "--concurrency",
         type=int,
-        default=10,
-        help="Number of emails per batch (default: 10)",
+        default=4,
+        help="Concurrent SMTP connections (default: 4)",
     )
     parser.add_argument(
-        "--delay",
-        type=float,
-        default=1.0,
-        help="Delay between emails in seconds (default: 1.0)",
+        "--daily-limit",
+        type=int,
+        help="Provider's daily sending limit (default: none)",
     )
     parser.add_argument(
         "--dry-run",
@@ -444,6 +358,18 @@ def main():
         help="Test run without actually sending emails",
     )
     parser.add_argument("--department", type=str, help="Filter by department")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processes rendering emails into the spool (default: CPU count)",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=WORKER_POLL_INTERVAL,
+        help=f"Seconds between outbox checks of the worker "
+        f"(default: {WORKER_POLL_INTERVAL:g})",
+    )
     parser.add_argument(
         "--days-before",
         type=int,
@@ -462,14 +388,40 @@ def main():
     try:
         if args.type == "qr":
             success = send_batch_emails(
-                batch_size=args.batch_size,
-                delay=args.delay,
+                rate=args.rate,
+                concurrency=args.concurrency,
+                daily_limit=args.daily_limit,
                 dry_run=args.dry_run,
                 filter_department=args.department,
+                workers=args.workers,
             )
+        elif args.type == "spool":
+            with app.app_context():
+                spool_queue(args.workers)
+                success = True
+        elif args.type == "outbox":
+            with app.app_context():
+                success = process_queue(
+                    rate=args.rate,
+                    concurrency=args.concurrency,
+                    daily_limit=args.daily_limit,
+                )
+        elif args.type == "worker":
+            run_worker(
+                rate=args.rate,
+                concurrency=args.concurrency,
+                daily_limit=args.daily_limit,
+                workers=args.workers,
+                poll_interval=args.poll_interval,
+            )
+            success = True
         elif args.type == "reminder":
             success = send_reminder_emails(
-                days_before=args.days_before, dry_run=args.dry_run
+                days_before=args.days_before,
+                dry_run=args.dry_run,
+                rate=args.rate,
+                concurrency=args.concurrency,
+                daily_limit=args.daily_limit,
             )
 
         if success:
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Database Setup Script for Lightera UNDOKAI
-Creates database tables and initial configuration
+Creates database tables and initial configuration. With --upgrade, brings
+an existing database up to date instead, keeping its data.
 """
 
 import os
@@ -9,8 +10,11 @@ import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import argparse
 import logging
 
+from sqlalchemy import inspect, text
+
 from app import app, db
 from models import CheckIn, DeliveryItem, DeliveryLog, Dependent, EmailLog, Participant
 from utils import create_sample_delivery_items
@@ -54,6 +58,53 @@ def setup_database():
         return False
 
 
+def upgrade_database():
+    """Add the tables, columns and indexes missing from an existing database
+
+    db.create_all() only creates missing tables, so columns and indexes
+    added to existing tables since they were created are added here. Safe
+    to run repeatedly. Returns the list of changes made.
+    """
+    with app.app_context():
+        db.create_all()
+
+        changes = []
+        with db.engine.begin() as connection:
+            inspector = inspect(connection)
+            preparer = connection.dialect.identifier_preparer
+            for table in db.metadata.sorted_tables:
+                existing = {
+                    column["name"] for column in inspector.get_columns(table.name)
+                }
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    if not column.nullable and column.server_default is None:
+                        raise RuntimeError(
+                            f"Cannot add NOT NULL column {table.name}.{column.name} "
+                            "without a server default"
+                        )
+                    connection.execute(
+                        text(
+                            f"ALTER TABLE {preparer.format_table(table)} "
+                            f"ADD COLUMN {preparer.format_column(column)} "
+                            f"{column.type.compile(dialect=connection.dialect)}"
+                        )
+                    )
+                    changes.append(f"column {table.name}.{column.name}")
+
+                indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name in indexes:
+                        continue
+                    index.create(connection)
+                    changes.append(f"index {index.name}")
+
+        for change in changes:
+            logger.info(f"Added {change}")
+        return changes
+
+
 def create_admin_user():
     """Create a default admin user for testing"""
     try:
@@ -127,6 +178,24 @@ def verify_database():
 
 def main():
     """Main setup function"""
+    parser = argparse.ArgumentParser(description="Set up the UNDOKAI database")
+    parser.add_argument(
+        "--upgrade",
+        action="store_true",
+        help="Add missing tables, columns and indexes, keeping existing data",
+    )
+    args = parser.parse_args()
+
+    if args.upgrade:
+        logger.info("Upgrading Lightera UNDOKAI database...")
+        try:
+            changes = upgrade_database()
+        except Exception as e:
+            logger.error(f"Database upgrade failed: {str(e)}")
+            sys.exit(1)
+        logger.info(f"Database upgrade complete ({len(changes)} changes)")
+        return
+
     logger.info("Starting Lightera UNDOKAI database setup...")
 
     # Setup database
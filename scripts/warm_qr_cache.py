@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Warm the QR Code Cache
+Pre-renders the QR code of every participant into the shared QR store,
+fanning rendering out to a process pool
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import select
+
+from app import app, db
+from models import Participant
+from qr_cache import (
+    QR_PROFILES,
+    RENDERER_VERSION,
+    QRCache,
+    cache_key,
+    qr_cache,
+    render_qr,
+    resolve_profile,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = os.path.join(qr_cache.directory, ".warm_checkpoint.json")
+
+
+def render_chunk(codes, size, border, formats, directory, profile=None):
+    """Render and atomically store a chunk of codes (runs in a worker process)"""
+    store = QRCache(directory=directory, max_entries=0)
+    rendered = 0
+    for code in codes:
+        for fmt in formats:
+            if store.contains(code, size, border, fmt, profile):
+                continue
+            store.store(
+                cache_key(code, size, border, fmt, profile),
+                fmt,
+                render_qr(code, size, border, fmt, profile),
+            )
+            rendered += 1
+    return rendered
+
+
+def _params(size, border, formats, profile=None):
+    level, border = resolve_profile(profile, border)
+    return [RENDERER_VERSION, size, level, border, sorted(formats)]
+
+
+def load_checkpoint(path, size, border, formats, profile=None):
+    """Last participant id fully rendered with the same parameters"""
+    try:
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return 0
+    if checkpoint.get("params") != _params(size, border, formats, profile):
+        return 0
+    return checkpoint.get("last_id", 0)
+
+
+def save_checkpoint(path, last_id, size, border, formats, profile=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as checkpoint_file:
+        json.dump(
+            {"last_id": last_id, "params": _params(size, border, formats, profile)},
+            checkpoint_file,
+        )
+    os.replace(tmp_path, path)
+
+
+def iter_chunks(after_id, chunk_size):
+    """Stream (last_id, codes) chunks of participants ordered by id"""
+    rows = db.session.execute(
+        select(Participant.id, Participant.qr_code)
+        .where(Participant.id > after_id)
+        .order_by(Participant.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    for partition in rows.partitions():
+        yield partition[-1].id, [row.qr_code for row in partition]
+
+
+def warm_cache(
+    size=10,
+    border=None,
+    formats=("png",),
+    profile=None,
+    workers=None,
+    chunk_size=500,
+    resume=True,
+    checkpoint_path=CHECKPOINT_FILE,
+):
+    """Render every participant QR code that is not in the store yet"""
+    with app.app_context():
+        after_id = (
+            load_checkpoint(checkpoint_path, size, border, formats, profile)
+            if resume
+            else 0
+        )
+        if after_id:
+            logger.info(f"Resuming after participant id {after_id}")
+
+        workers = workers or os.cpu_count() or 1
+        start = time.perf_counter()
+        total = 0
+        rendered = 0
+        pending = deque()
+
+        def complete_oldest():
+            nonlocal rendered
+            future, last_id = pending.popleft()
+            rendered += future.result()
+            # Chunks finish in submission order here, so every id up to
+            # last_id has been stored
+            save_checkpoint(checkpoint_path, last_id, size, border, formats, profile)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for last_id, codes in iter_chunks(after_id, chunk_size):
+                pending.append(
+                    (
+                        pool.submit(
+                            render_chunk,
+                            codes,
+                            size,
+                            border,
+                            tuple(formats),
+                            qr_cache.directory,
+                            profile,
+                        ),
+                        last_id,
+                    )
+                )
+                total += len(codes)
+                # Bound the number of chunks held in memory
+                if len(pending) >= workers * 2:
+                    complete_oldest()
+
+            while pending:
+                complete_oldest()
+
+        elapsed = time.perf_counter() - start
+        throughput = rendered / elapsed if elapsed else 0
+        logger.info(
+            f"Checked {total} participants, rendered {rendered} images "
+            f"in {elapsed:.1f}s ({throughput:.0f} images/s, {workers} workers)"
+        )
+        return {"participants": total, "rendered": rendered, "seconds": elapsed}
+
+
+def main():
+    """Main warm-up function"""
+    parser = argparse.ArgumentParser(
+        description="Pre-render participant QR codes into the QR cache"
+    )
+    parser.add_argument(
+        "--size", type=int, default=10, help="Box size in pixels (default: 10)"
+    )
+    parser.add_argument(
+        "--border", type=int, help="Quiet zone in modules (default: from profile)"
+    )
+    parser.add_argument(
+        "--profile",
+        choices=sorted(QR_PROFILES),
+        help="QR profile (default: QR_PROFILE or standard)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["png", "svg"],
+        action="append",
+        help="Image format to render, may be repeated (default: png)",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=500,
+        help="Participants per worker task (default: 500)",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the checkpoint and scan every participant",
+    )
+    args = parser.parse_args()
+
+    logger.info(f"Warming QR cache in {qr_cache.directory}...")
+    warm_cache(
+        size=args.size,
+        border=args.border,
+        formats=args.format or ["png"],
+        profile=args.profile,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        resume=not args.restart,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Email spool
+
+QR code emails are sent in two independent stages. Stage one renders the
+complete RFC 5322 message of every queued QR code outbox row (HTML and
+text from pre-compiled templates, QR code from the QR cache as an inline
+CID image) in a process pool and writes it to the spool directory, storing
+the file name as the row's payload_ref. Stage two is the outbox worker,
+which streams spooled files to SMTP as they are.
+
+Each stage can be rerun on its own: rendering skips rows already spooled
+and sending only picks up rows that are still due.
+"""
+
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from email import policy
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy import select, update
+
+from mailer import RawMessage
+
+EMAIL_SPOOL_DIR = os.environ.get(
+    "EMAIL_SPOOL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool", "mail"),
+)
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "templates", "emails"
+)
+# Subject of the QR code email on every path, spooled or sent directly
+QR_SUBJECT = "UNDOKAI 2025 - Seu QR Code de Acesso"
+SPOOL_CHUNK_SIZE = 200
+
+# Outbox email types whose message is the QR code email
+SPOOLED_TYPES = ("qr_delivery", "delivery_qr")
+
+_templates = None
+
+
+def _get_templates():
+    """Compile the email templates once per process"""
+    global _templates
+    if _templates is None:
+        environment = Environment(
+            loader=FileSystemLoader(TEMPLATE_DIR),
+            autoescape=select_autoescape(["html"]),
+        )
+        _templates = (
+            environment.get_template("qr_code.html"),
+            environment.get_template("qr_code.txt"),
+        )
+    return _templates
+
+
+def compose_qr_message(participant, sender, open_url=None):
+    """Build the QR code email of a participant
+
+    ``participant`` is a mapping (or object) with nome, email, departamento,
+    qr_code and dependents (each with nome and idade). ``open_url`` is the
+    open-tracking pixel embedded in the HTML part.
+    """
+    from qr_cache import qr_cache
+
+    html_template, text_template = _get_templates()
+    domain = sender.rpartition("@")[2] or None
+    qr_cid = make_msgid(domain=domain)
+
+    msg = EmailMessage(policy=policy.SMTP)
+    msg["From"] = sender
+    msg["To"] = _field(participant, "email")
+    msg["Subject"] = QR_SUBJECT
+    msg["Date"] = formatdate(localtime=True)
+    msg["Message-ID"] = make_msgid(domain=domain)
+
+    msg.set_content(text_template.render(participant=participant))
+    msg.add_alternative(
+        html_template.render(
+            participant=participant, qr_cid=qr_cid[1:-1], open_url=open_url
+        ),
+        subtype="html",
+    )
+    qr_code = _field(participant, "qr_code")
+    msg.get_payload()[1].add_related(
+        qr_cache.get(qr_code),
+        maintype="image",
+        subtype="png",
+        cid=qr_cid,
+        filename=f"qr_code_{qr_code}.png",
+    )
+    return msg
+
+
+def _field(participant, name):
+    if isinstance(participant, dict):
+        return participant[name]
+    return getattr(participant, name)
+
+
+def spool_path(spool_dir, name):
+    return os.path.join(spool_dir, name)
+
+
+def render_chunk(rows, sender, spool_dir):
+    """Render and atomically spool a chunk of messages (runs in a worker)
+
+    Returns (outbox id, file name) for every message written.
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    spooled = []
+    for row in rows:
+        name = f"{row['outbox_id']}.eml"
+        data = compose_qr_message(row, sender, row.get("open_url")).as_bytes()
+        fd, tmp_path = tempfile.mkstemp(dir=spool_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, spool_path(spool_dir, name))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        spooled.append((row["outbox_id"], name))
+    return spooled
+
+
+def _iter_unspooled(chunk_size):
+    """Yield chunks of queued QR code rows that have no spool file yet
+
+    Keyset pagination keeps each query short, so results can be committed
+    between chunks.
+    """
+    from app import db
+    from models import Dependent, EmailOutbox, Participant
+    from tracking import open_tracking_url
+
+    last_id = 0
+    while True:
+        rows = [
+            dict(row, dependents=[])
+            for row in db.session.execute(
+                select(
+                    EmailOutbox.id.label("outbox_id"),
+                    Participant.id,
+                    Participant.nome,
+                    Participant.email,
+                    Participant.departamento,
+                    Participant.qr_code,
+                )
+                .join(Participant, Participant.id == EmailOutbox.participant_id)
+                .where(
+                    EmailOutbox.id > last_id,
+                    EmailOutbox.email_type.in_(SPOOLED_TYPES),
+                    EmailOutbox.status == "pending",
+                    EmailOutbox.payload_ref.is_(None),
+                )
+                .order_by(EmailOutbox.id)
+                .limit(chunk_size)
+            ).mappings()
+        ]
+        if not rows:
+            return
+
+        for row in rows:
+            row["open_url"] = open_tracking_url(row["outbox_id"])
+        by_participant = {row["id"]: row for row in rows}
+        for dependent in db.session.execute(
+            select(Dependent.participant_id, Dependent.nome, Dependent.idade)
+            .where(Dependent.participant_id.in_(by_participant))
+            .order_by(Dependent.id)
+        ):
+            by_participant[dependent.participant_id]["dependents"].append(
+                {"nome": dependent.nome, "idade": dependent.idade}
+            )
+        last_id = rows[-1]["outbox_id"]
+        yield rows
+
+
+def spool_pending(sender, spool_dir=EMAIL_SPOOL_DIR, workers=None, chunk_size=None):
+    """Stage one: render every queued QR email into the spool
+
+    Returns the number of messages spooled.
+    """
+    from app import db
+    from models import EmailOutbox
+
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or SPOOL_CHUNK_SIZE
+    spooled = 0
+    pending = deque()
+
+    def record_oldest():
+        nonlocal spooled
+        written = pending.popleft().result()
+        db.session.execute(
+            update(EmailOutbox),
+            [{"id": outbox_id, "payload_ref": name} for outbox_id, name in written],
+        )
+        db.session.commit()
+        spooled += len(written)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rows in _iter_unspooled(chunk_size):
+            pending.append(pool.submit(render_chunk, rows, sender, spool_dir))
+            if len(pending) >= workers * 2:
+                record_oldest()
+        while pending:
+            record_oldest()
+
+    return spooled
+
+
+def load_spooled_message(payload_ref, spool_dir=EMAIL_SPOOL_DIR):
+    """Stage two: the spooled message of an outbox row"""
+    return RawMessage.from_file(spool_path(spool_dir, os.path.basename(payload_ref)))
+
+
+def prune_spool(spool_dir=EMAIL_SPOOL_DIR):
+    """Delete spool files of rows that are sent or failed for good"""
+    from app import db
+    from models import EmailOutbox
+
+    if not os.path.isdir(spool_dir):
+        return 0
+
+    names = [name for name in os.listdir(spool_dir) if name.endswith(".eml")]
+    removed = 0
+    for start in range(0, len(names), SPOOL_CHUNK_SIZE):
+        chunk = names[start : start + SPOOL_CHUNK_SIZE]
+        done = db.session.scalars(
+            select(EmailOutbox.payload_ref).where(
+                EmailOutbox.payload_ref.in_(chunk),
+                EmailOutbox.status.in_(("sent", "failed")),
+            )
+        ).all()
+        for name in done:
+            os.unlink(spool_path(spool_dir, name))
+            removed += 1
+    return removed
@@ -13,7 +13,12 @@ import pytest
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Keep rendered QR codes out of the source tree
+os.environ.setdefault("QR_CACHE_DIR", tempfile.mkdtemp(prefix="undokai-qr-"))
+
 from app import app, db
+from catalog import item_catalog
+from mailer import close_smtp_pools
 from models import CheckIn, DeliveryItem, DeliveryLog, Dependent, EmailLog, Participant
 
 
@@ -38,6 +43,20 @@ def test_app():
     os.unlink(app.config["DATABASE"])
 
 
+@pytest.fixture(autouse=True)
+def smtp_pools():
+    """Do not share pooled SMTP connections between tests."""
+    yield
+    close_smtp_pools()
+
+
+@pytest.fixture(autouse=True)
+def catalog():
+    """Do not serve one test's items from the catalog cache in another."""
+    yield
+    item_catalog.invalidate()
+
+
 @pytest.fixture
 def client(test_app):
     """Create a test client for the Flask application."""
@@ -0,0 +1,133 @@
+"""
+Unit tests for printable badge sheets.
+"""
+
+import re
+import zlib
+from unittest.mock import patch
+
+from app import db
+from badges import iter_badges, qr_image_xobject, stream_badge_pdf
+from models import Dependent, Participant
+from qr_cache import render_qr
+
+
+def parse_pdf(pdf):
+    """Check the cross-reference table and return the page count."""
+    startxref = int(re.search(rb"startxref\n(\d+)\n%%EOF\n$", pdf).group(1))
+    assert pdf[startxref:].startswith(b"xref\n")
+    size = int(re.match(rb"xref\n0 (\d+)\n", pdf[startxref:]).group(1))
+    entries = re.findall(rb"(\d{10}) 00000 n ", pdf[startxref:])
+    assert len(entries) == size - 1
+    for number, offset in enumerate(entries, start=1):
+        assert pdf[int(offset) :].startswith(b"%d 0 obj\n" % number)
+    return int(re.search(rb"/Type /Pages /Kids \[[^\]]*\] /Count (\d+)", pdf).group(1))
+
+
+def make_badges(count, department="TI"):
+    return [
+        {
+            "nome": f"Participante {i}",
+            "departamento": department,
+            "qr_code": f"QR{i:06d}",
+            "dependents_count": i % 3,
+        }
+        for i in range(count)
+    ]
+
+
+class TestBadgeSheet:
+    """Test cases for the streamed badge PDF."""
+
+    def test_pages_per_department(self):
+        """Test departments start on new pages."""
+        badges = make_badges(13, "TI") + make_badges(2, "RH")
+        pdf = b"".join(stream_badge_pdf(badges, columns=3, rows=4, workers=2))
+
+        assert pdf.startswith(b"%PDF-1.4")
+        assert parse_pdf(pdf) == 3
+
+    def test_process_pool_matches_threads(self):
+        """Test the offline process pool lays out the same pages."""
+        badges = make_badges(13, "TI") + make_badges(2, "RH")
+        threaded = b"".join(stream_badge_pdf(badges, workers=2))
+        forked = b"".join(stream_badge_pdf(badges, workers=2, processes=True))
+
+        assert parse_pdf(forked) == parse_pdf(threaded) == 3
+        assert len(forked) == len(threaded)
+
+    def test_empty_sheet_has_one_page(self):
+        """Test an empty run still produces a valid document."""
+        pdf = b"".join(stream_badge_pdf([]))
+        assert parse_pdf(pdf) == 1
+
+    def test_streams_incrementally(self):
+        """Test objects are yielded as pages are written."""
+        chunks = list(stream_badge_pdf(make_badges(30), columns=2, rows=2))
+        assert len(chunks) > 30
+        assert max(len(chunk) for chunk in chunks) < 64 * 1024
+
+    def test_badge_text(self):
+        """Test names, departments and dependents are drawn."""
+        badges = [
+            {
+                "nome": "João (Jr.)",
+                "departamento": "Logística",
+                "qr_code": "QR123456",
+                "dependents_count": 2,
+            }
+        ]
+        pdf = b"".join(stream_badge_pdf(badges))
+        contents = re.findall(
+            rb"<< /Filter /FlateDecode /Length \d+ >>\nstream\n(.*?)\nendstream",
+            pdf,
+            re.S,
+        )
+        text = b"".join(zlib.decompress(content) for content in contents)
+
+        assert "(João \\(Jr.\\))".encode("cp1252") in text
+        assert "(Logística)".encode("cp1252") in text
+        assert b"Dependentes: 2" in text
+
+    def test_cached_png_is_passed_through(self):
+        """Test 1-bit PNG data is embedded without recompression."""
+        dictionary, data = qr_image_xobject(render_qr("QR123456"))
+        assert b"/Predictor 15" in dictionary
+        assert b"/BitsPerComponent 1" in dictionary
+        zlib.decompress(data)
+
+    def test_iter_badges(self, test_app):
+        """Test badge rows include dependents counts, ordered by department."""
+        with test_app.app_context():
+            first = Participant(
+                nome="Ana", email="ana@lightera.com", departamento="TI", qr_code="QRA"
+            )
+            second = Participant(
+                nome="Bruno",
+                email="bruno@lightera.com",
+                departamento="RH",
+                qr_code="QRB",
+            )
+            db.session.add_all([first, second])
+            db.session.flush()
+            db.session.add(Dependent(nome="Carla", idade=5, participant_id=first.id))
+            db.session.commit()
+
+            badges = list(iter_badges())
+            assert [badge["qr_code"] for badge in badges] == ["QRB", "QRA"]
+            assert badges[1]["dependents_count"] == 1
+            assert [badge["nome"] for badge in iter_badges("TI")] == ["Ana"]
+
+    def test_badge_route(self, client, db_with_data):
+        """Test the admin route streams a PDF."""
+        with client.session_transaction() as sess:
+            sess["admin_logged_in"] = True
+            sess["admin_username"] = "admin"
+
+        with patch("badges.ProcessPoolExecutor") as processes:
+            response = client.get("/admin/badges.pdf?department=TI")
+            assert response.status_code == 200
+            assert response.data.startswith(b"%PDF")
+        processes.assert_not_called()
+        assert response.mimetype == "application/pdf"
+        assert parse_pdf(response.data) == 1
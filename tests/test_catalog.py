@@ -0,0 +1,128 @@
+"""
+Unit tests for the cached delivery item catalog.
+"""
+
+import pytest
+from sqlalchemy import event, insert
+
+from app import db
+from catalog import DELIVERY_CATEGORIES, ItemCatalog
+from inventory import add_stock, deliver_items
+from models import DeliveryItem, Participant
+
+
+@pytest.fixture
+def items(test_app):
+    with test_app.app_context():
+        db.session.execute(
+            insert(DeliveryItem),
+            [
+                {"nome": "Bola", "categoria": "Brinquedos", "estoque_inicial": 10},
+                {"nome": "Arroz", "categoria": "Cesta Básica", "estoque_inicial": 5},
+                {"nome": "Sabonete", "categoria": "Higiene", "estoque_inicial": 7},
+            ],
+        )
+        db.session.execute(
+            DeliveryItem.__table__.update().values(
+                estoque_atual=DeliveryItem.estoque_inicial
+            )
+        )
+        db.session.commit()
+        return {item.nome: item.id for item in DeliveryItem.query}
+
+
+def count_queries():
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_execute)
+    return statements, lambda: event.remove(
+        db.engine, "before_cursor_execute", before_execute
+    )
+
+
+class TestItemCatalog:
+    """Test cases for grouping, caching and invalidation."""
+
+    def test_groups_every_category(self, test_app, items):
+        """Test listed categories come first and others are not dropped."""
+        with test_app.app_context():
+            grouped = ItemCatalog().by_category()
+
+            assert list(grouped) == [*DELIVERY_CATEGORIES, "Higiene"]
+            assert grouped["Festa"] == []
+            assert [item["nome"] for item in grouped["Higiene"]] == ["Sabonete"]
+            assert grouped["Brinquedos"][0]["estoque_atual"] == 10
+
+    def test_hit_reads_only_live_stock(self, test_app, items):
+        """Test a cached catalog costs a single query."""
+        with test_app.app_context():
+            catalog = ItemCatalog()
+            catalog.items()
+
+            statements, stop = count_queries()
+            try:
+                catalog.items()
+                catalog.by_category()
+            finally:
+                stop()
+
+            assert len(statements) == 2
+            assert catalog.stats()["hits"] == 2
+            assert catalog.stats()["misses"] == 1
+
+    def test_stock_change_reloads(self, test_app, items):
+        """Test stock and delivered counts are never served stale."""
+        with test_app.app_context():
+            participant = Participant(
+                nome="João Silva",
+                email="joao@lightera.com",
+                matricula="1",
+                qr_code="Q1",
+            )
+            db.session.add(participant)
+            db.session.commit()
+
+            catalog = ItemCatalog()
+            catalog.items()
+            deliver_items("Q1", [items["Bola"]])
+            add_stock(items["Arroz"], 3)
+            db.session.commit()
+
+            by_name = {item["nome"]: item for item in catalog.items()}
+            assert by_name["Bola"]["estoque_atual"] == 9
+            assert by_name["Bola"]["items_delivered"] == 1
+            assert by_name["Arroz"]["estoque_atual"] == 8
+            assert catalog.stats()["misses"] == 2
+
+    def test_item_change_needs_invalidation(self, test_app, items):
+        """Test edits that keep the stock are picked up after invalidate()."""
+        with test_app.app_context():
+            catalog = ItemCatalog()
+            catalog.items()
+            db.session.get(DeliveryItem, items["Bola"]).nome = "Boneca"
+            db.session.commit()
+
+            assert "Bola" in [item["nome"] for item in catalog.items()]
+            catalog.invalidate()
+            assert "Boneca" in [item["nome"] for item in catalog.items()]
+
+    def test_new_item_reloads(self, test_app, items):
+        """Test items added by another worker show up without invalidate()."""
+        with test_app.app_context():
+            catalog = ItemCatalog()
+            catalog.items()
+            db.session.add(DeliveryItem(nome="Bolo", categoria="Festa"))
+            db.session.commit()
+
+            assert [item["nome"] for item in catalog.by_category()["Festa"]] == ["Bolo"]
+
+    def test_expires(self, test_app, items):
+        """Test the catalog is reloaded after its TTL."""
+        with test_app.app_context():
+            catalog = ItemCatalog(ttl=0)
+            catalog.items()
+            catalog.items()
+            assert catalog.stats()["misses"] == 2
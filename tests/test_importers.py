@@ -0,0 +1,508 @@
+"""
+Unit tests for the bulk roster importer.
+"""
+
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from importers import (
+    import_inventory,
+    import_inventory_file,
+    import_participant_file,
+    import_participants,
+    iter_roster_rows,
+    normalize_inventory_row,
+    normalize_participant_row,
+    sync_participant_file,
+)
+from models import DeliveryItem, Dependent, Participant, RosterEntry
+
+
+def make_upload(content, filename="lista.csv"):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+
+class TestRosterParsing:
+    """Test cases for reading roster files."""
+
+    def test_csv_semicolon_with_accented_headers(self):
+        """Test CSV exported by HR with ';' and accented headers."""
+        upload = make_upload(
+            "Nome;Matrícula;Email;Departamento\n"
+            "Ana Souza;1001;ANA@lightera.com;RH\n"
+            ";;;\n"
+            "Bruno Lima;1002;bruno@lightera.com;TI\n"
+        )
+
+        rows = list(iter_roster_rows(upload))
+
+        assert [number for number, _ in rows] == [2, 4]
+        assert rows[0][1]["matricula"] == "1001"
+        assert rows[1][1]["departamento"] == "TI"
+
+    def test_xlsx_numeric_matricula(self):
+        """Test XLSX rows with numeric cells are converted to strings."""
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(["Nome", "Matricula", "Email"])
+        sheet.append(["Carla Dias", 2001.0, "carla@lightera.com"])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+
+        rows = list(iter_roster_rows(make_upload(buffer.getvalue(), "lista.xlsx")))
+
+        assert rows == [
+            (
+                2,
+                {
+                    "nome": "Carla Dias",
+                    "matricula": "2001",
+                    "email": "carla@lightera.com",
+                },
+            )
+        ]
+
+    def test_missing_columns(self):
+        """Test files without the required columns are rejected."""
+        with pytest.raises(ValueError):
+            list(iter_roster_rows(make_upload("Nome,Email\nAna,ana@x.com\n")))
+
+    def test_unsupported_format(self):
+        """Test unsupported file extensions are rejected."""
+        with pytest.raises(ValueError):
+            list(iter_roster_rows(make_upload("x", "lista.pdf")))
+
+    def test_normalize_row_errors(self):
+        """Test row validation reports every problem."""
+        row, errors = normalize_participant_row(
+            {"nome": None, "email": "invalido", "matricula": None}
+        )
+
+        assert "Nome é obrigatório" in errors
+        assert "Email inválido" in errors
+        assert "Matrícula é obrigatória" in errors
+
+
+class TestParticipantImport:
+    """Test cases for importing participants in chunks."""
+
+    def test_import_creates_and_updates(self, test_app):
+        """Test import upserts by matricula and email with per-row errors."""
+        with test_app.app_context():
+            db.session.add_all(
+                [
+                    Participant(
+                        nome="Antigo",
+                        email="ana@lightera.com",
+                        matricula="1001",
+                        qr_code="OLD00001",
+                    ),
+                    Participant(
+                        nome="Sem Matricula",
+                        email="bruno@lightera.com",
+                        qr_code="OLD00002",
+                    ),
+                ]
+            )
+            db.session.commit()
+
+            upload = make_upload(
+                "nome,matricula,email\n"
+                "Ana Souza,1001,ana@lightera.com\n"
+                "Bruno Lima,1002,Bruno@Lightera.com\n"
+                "Carla Dias,1003,carla@lightera.com\n"
+                "Carla Repetida,1003,outra@lightera.com\n"
+                "Sem Email,1004,\n"
+            )
+
+            report = import_participant_file(upload, chunk_size=2)
+
+            assert report["processed"] == 5
+            assert report["created"] == 1
+            assert report["updated"] == 2
+            assert [e["row"] for e in report["errors"]] == [5, 6]
+
+            ana = Participant.query.filter_by(matricula="1001").one()
+            assert ana.nome == "Ana Souza"
+            assert ana.qr_code == "OLD00001"
+            bruno = Participant.query.filter_by(qr_code="OLD00002").one()
+            assert bruno.matricula == "1002"
+            carla = Participant.query.filter_by(matricula="1003").one()
+            assert len(carla.qr_code) == 8
+
+    def test_import_generates_unique_qr_codes(self, test_app):
+        """Test every created participant gets a distinct QR code."""
+        with test_app.app_context():
+            rows = (
+                (n + 2, {"nome": f"P{n}", "email": f"p{n}@x.com", "matricula": str(n)})
+                for n in range(250)
+            )
+
+            report = import_participants(rows, chunk_size=100)
+
+            assert report["created"] == 250
+            codes = [p.qr_code for p in Participant.query.all()]
+            assert len(set(codes)) == 250
+
+
+class TestRosterSync:
+    """Test cases for hash-based incremental roster sync."""
+
+    ROSTER = (
+        "nome,matricula,email,departamento\n"
+        "Ana Souza,1001,ana@lightera.com,RH\n"
+        "Bruno Lima,1002,bruno@lightera.com,TI\n"
+        "Carla Dias,1003,carla@lightera.com,TI\n"
+    )
+
+    def test_first_sync_adds_everyone(self, test_app):
+        """Test the first sync adds every row and stores hashes."""
+        with test_app.app_context():
+            report = sync_participant_file(make_upload(self.ROSTER))
+
+            assert report["added"] == 3
+            assert RosterEntry.query.count() == 3
+            assert (
+                Participant.query.filter(Participant.matricula.isnot(None)).count() == 3
+            )
+
+    def test_dry_run_writes_nothing(self, test_app):
+        """Test dry-run only reports diff counts."""
+        with test_app.app_context():
+            report = sync_participant_file(make_upload(self.ROSTER), dry_run=True)
+
+            assert report["added"] == 3
+            assert report["dry_run"] is True
+            assert Participant.query.count() == 0
+            assert RosterEntry.query.count() == 0
+
+    def test_resync_applies_only_diff(self, test_app):
+        """Test a re-export updates changed rows and removes missing ones."""
+        with test_app.app_context():
+            sync_participant_file(make_upload(self.ROSTER))
+            bruno = Participant.query.filter_by(matricula="1002").one()
+            bruno_qr = bruno.qr_code
+
+            new_roster = (
+                "nome,matricula,email,departamento\n"
+                "Ana Souza,1001,ana@lightera.com,RH\n"
+                "Bruno Lima,1002,bruno@lightera.com,Vendas\n"
+                "Diego Reis,1004,diego@lightera.com,TI\n"
+            )
+            preview = sync_participant_file(make_upload(new_roster), dry_run=True)
+            report = sync_participant_file(make_upload(new_roster))
+
+            for counts in (preview, report):
+                assert counts["added"] == 1
+                assert counts["changed"] == 1
+                assert counts["removed"] == 1
+                assert counts["unchanged"] == 1
+
+            db.session.expire_all()
+            bruno = Participant.query.filter_by(matricula="1002").one()
+            assert bruno.departamento == "Vendas"
+            assert bruno.qr_code == bruno_qr
+            carla = Participant.query.filter_by(email="carla@lightera.com").one()
+            assert carla.matricula is None
+            assert db.session.get(RosterEntry, "1003") is None
+
+    def test_rejected_rows_are_not_removed(self, test_app):
+        """Test a row with a validation error does not count as removal."""
+        with test_app.app_context():
+            sync_participant_file(make_upload(self.ROSTER))
+
+            report = sync_participant_file(
+                make_upload(
+                    "nome,matricula,email,departamento\n"
+                    "Ana Souza,1001,ana@lightera.com,RH\n"
+                    "Bruno Lima,1002,bruno@lightera.com,TI\n"
+                    "Carla Dias,1003,email-invalido,TI\n"
+                )
+            )
+
+            assert report["removed"] == 0
+            assert len(report["errors"]) == 1
+
+
+class TestImportRoute:
+    """Test cases for the delivery list import endpoint."""
+
+    def test_import_delivery_list(self, client, test_app):
+        """Test uploading a roster through the API."""
+        with test_app.app_context():
+            with client.session_transaction() as sess:
+                sess["admin_logged_in"] = True
+
+            response = client.post(
+                "/api/import_delivery_list",
+                data={
+                    "file": (
+                        io.BytesIO(b"nome,matricula,email\nAna,1,ana@lightera.com\n"),
+                        "lista.csv",
+                    )
+                },
+                content_type="multipart/form-data",
+            )
+
+            data = response.get_json()
+            assert data["success"] is True
+            assert data["created"] == 1
+            assert Participant.query.filter_by(matricula="1").count() == 1
+
+
+class TestInventoryImport:
+    """Test cases for importing the inventory template."""
+
+    def test_template_round_trip(self, client, test_app):
+        """Test the downloaded template can be imported back as-is."""
+        with test_app.app_context():
+            template = client.get("/api/download_excel_template").data
+
+            report = import_inventory_file(make_upload(template, "estoque.csv"))
+
+            assert report["created"] == 4
+            assert report["errors"] == []
+            item = DeliveryItem.query.filter_by(nome="Kit Festa Adulto").one()
+            assert item.estoque_atual == 100
+            assert item.preco_unitario == 50.0
+
+    def test_upsert_by_name_and_category(self, test_app):
+        """Test existing items are updated and invalid rows reported."""
+        with test_app.app_context():
+            db.session.add(
+                DeliveryItem(
+                    nome="Mochila", categoria="Material Escolar", estoque_atual=5
+                )
+            )
+            db.session.add(DeliveryItem(nome="Mochila", categoria="Brinquedos"))
+            db.session.commit()
+
+            report = import_inventory_file(
+                make_upload(
+                    "nome;categoria;estoque_inicial;estoque_atual;preco_unitario\n"
+                    "Mochila;Material Escolar;80;75;19,90\n"
+                    "Bola;Brinquedos;10;;\n"
+                    "Bola;Brinquedos;10;;\n"
+                    ";Festa;1;1;1\n"
+                    "Boneca;Brinquedos;-3;abc;x\n",
+                    "estoque.csv",
+                )
+            )
+
+            assert report["created"] == 1
+            assert report["updated"] == 1
+            assert [e["row"] for e in report["errors"]] == [4, 5, 6]
+            assert len(report["errors"][2]["errors"]) == 3
+
+            mochila = DeliveryItem.query.filter_by(
+                nome="Mochila", categoria="Material Escolar"
+            ).one()
+            assert mochila.estoque_atual == 5
+            assert mochila.estoque_inicial == 80
+            assert mochila.preco_unitario == 19.9
+            bola = DeliveryItem.query.filter_by(nome="Bola").one()
+            assert bola.estoque_atual == 10
+            other = DeliveryItem.query.filter_by(categoria="Brinquedos", nome="Mochila")
+            assert other.one().estoque_atual == 0
+
+    def test_stock_is_only_overwritten_on_request(self, test_app):
+        """Test re-imports keep the stock left after deliveries by default."""
+        with test_app.app_context():
+            db.session.add(
+                DeliveryItem(nome="Bola", categoria="Brinquedos", estoque_atual=4)
+            )
+            db.session.commit()
+            rows = [
+                (2, {"nome": "Bola", "categoria": "Brinquedos", "estoque_atual": "10"})
+            ]
+
+            import_inventory(rows)
+            assert DeliveryItem.query.one().estoque_atual == 4
+            import_inventory(rows, update_stock=True)
+            assert DeliveryItem.query.one().estoque_atual == 10
+
+    def test_quantities_must_be_whole_numbers(self):
+        """Test bad quantities are per-row errors and cells may be numbers."""
+        for value in ("inf", "1e400", "nan", "1,5", 2.5):
+            row, errors = normalize_inventory_row(
+                {"nome": "Bola", "categoria": "Brinquedos", "estoque_atual": value}
+            )
+            assert errors == ["Estoque atual deve ser um número inteiro"], value
+
+        row, errors = normalize_inventory_row(
+            {
+                "nome": "Bola",
+                "categoria": "Brinquedos",
+                "estoque_atual": 3.0,
+                "estoque_inicial": "4,0",
+                "preco_unitario": 9,
+            }
+        )
+        assert errors == []
+        assert (row["estoque_atual"], row["estoque_inicial"]) == (3, 4)
+        assert row["preco_unitario"] == 9.0
+
+        row, errors = normalize_inventory_row(
+            {"nome": "Bola", "categoria": "Brinquedos", "preco_unitario": "inf"}
+        )
+        assert errors == ["Preço unitário inválido"]
+
+    def test_import_inventory_route(self, client, test_app):
+        """Test uploading the inventory template through the API."""
+        with test_app.app_context():
+            with client.session_transaction() as sess:
+                sess["admin_logged_in"] = True
+
+            response = client.post(
+                "/api/import_inventory",
+                data={
+                    "file": (
+                        io.BytesIO(
+                            b"nome,categoria,estoque_atual\nBola,Brinquedos,3\n"
+                        ),
+                        "estoque.csv",
+                    )
+                },
+                content_type="multipart/form-data",
+            )
+
+            data = response.get_json()
+            assert data["success"] is True
+            assert data["imported_count"] == 1
+
+
+class TestBulkRegistration:
+    """Test cases for the bulk JSON registration API."""
+
+    def _login(self, client):
+        with client.session_transaction() as sess:
+            sess["admin_logged_in"] = True
+
+    def test_bulk_registration_creates_participants(self, client, test_app):
+        """Test a batch is inserted with dependents and returns QR codes."""
+        with test_app.app_context():
+            self._login(client)
+            payload = [
+                {
+                    "nome": f"Pessoa {i}",
+                    "email": f"Pessoa{i}@Lightera.com",
+                    "dependents": [{"nome": "Filho", "idade": 7}] * (i % 3),
+                }
+                for i in range(30)
+            ]
+
+            response = client.post(
+                "/api/participants/bulk", json={"participants": payload}
+            )
+            data = response.get_json()
+
+            assert data["success"] is True
+            created = data["participants"]
+            assert [p["index"] for p in created] == list(range(30))
+            assert len({p["qr_code"] for p in created}) == 30
+            assert Dependent.query.count() == sum(i % 3 for i in range(30))
+
+            participant = db.session.get(Participant, created[2]["id"])
+            assert participant.email == "pessoa2@lightera.com"
+            assert participant.qr_code == created[2]["qr_code"]
+            assert len(participant.dependents) == 2
+
+    def test_bulk_registration_is_all_or_nothing(self, client, test_app):
+        """Test an invalid entry rejects the whole batch."""
+        with test_app.app_context():
+            self._login(client)
+
+            response = client.post(
+                "/api/participants/bulk",
+                json=[
+                    {"nome": "Ana", "email": "ana@lightera.com"},
+                    {"nome": "Bruno", "email": "invalido", "dependents": [{}]},
+                ],
+            )
+            data = response.get_json()
+
+            assert data["success"] is False
+            assert data["errors"][0]["index"] == 1
+            assert len(data["errors"][0]["errors"]) == 2
+            assert Participant.query.count() == 0
+
+    def test_bulk_registration_requires_list(self, client, test_app):
+        """Test the endpoint rejects payloads without participants."""
+        with test_app.app_context():
+            self._login(client)
+
+            response = client.post("/api/participants/bulk", json={"foo": 1})
+
+            assert response.get_json()["success"] is False
+
+    def test_bulk_registration_rejects_repeated_email(self, client, test_app):
+        """Test an email repeated within the batch is reported per entry."""
+        with test_app.app_context():
+            self._login(client)
+
+            response = client.post(
+                "/api/participants/bulk",
+                json=[
+                    {"nome": "Ana", "email": "ana@lightera.com"},
+                    {"nome": "Bruno", "email": "bruno@lightera.com"},
+                    {"nome": "Ana Maria", "email": "Ana@Lightera.com"},
+                ],
+            )
+            data = response.get_json()
+
+            assert data["success"] is False
+            assert data["errors"] == [
+                {"index": 2, "errors": ["Email duplicado no lote"]}
+            ]
+            assert Participant.query.count() == 0
+
+    def test_bulk_registration_rejects_long_dependent_name(self, client, test_app):
+        """Test dependent names over 100 characters are refused, not cut."""
+        with test_app.app_context():
+            self._login(client)
+
+            response = client.post(
+                "/api/participants/bulk",
+                json=[
+                    {
+                        "nome": "Ana",
+                        "email": "ana@lightera.com",
+                        "dependents": [{"nome": "A" * 101, "idade": 5}],
+                    }
+                ],
+            )
+            data = response.get_json()
+
+            assert data["success"] is False
+            assert data["errors"][0]["errors"] == [
+                "Dependente 1: nome excede 100 caracteres"
+            ]
+            assert Dependent.query.count() == 0
+
+    def test_bulk_registration_rejects_bad_ages(self, client, test_app):
+        """Test huge, negative and absurd ages are reported per dependent."""
+        with test_app.app_context():
+            self._login(client)
+
+            response = client.post(
+                "/api/participants/bulk",
+                data='[{"nome": "Ana", "email": "ana@lightera.com", "dependents": '
+                '[{"nome": "A", "idade": 1e400}, {"nome": "B", "idade": -1}, '
+                '{"nome": "C", "idade": 500}, {"nome": "D", "idade": 17}]}]',
+                content_type="application/json",
+            )
+            data = response.get_json()
+
+            assert response.status_code != 500
+            assert data["success"] is False
+            assert data["errors"][0]["errors"] == [
+                f"Dependente {position}: idade inválida" for position in (1, 2, 3)
+            ]
+            assert Participant.query.count() == 0
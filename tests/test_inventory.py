@@ -0,0 +1,638 @@
+"""
+Unit tests for atomic inventory stock changes.
+"""
+
+import threading
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from importers import import_inventory
+from inventory import (
+    OutOfStock,
+    StockConflict,
+    add_stock,
+    current_stock,
+    deliver_items,
+    delivered_quantities,
+    delivery_roster_page,
+    reconcile_stock,
+    record_baseline,
+    remove_stock,
+    set_stock,
+    stock_at,
+    take_snapshots,
+)
+from models import (
+    DeliveryItem,
+    DeliveryLog,
+    Dependent,
+    Participant,
+    StockMovement,
+    StockSnapshot,
+)
+
+
+@pytest.fixture
+def item_id(test_app, sample_delivery_item):
+    with test_app.app_context():
+        db.session.add(sample_delivery_item)
+        db.session.commit()
+        return sample_delivery_item.id
+
+
+class TestStockChanges:
+    """Test cases for single-statement stock updates."""
+
+    def test_add_remove_set(self, test_app, item_id):
+        """Test each change returns the stock computed by the database."""
+        with test_app.app_context():
+            assert add_stock(item_id, 5) == 105
+            assert remove_stock(item_id, 30) == 75
+            assert set_stock(item_id, 10) == 10
+            db.session.commit()
+            assert current_stock(item_id) == 10
+
+    def test_remove_never_goes_negative(self, test_app, item_id):
+        """Test removing more than is left fails instead of clamping."""
+        with test_app.app_context():
+            with pytest.raises(OutOfStock) as error:
+                remove_stock(item_id, 101)
+            assert error.value.available == 100
+            assert current_stock(item_id) == 100
+            assert remove_stock(item_id, 100) == 0
+
+    def test_unknown_item(self, test_app):
+        """Test changes to missing items report None."""
+        with test_app.app_context():
+            assert remove_stock(999, 1) is None
+            assert add_stock(999, 1) is None
+
+    def test_without_returning(self, test_app, item_id):
+        """Test databases without UPDATE ... RETURNING read the stock back."""
+        with test_app.app_context():
+            with patch.object(db.engine.dialect, "update_returning", False):
+                assert remove_stock(item_id, 40) == 60
+                with pytest.raises(OutOfStock):
+                    remove_stock(item_id, 61)
+
+    def test_set_gives_up_on_conflict(self, test_app, item_id):
+        """Test overwriting a stock that keeps changing fails after a few tries."""
+        with test_app.app_context():
+            with patch("inventory._apply", return_value=None) as apply:
+                with pytest.raises(StockConflict) as error:
+                    set_stock(item_id, 10, attempts=3)
+            assert apply.call_count == error.value.attempts == 3
+            assert current_stock(item_id) == 100
+            assert db.session.scalar(select(func.count(StockMovement.id))) == 0
+
+    def test_concurrent_removals_are_exact(self, test_app, item_id):
+        """Test many threads taking from one item never oversell it."""
+        with test_app.app_context():
+            set_stock(item_id, 50)
+            db.session.commit()
+
+        taken = []
+        refused = []
+
+        def counter():
+            with test_app.app_context():
+                for _ in range(10):
+                    try:
+                        remove_stock(item_id, 1)
+                        db.session.commit()
+                        taken.append(1)
+                    except OutOfStock:
+                        db.session.rollback()
+                        refused.append(1)
+                db.session.remove()
+
+        threads = [threading.Thread(target=counter) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(taken) == 50
+        assert len(refused) == 30
+        with test_app.app_context():
+            assert current_stock(item_id) == 0
+
+
+class TestAdjustStockRoute:
+    """Test cases for the stock adjustment endpoint."""
+
+    def test_subtract_out_of_stock(self, client, test_app, item_id):
+        """Test subtracting too much is refused and leaves the stock as is."""
+        with test_app.app_context():
+            response = client.post(
+                "/api/adjust_stock",
+                json={
+                    "stock_item_id": item_id,
+                    "adjustment_type": "subtract",
+                    "adjustment_quantity": 150,
+                },
+            )
+            data = response.get_json()
+            assert data["success"] is False
+            assert data["out_of_stock"] is True
+            assert data["estoque_atual"] == 100
+
+            data = client.post(
+                "/api/adjust_stock",
+                json={
+                    "stock_item_id": item_id,
+                    "adjustment_type": "subtract",
+                    "adjustment_quantity": 30,
+                },
+            ).get_json()
+            assert data["success"] is True
+            assert data["estoque_atual"] == 70
+            assert db.session.get(DeliveryItem, item_id).estoque_atual == 70
+
+    def test_unknown_item(self, client, test_app):
+        """Test adjusting a missing item answers 404."""
+        response = client.post(
+            "/api/adjust_stock",
+            json={
+                "stock_item_id": 999,
+                "adjustment_type": "add",
+                "adjustment_quantity": 1,
+            },
+        )
+        assert response.status_code == 404
+
+    def test_set_conflict(self, client, test_app, item_id):
+        """Test a stock that keeps changing answers 409."""
+        with patch("inventory.set_stock", side_effect=StockConflict(item_id, 5)):
+            response = client.post(
+                "/api/adjust_stock",
+                json={
+                    "stock_item_id": item_id,
+                    "adjustment_type": "set",
+                    "adjustment_quantity": 10,
+                },
+            )
+        assert response.status_code == 409
+        assert response.get_json()["success"] is False
+
+
+class TestDeliverRoute:
+    """Test cases for QR-scanned deliveries."""
+
+    @pytest.fixture
+    def scan(self, client, test_app):
+        with test_app.app_context():
+            with client.session_transaction() as sess:
+                sess["admin_logged_in"] = True
+            participant = Participant(
+                nome="Ana",
+                email="ana@lightera.com",
+                matricula="M001",
+                qr_code="DLV0001",
+            )
+            outsider = Participant(
+                nome="Bruno", email="bruno@lightera.com", qr_code="DLV0002"
+            )
+            items = [
+                DeliveryItem(nome="Cesta", categoria="Cesta Básica", estoque_atual=5),
+                DeliveryItem(nome="Kit", categoria="Brinquedos", estoque_atual=1),
+            ]
+            db.session.add_all([participant, outsider, *items])
+            db.session.flush()
+            db.session.add(
+                Dependent(nome="Filho", idade=6, participant_id=participant.id)
+            )
+            db.session.commit()
+            ids = [item.id for item in items]
+
+        def post(qr_code, item_ids, **fields):
+            return client.post(
+                "/api/deliver",
+                json={"qr_code": qr_code, "item_ids": item_ids, **fields},
+            ).get_json()
+
+        return post, ids
+
+    def test_delivers_in_one_transaction(self, test_app, scan):
+        """Test stock is taken and logs are written for every item."""
+        post, ids = scan
+        with test_app.app_context():
+            data = post("dlv0001", ids, operator="Balcão 1")
+
+            assert data["success"] is True
+            assert data["participant"]["dependents_count"] == 1
+            assert [item["estoque_atual"] for item in data["items"]] == [4, 0]
+            logs = DeliveryLog.query.order_by(DeliveryLog.item_id).all()
+            assert [log.item_id for log in logs] == ids
+            assert {log.operator for log in logs} == {"Balcão 1"}
+            assert logs[0].matricula == "M001"
+
+            again = post("DLV0001", ids[:1])
+            assert again["already_delivered"] is True
+            assert current_stock(ids[0]) == 4
+
+    def test_refusals_leave_nothing_behind(self, test_app, scan):
+        """Test invalid scans and missing stock change neither stock nor logs."""
+        post, ids = scan
+        with test_app.app_context():
+            assert post("UNKNOWN", ids)["message"] == "QR Code inválido"
+            assert post("DLV0002", ids)["not_entitled"] is True
+
+            data = post("DLV0001", ids, quantity=2)
+            assert data["out_of_stock"] is True
+            assert data["item_id"] == ids[1]
+
+            assert DeliveryLog.query.count() == 0
+            assert current_stock(ids[0]) == 5
+
+    def test_check_only(self, test_app, scan):
+        """Test a validation scan reports the participant without delivering."""
+        post, ids = scan
+        with test_app.app_context():
+            data = post("DLV0001", ids[:1], check_only=True)
+            assert data["success"] is True
+            assert data["participant"]["nome"] == "Ana"
+            assert DeliveryLog.query.count() == 0
+            assert current_stock(ids[0]) == 5
+
+    def test_delivered_once_per_item(self, test_app, scan):
+        """Test the database rejects a second delivered log of an item."""
+        post, ids = scan
+        with test_app.app_context():
+            participant_id = Participant.query.filter_by(qr_code="DLV0001").one().id
+            db.session.add_all(
+                [
+                    DeliveryLog(
+                        participant_id=participant_id,
+                        item_id=ids[0],
+                        status="cancelled",
+                    ),
+                    DeliveryLog(participant_id=participant_id, item_id=ids[0]),
+                ]
+            )
+            db.session.commit()
+
+            db.session.add(DeliveryLog(participant_id=participant_id, item_id=ids[0]))
+            with pytest.raises(IntegrityError):
+                db.session.commit()
+            db.session.rollback()
+
+    def test_cancel_returns_stock(self, client, test_app, scan):
+        """Test a cancelled delivery restocks the item and can be redone."""
+        post, ids = scan
+        assert post("DLV0001", [ids[1]])["success"] is True
+
+        def cancel():
+            return client.post(
+                "/api/cancel_delivery", json={"qr_code": "DLV0001", "item_id": ids[1]}
+            ).get_json()
+
+        data = cancel()
+        assert data["success"] is True
+        assert data["estoque_atual"] == 1
+        assert cancel()["success"] is False
+        assert post("DLV0001", [ids[1]])["success"] is True
+
+        with test_app.app_context():
+            kinds = db.session.scalars(
+                select(StockMovement.kind)
+                .where(StockMovement.item_id == ids[1])
+                .order_by(StockMovement.id)
+            ).all()
+            assert kinds == ["delivery", "cancel", "delivery"]
+
+
+class TestDeliveredCounts:
+    """Test cases for aggregated delivered quantities."""
+
+    def test_aggregate_and_property(self, test_app, db_with_data):
+        """Test only delivered logs count, for all items or per item."""
+        with test_app.app_context():
+            item, other = DeliveryItem.query.order_by(DeliveryItem.id).all()
+            participant_id = Participant.query.filter_by(qr_code="QR123456").one().id
+            db.session.add_all(
+                [
+                    DeliveryLog(
+                        participant_id=participant_id,
+                        item_id=other.id,
+                        quantidade=2,
+                    ),
+                    DeliveryLog(
+                        participant_id=participant_id,
+                        item_id=other.id,
+                        quantidade=5,
+                        status="cancelled",
+                    ),
+                ]
+            )
+            db.session.commit()
+
+            assert delivered_quantities() == {item.id: 1, other.id: 2}
+            assert delivered_quantities([other.id]) == {other.id: 2}
+            assert [item.items_delivered, other.items_delivered] == [1, 2]
+
+    def test_pages_render_counts(self, client, test_app, db_with_data):
+        """Test inventory and delivery pages show the delivered quantities."""
+        with test_app.app_context():
+            with client.session_transaction() as sess:
+                sess["admin_logged_in"] = True
+            for page in ("/inventory", "/delivery"):
+                response = client.get(page)
+                assert response.status_code == 200
+
+
+class TestDeliveryRoster:
+    """Test cases for the paginated delivery list."""
+
+    @pytest.fixture
+    def roster(self, test_app):
+        with test_app.app_context():
+            participants = [
+                Participant(
+                    nome=f"Funcionário {i:02d}",
+                    email=f"funcionario{i}@lightera.com",
+                    matricula=f"M{i:03d}",
+                    qr_code=f"ROSTER{i:02d}" if i else "",
+                )
+                for i in range(12)
+            ]
+            participants.append(
+                Participant(nome="Visitante", email="v@lightera.com", qr_code="VIS")
+            )
+            items = [
+                DeliveryItem(nome="Cesta", categoria="Cesta Básica"),
+                DeliveryItem(nome="Kit", categoria="Brinquedos"),
+            ]
+            db.session.add_all(participants + items)
+            db.session.flush()
+            db.session.add_all(
+                [
+                    DeliveryLog(participant_id=participants[1].id, item_id=items[0].id),
+                    DeliveryLog(participant_id=participants[1].id, item_id=items[1].id),
+                    DeliveryLog(
+                        participant_id=participants[2].id,
+                        item_id=items[0].id,
+                        status="pending",
+                    ),
+                ]
+            )
+            db.session.commit()
+
+    def test_page_and_stats_in_one_statement(self, test_app, roster):
+        """Test a page carries its rows and the whole list's statistics."""
+        with test_app.app_context():
+            statements = []
+
+            def listener(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(db.engine, "before_cursor_execute", listener)
+            try:
+                rows, stats, matching = delivery_roster_page(page=1, per_page=5)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", listener)
+
+            assert len(statements) == 1
+            assert matching == 12
+            assert stats == {
+                "total_employees": 12,
+                "qr_generated": 11,
+                "pending_delivery": 11,
+                "delivered": 1,
+            }
+            assert [row.nome for row in rows] == [
+                f"Funcionário {i:02d}" for i in range(5)
+            ]
+            assert rows[1].delivered == 1
+            assert sorted(rows[1].item_names.split(", ")) == ["Cesta", "Kit"]
+            assert rows[2].delivered == 0
+            assert rows[3].item_names is None
+
+            rows, _, _ = delivery_roster_page(page=3, per_page=5)
+            assert [row.matricula for row in rows] == ["M010", "M011"]
+
+    def test_search_and_empty_page(self, test_app, roster):
+        """Test search narrows the rows but not the statistics."""
+        with test_app.app_context():
+            rows, stats, matching = delivery_roster_page(search="m01")
+            assert [row.matricula for row in rows] == ["M010", "M011"]
+            assert matching == 2
+            assert stats["total_employees"] == 12
+
+            rows, stats, matching = delivery_roster_page(search="100%")
+            assert rows == []
+            assert matching == 0
+            assert stats["delivered"] == 1
+
+    def test_page_renders(self, client, test_app, roster):
+        """Test the page renders item names and the pagination controls."""
+        with test_app.app_context():
+            with client.session_transaction() as sess:
+                sess["admin_logged_in"] = True
+            html = client.get("/entregas?per_page=5&page=1").get_data(as_text=True)
+            assert "Mostrando 1–5 de 12" in html
+            assert "page=2" in html
+            assert "Kit</span>" in html
+
+
+class TestStockLedger:
+    """Test cases for the stock movement ledger and reconciliation."""
+
+    def test_every_change_is_recorded(self, test_app, item_id):
+        """Test each change appends its signed quantity and resulting stock."""
+        with test_app.app_context():
+            assert record_baseline() == 1
+            assert record_baseline() == 0
+            add_stock(item_id, 5, operator="admin")
+            remove_stock(item_id, 30)
+            set_stock(item_id, 10)
+            set_stock(item_id, 10)
+            with pytest.raises(OutOfStock):
+                remove_stock(item_id, 11)
+            db.session.commit()
+
+            movements = db.session.execute(
+                select(
+                    StockMovement.kind,
+                    StockMovement.quantidade,
+                    StockMovement.estoque_atual,
+                ).order_by(StockMovement.id)
+            ).all()
+            assert movements == [
+                ("initial", 100, 100),
+                ("add", 5, 105),
+                ("subtract", -30, 75),
+                ("set", -65, 10),
+            ]
+            assert stock_at(item_id) == 10
+
+    def test_stock_at_uses_nearest_snapshot(self, test_app, item_id):
+        """Test past stock is rebuilt from a snapshot and the later movements."""
+        with test_app.app_context():
+            record_baseline()
+            remove_stock(item_id, 40)
+            db.session.commit()
+            assert take_snapshots(settle=0) == 1
+            assert take_snapshots(settle=0) == 0
+            db.session.commit()
+
+            add_stock(item_id, 15)
+            db.session.commit()
+            db.session.execute(
+                update(StockMovement)
+                .where(StockMovement.kind == "add")
+                .values(created_at=datetime(2099, 1, 2))
+            )
+            db.session.commit()
+
+            snapshot = db.session.scalars(select(StockSnapshot)).one()
+            assert (snapshot.estoque_atual, snapshot.movement_id) == (60, 2)
+            assert stock_at(item_id) == 75
+            assert stock_at(item_id, datetime(2099, 1, 1)) == 60
+            assert stock_at(item_id, datetime(2000, 1, 1)) == 0
+            assert stock_at(999) is None
+
+    def test_recent_movements_wait_for_next_snapshot(self, test_app, item_id):
+        """Test movements still settling are left out of snapshots."""
+        with test_app.app_context():
+            record_baseline()
+            db.session.commit()
+            assert take_snapshots(settle=3600) == 0
+
+    def test_reconcile_finds_untracked_changes(self, test_app, db_with_data):
+        """Test stock written around the ledger is reported per category."""
+        with test_app.app_context():
+            record_baseline()
+            kit_id = DeliveryItem.query.filter_by(nome="Kit Escolar").one().id
+            deliver_items("QR123456", [kit_id])
+            db.session.commit()
+            assert all(row["mismatched"] == 0 for row in reconcile_stock())
+
+            db.session.execute(
+                update(DeliveryItem)
+                .where(DeliveryItem.id == kit_id)
+                .values(estoque_atual=3)
+            )
+            db.session.commit()
+
+            statements = []
+            listener = lambda *args: statements.append(args[2])  # noqa: E731
+            event.listen(db.engine, "before_cursor_execute", listener)
+            try:
+                rows = reconcile_stock()
+            finally:
+                event.remove(db.engine, "before_cursor_execute", listener)
+
+            assert len(statements) == 1
+            assert [row["mismatched"] for row in rows] == [0, 1]
+            assert rows[1] == {
+                "categoria": "Material Escolar",
+                "items": 1,
+                "estoque_atual": 3,
+                "ledger": 44,
+                "mismatched": 1,
+                "mismatched_items": ["Kit Escolar"],
+            }
+            assert reconcile_stock("Festa") == []
+
+    def test_new_and_imported_items_start_their_ledger(self, client, test_app):
+        """Test items added by hand or by import need no baseline."""
+        with test_app.app_context():
+            with client.session_transaction() as sess:
+                sess["admin_logged_in"] = True
+            client.post(
+                "/api/add_item",
+                json={
+                    "nome": "Bola",
+                    "categoria": "Brinquedos",
+                    "estoque_inicial": 10,
+                    "estoque_atual": 10,
+                },
+            )
+            import_inventory(
+                [
+                    (
+                        2,
+                        {
+                            "nome": "Bola",
+                            "categoria": "Brinquedos",
+                            "estoque_atual": "4",
+                        },
+                    ),
+                    (
+                        3,
+                        {
+                            "nome": "Lápis",
+                            "categoria": "Material Escolar",
+                            "estoque_atual": "7",
+                        },
+                    ),
+                ],
+                update_stock=True,
+            )
+
+            assert all(row["mismatched"] == 0 for row in reconcile_stock())
+            assert record_baseline() == 0
+            kinds = db.session.scalars(
+                select(StockMovement.kind).order_by(StockMovement.id)
+            ).all()
+            assert sorted(kinds) == ["import", "initial", "initial"]
+
+    def test_import_sees_concurrent_delivery(self, test_app, item_id):
+        """Test a delivery racing a stock import is not lost from the ledger."""
+        with test_app.app_context():
+            record_baseline()
+            db.session.commit()
+            items = DeliveryItem.__table__
+            movements = StockMovement.__table__
+            raced = []
+
+            def deliver_first(conn, cursor, statement, *args):
+                if raced or not statement.startswith("UPDATE delivery_item"):
+                    return
+                raced.append(statement)
+                # Another counter, between the import's read and its write
+                with db.engine.begin() as other:
+                    other.execute(
+                        update(items)
+                        .where(items.c.id == item_id)
+                        .values(estoque_atual=items.c.estoque_atual - 1)
+                    )
+                    other.execute(
+                        insert(movements).values(
+                            item_id=item_id,
+                            kind="delivery",
+                            quantidade=-1,
+                            estoque_atual=99,
+                        )
+                    )
+
+            event.listen(db.engine, "before_cursor_execute", deliver_first)
+            try:
+                import_inventory(
+                    [
+                        (
+                            2,
+                            {
+                                "nome": "Cesta Básica",
+                                "categoria": "Cesta Básica",
+                                "estoque_atual": "40",
+                            },
+                        )
+                    ],
+                    update_stock=True,
+                )
+            finally:
+                event.remove(db.engine, "before_cursor_execute", deliver_first)
+
+            assert raced
+            assert current_stock(item_id) == 40
+            assert all(row["mismatched"] == 0 for row in reconcile_stock())
+            assert db.session.scalars(
+                select(StockMovement.quantidade).where(StockMovement.kind == "import")
+            ).all() == [-59]
@@ -0,0 +1,199 @@
+"""
+Unit tests for the pooled SMTP sender.
+"""
+
+import smtplib
+import time
+from email.mime.text import MIMEText
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from mailer import (
+    DailyLimitReached,
+    SMTPPool,
+    TokenBucket,
+    close_smtp_pools,
+    dispatch,
+    get_smtp_pool,
+)
+
+
+def make_message():
+    msg = MIMEText("Olá", "plain")
+    msg["From"] = "undokai@lightera.com"
+    msg["To"] = "joao.silva@lightera.com"
+    msg["Subject"] = "UNDOKAI"
+    return msg
+
+
+@patch("mailer.smtplib.SMTP")
+class TestSMTPPool:
+    """Test cases for connection reuse, recycling and reconnection."""
+
+    def test_reuses_authenticated_connection(self, mock_smtp):
+        """Test many messages share one login."""
+        pool = SMTPPool("smtp.test", 587, "user", "secret")
+        for _ in range(5):
+            pool.send_message(make_message())
+
+        mock_smtp.assert_called_once()
+        mock_smtp.return_value.login.assert_called_once_with("user", "secret")
+        assert mock_smtp.return_value.send_message.call_count == 5
+        assert pool.stats()["connections"] == 1
+
+    def test_recycles_after_max_messages(self, mock_smtp):
+        """Test connections are closed after N messages."""
+        pool = SMTPPool("smtp.test", 587, "user", "secret", max_messages=2)
+        for _ in range(5):
+            pool.send_message(make_message())
+
+        assert mock_smtp.call_count == 3
+        assert mock_smtp.return_value.quit.call_count == 2
+
+    def test_reconnects_on_421(self, mock_smtp):
+        """Test a 421 reply reconnects and resends the message."""
+        dropped, fresh = MagicMock(), MagicMock()
+        dropped.send_message.side_effect = smtplib.SMTPDataError(421, b"Try later")
+        mock_smtp.side_effect = [dropped, fresh]
+
+        pool = SMTPPool("smtp.test", 587, "user", "secret")
+        pool.send_message(make_message())
+
+        fresh.send_message.assert_called_once()
+        assert pool.stats()["reconnects"] == 1
+
+    def test_reconnects_on_timeout(self, mock_smtp):
+        """Test a dropped connection is replaced transparently."""
+        dropped, fresh = MagicMock(), MagicMock()
+        dropped.send_message.side_effect = smtplib.SMTPServerDisconnected()
+        mock_smtp.side_effect = [dropped, fresh]
+
+        pool = SMTPPool("smtp.test", 587, "user", "secret")
+        pool.send_message(make_message())
+
+        fresh.send_message.assert_called_once()
+
+    def test_refused_recipient_keeps_connection(self, mock_smtp):
+        """Test a refused recipient raises without dropping the session."""
+        server = mock_smtp.return_value
+        server.send_message.side_effect = [
+            smtplib.SMTPRecipientsRefused({"x@y": (550, b"No such user")}),
+            None,
+        ]
+
+        pool = SMTPPool("smtp.test", 587, "user", "secret")
+        with pytest.raises(smtplib.SMTPRecipientsRefused):
+            pool.send_message(make_message())
+        pool.send_message(make_message())
+
+        mock_smtp.assert_called_once()
+
+    def test_replaces_idle_connection(self, mock_smtp):
+        """Test connections idle for too long are not reused."""
+        pool = SMTPPool("smtp.test", 587, "user", "secret", idle_timeout=0)
+        pool.send_message(make_message())
+        pool.send_message(make_message())
+
+        assert mock_smtp.call_count == 2
+
+
+class TestPoolRegistry:
+    """Test cases for the per-configuration pools."""
+
+    @patch.dict("os.environ", {}, clear=True)
+    def test_no_pool_without_credentials(self):
+        """Test senders can detect missing credentials."""
+        assert get_smtp_pool() is None
+
+    @patch.dict(
+        "os.environ",
+        {"SMTP_SERVER": "smtp.test", "SMTP_USERNAME": "u", "SMTP_PASSWORD": "p"},
+    )
+    def test_pool_is_shared(self):
+        """Test callers share the pool of the same configuration."""
+        assert get_smtp_pool() is get_smtp_pool()
+        pool = get_smtp_pool()
+        close_smtp_pools()
+        assert get_smtp_pool() is not pool
+
+    @patch.dict(
+        "os.environ",
+        {"SMTP_USERNAME": "u", "SMTP_PASSWORD": "p", "SMTP_STARTTLS": "0"},
+    )
+    def test_starttls_can_be_disabled(self):
+        """Test local relays can be used without TLS."""
+        assert get_smtp_pool().starttls is False
+
+
+class TestDispatcher:
+    """Test cases for rate-limited concurrent sending."""
+
+    def test_token_bucket_rate(self):
+        """Test sends beyond the burst wait for tokens."""
+        bucket = TokenBucket(rate=50, burst=1)
+        start = time.perf_counter()
+        for _ in range(6):
+            bucket.acquire()
+        assert time.perf_counter() - start >= 0.09
+
+    def test_daily_limit(self):
+        """Test the quota counts earlier sends and stops new ones."""
+        bucket = TokenBucket(rate=1000, daily_limit=3, sent_today=2)
+        bucket.acquire()
+        with pytest.raises(DailyLimitReached):
+            bucket.acquire()
+
+    def test_throttling_halves_rate(self):
+        """Test 4xx replies slow down and successes recover."""
+        bucket = TokenBucket(rate=8)
+        bucket.throttled()
+        bucket.throttled()
+        assert bucket.rate == 2
+        bucket.succeeded()
+        assert bucket.rate == 2.4
+
+    def test_dispatch_sends_everything(self):
+        """Test every item is sent once across threads."""
+        sent = []
+        results = list(
+            dispatch(range(50), sent.append, TokenBucket(rate=10000), concurrency=4)
+        )
+
+        assert sorted(sent) == list(range(50))
+        assert all(error is None for _, error in results)
+
+    def test_dispatch_retries_throttled(self):
+        """Test throttled sends back off and are retried."""
+        attempts = []
+
+        def send(item):
+            attempts.append(item)
+            if len(attempts) == 1:
+                raise smtplib.SMTPDataError(451, b"Rate limited")
+
+        bucket = TokenBucket(rate=10000)
+        results = list(dispatch(["a"], send, bucket, concurrency=1, backoff=0))
+
+        assert attempts == ["a", "a"]
+        assert results == [("a", None)]
+        assert bucket.sent_today == 1
+
+    def test_dispatch_reports_permanent_errors(self):
+        """Test 5xx errors are not retried."""
+        error = smtplib.SMTPDataError(550, b"Rejected")
+
+        def send(item):
+            raise error
+
+        results = list(dispatch(["a"], send, TokenBucket(rate=10000), backoff=0))
+        assert results == [("a", error)]
+
+    def test_dispatch_stops_at_daily_limit(self):
+        """Test items past the quota are left unconsumed."""
+        items = iter(range(100))
+        bucket = TokenBucket(rate=10000, daily_limit=5)
+        results = list(dispatch(items, lambda item: None, bucket, concurrency=2))
+
+        assert sum(error is None for _, error in results) == 5
+        assert len(results) < 100
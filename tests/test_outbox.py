@@ -0,0 +1,244 @@
+"""
+Unit tests for the email outbox.
+"""
+
+import smtplib
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from unittest.mock import patch
+
+import pytest
+
+from app import db
+from mailer import TokenBucket
+from models import EmailLog, EmailOutbox, Participant
+from outbox import (
+    claim_batch,
+    complete_batch,
+    enqueue_emails,
+    not_queued,
+    process_outbox,
+    renew_lease,
+)
+
+
+class FakePool:
+    """Stand-in for SMTPPool failing for chosen recipients."""
+
+    username = "undokai@lightera.com"
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+
+    def send_message(self, msg):
+        error = self.errors.get(msg["To"])
+        if error:
+            raise error
+        self.sent.append(msg["To"])
+
+
+def build(participant, sender, payload_ref):
+    msg = MIMEText(f"Olá {participant.nome}")
+    msg["From"] = sender
+    msg["To"] = participant.email
+    msg["Subject"] = f"UNDOKAI {payload_ref or ''}".strip()
+    return msg
+
+
+@pytest.fixture
+def participants(test_app):
+    with test_app.app_context():
+        rows = [
+            Participant(
+                nome=f"Participante {i}",
+                email=f"participante{i}@lightera.com",
+                qr_code=f"QR{i:06d}",
+            )
+            for i in range(4)
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+class TestOutboxQueue:
+    """Test cases for queueing and claiming outbox rows."""
+
+    def test_enqueue_skips_active_rows(self, test_app, participants):
+        """Test participants are not queued twice for the same type."""
+        with test_app.app_context():
+            assert enqueue_emails(participants, "qr_delivery") == 4
+            assert enqueue_emails(participants + participants, "qr_delivery") == 0
+            assert enqueue_emails(participants[:1], "reminder", "1") == 1
+            db.session.commit()
+
+            pending = db.session.query(Participant.id).filter(not_queued("qr_delivery"))
+            assert pending.count() == 0
+
+    def test_not_queued_matches_payload(self, test_app, participants):
+        """Test sent rows count only for the same reminder payload."""
+        with test_app.app_context():
+            enqueue_emails(participants[:2], "reminder", "1")
+            db.session.execute(db.update(EmailOutbox).values(status="sent"))
+            db.session.commit()
+
+            def pending(payload_ref):
+                return db.session.query(Participant.id).filter(
+                    not_queued("reminder", payload_ref, ("pending", "sent"))
+                )
+
+            assert pending("1").count() == 2
+            assert pending("3").count() == 4
+            assert (
+                db.session.query(Participant.id).filter(not_queued("reminder")).count()
+                == 4
+            )
+
+    def test_claim_leases_rows_once(self, test_app, participants):
+        """Test claimed rows are not handed to another worker."""
+        with test_app.app_context():
+            enqueue_emails(participants, "qr_delivery")
+            db.session.commit()
+
+            first = claim_batch(limit=3)
+            assert len(first) == 3
+            assert {row.status for row in first} == {"sending"}
+            assert len(claim_batch(limit=3)) == 1
+            assert claim_batch() == []
+
+    def test_expired_lease_is_reclaimed(self, test_app, participants):
+        """Test rows of a crashed worker become claimable again."""
+        with test_app.app_context():
+            enqueue_emails(participants[:1], "qr_delivery")
+            db.session.commit()
+
+            row = claim_batch()[0]
+            row.locked_until = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+
+            assert [reclaimed.id for reclaimed in claim_batch()] == [row.id]
+
+    def test_lost_lease_keeps_new_owner(self, test_app, participants):
+        """Test a worker whose lease expired does not overwrite the new lease."""
+        with test_app.app_context():
+            enqueue_emails(participants[:1], "qr_delivery")
+            db.session.commit()
+
+            row = claim_batch()[0]
+            leases = {row.id: row.lease_token}
+            row.locked_until = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+            token = claim_batch()[0].lease_token
+
+            counts = complete_batch([(row, "UNDOKAI", None)], leases=leases)
+
+            assert counts["sent"] == 0
+            row = db.session.get(EmailOutbox, row.id)
+            assert (row.status, row.lease_token) == ("sending", token)
+            assert EmailLog.query.count() == 0
+
+    def test_renewed_lease_is_not_reclaimed(self, test_app, participants):
+        """Test renewing keeps rows away from other workers."""
+        with test_app.app_context():
+            enqueue_emails(participants[:2], "qr_delivery")
+            db.session.commit()
+
+            rows = claim_batch()
+            token = rows[0].lease_token
+            for row in rows:
+                row.locked_until = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+
+            assert renew_lease(token) == 2
+            assert claim_batch() == []
+            assert renew_lease("lost") == 0
+
+
+class TestOutboxWorker:
+    """Test cases for sending queued emails."""
+
+    def test_sends_and_logs_in_batch(self, test_app, participants):
+        """Test sent rows are marked and logged."""
+        with test_app.app_context():
+            enqueue_emails(participants, "qr_delivery")
+            db.session.commit()
+
+            pool = FakePool()
+            totals = process_outbox(
+                {"qr_delivery": build}, pool, TokenBucket(rate=1000), batch_size=3
+            )
+
+            assert totals["sent"] == 4
+            assert len(pool.sent) == 4
+            assert EmailOutbox.query.filter_by(status="sent").count() == 4
+            assert EmailLog.query.filter_by(status="sent").count() == 4
+
+    def test_lease_renewed_while_sending(self, test_app, participants):
+        """Test a batch slower than its lease keeps renewing it."""
+        with test_app.app_context():
+            enqueue_emails(participants, "qr_delivery")
+            db.session.commit()
+
+            with patch("outbox.renew_lease", wraps=renew_lease) as renew:
+                totals = process_outbox(
+                    {"qr_delivery": build},
+                    FakePool(),
+                    TokenBucket(rate=1000),
+                    batch_size=4,
+                    lease_seconds=0,
+                )
+
+            assert totals["sent"] == 4
+            assert renew.call_count == 4
+            assert EmailOutbox.query.filter_by(status="sent").count() == 4
+
+    def test_failures_retry_with_backoff(self, test_app, participants):
+        """Test temporary errors are rescheduled and permanent ones fail."""
+        with test_app.app_context():
+            enqueue_emails(participants[:2], "qr_delivery")
+            db.session.commit()
+
+            pool = FakePool(
+                {
+                    "participante0@lightera.com": ConnectionResetError("reset"),
+                    "participante1@lightera.com": smtplib.SMTPRecipientsRefused(
+                        {"participante1@lightera.com": (550, b"No such user")}
+                    ),
+                }
+            )
+            totals = process_outbox(
+                {"qr_delivery": build}, pool, TokenBucket(rate=1000)
+            )
+            assert totals == {"sent": 0, "retry": 1, "failed": 1, "deferred": 0}
+
+            retry = EmailOutbox.query.filter_by(participant_id=participants[0]).one()
+            assert retry.status == "pending"
+            assert retry.attempts == 1
+            assert retry.next_attempt_at > datetime.utcnow()
+            assert retry.lease_token is None
+
+            failed = EmailOutbox.query.filter_by(participant_id=participants[1]).one()
+            assert failed.status == "failed"
+            assert EmailLog.query.filter_by(status="failed").count() == 1
+
+            # Not due yet
+            assert claim_batch() == []
+
+    def test_daily_limit_keeps_rows_queued(self, test_app, participants):
+        """Test rows past the quota stay pending without an attempt."""
+        with test_app.app_context():
+            enqueue_emails(participants, "qr_delivery")
+            db.session.commit()
+
+            totals = process_outbox(
+                {"qr_delivery": build},
+                FakePool(),
+                TokenBucket(rate=1000, daily_limit=2),
+                concurrency=1,
+            )
+
+            assert totals["sent"] == 2
+            assert totals["deferred"] == 2
+            deferred = EmailOutbox.query.filter_by(status="pending").all()
+            assert [row.attempts for row in deferred] == [0, 0]
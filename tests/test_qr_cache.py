@@ -0,0 +1,158 @@
+"""
+Unit tests for the rendered QR code cache.
+"""
+
+import io
+import os
+from unittest.mock import patch
+
+import pytest
+import qrcode
+from PIL import Image
+
+from qr_cache import (
+    QRCache,
+    cache_key,
+    qr_matrix,
+    rasterize_png,
+    render_qr,
+    render_svg,
+    resolve_profile,
+)
+
+
+class TestQRCache:
+    """Test cases for the two-tier QR cache."""
+
+    def test_render_qr_png(self):
+        """Test rendering produces a PNG image."""
+        image = Image.open(io.BytesIO(render_qr("TEST123")))
+        assert image.format == "PNG"
+
+    def test_cache_key_depends_on_all_parameters(self):
+        """Test each parameter produces a distinct key."""
+        keys = {
+            cache_key("A"),
+            cache_key("B"),
+            cache_key("A", size=5),
+            cache_key("A", border=2),
+        }
+        assert len(keys) == 4
+
+    def test_memory_and_disk_tiers(self, tmp_path):
+        """Test misses render once and later lookups hit a tier."""
+        cache = QRCache(directory=str(tmp_path), max_entries=10)
+
+        first = cache.get("QR123456")
+        second = cache.get("QR123456")
+        assert first == second
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["memory_hits"] == 1
+        assert cache.contains("QR123456")
+
+        # A second worker shares the directory but not the memory tier
+        other = QRCache(directory=str(tmp_path), max_entries=10)
+        assert other.get("QR123456") == first
+        assert other.stats()["disk_hits"] == 1
+        assert other.stats()["misses"] == 0
+
+    def test_lru_eviction(self, tmp_path):
+        """Test the memory tier is bounded and evicts least recently used."""
+        cache = QRCache(directory=None, max_entries=2)
+
+        cache.get("A")
+        cache.get("B")
+        cache.get("A")
+        cache.get("C")
+
+        assert cache.stats()["memory_entries"] == 2
+        cache.get("A")
+        assert cache.stats()["memory_hits"] == 2
+        cache.get("B")
+        assert cache.stats()["misses"] == 4
+
+    def test_disk_store_is_content_addressed(self, tmp_path):
+        """Test files are stored under their cache key without temp leftovers."""
+        cache = QRCache(directory=str(tmp_path))
+        cache.get("QR123456", size=5)
+
+        key = cache_key("QR123456", size=5)
+        assert os.path.exists(cache.path_for(key))
+        leftovers = [f for _, _, files in os.walk(tmp_path) for f in files]
+        assert leftovers == [f"{key}.png"]
+
+
+class TestQRRenderers:
+    """Test cases for the matrix-based PNG and SVG renderers."""
+
+    def _legacy_pixels(self, data, size, border):
+        qr = qrcode.QRCode(
+            version=1,
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=size,
+            border=border,
+        )
+        qr.add_data(data)
+        qr.make(fit=True)
+        img = qr.make_image(fill_color="black", back_color="white").get_image()
+        return img.convert("L").tobytes()
+
+    def _pixels(self, png):
+        return Image.open(io.BytesIO(png)).convert("L").tobytes()
+
+    def test_png_matches_qrcode_image_factory(self):
+        """Test the vectorized raster is pixel-identical to qrcode's output."""
+        png = render_qr("QR123456", size=7, border=2)
+        assert self._pixels(png) == self._legacy_pixels("QR123456", 7, 2)
+
+    def test_png_without_numpy(self):
+        """Test the PIL-only fallback produces the same pixels."""
+        matrix = qr_matrix("QR123456")
+        expected = self._pixels(rasterize_png(matrix, 3))
+
+        with patch("qr_cache.np", None):
+            assert self._pixels(rasterize_png(matrix, 3)) == expected
+
+    def test_svg_merges_runs(self):
+        """Test SVG rectangles cover exactly the dark runs of each row."""
+        matrix = [
+            [False, True, True, False],
+            [True, True, True, True],
+            [False, False, False, False],
+            [True, False, True, False],
+        ]
+
+        svg = render_svg(matrix, size=5).decode()
+
+        assert 'width="20"' in svg
+        assert 'viewBox="0 0 4 4"' in svg
+        assert "M1 0h2v1h-2zM0 1h4v1h-4zM0 3h1v1h-1zM2 3h1v1h-1z" in svg
+
+
+class TestQRProfiles:
+    """Test cases for QR encoding profiles."""
+
+    def test_profile_settings(self):
+        """Test profiles set error correction and quiet zone."""
+        assert resolve_profile("compact") == ("L", 2)
+        assert resolve_profile("robust") == ("Q", 4)
+        assert resolve_profile("robust", border=1) == ("Q", 1)
+
+        with pytest.raises(ValueError):
+            resolve_profile("unknown")
+
+    def test_quiet_zone_and_minimal_version(self):
+        """Test participant codes fit version 1 (21 modules) plus quiet zone."""
+        assert len(qr_matrix("QR123456", profile="compact")) == 21 + 2 * 2
+        assert len(qr_matrix("QR123456", profile="robust")) == 21 + 2 * 4
+
+    def test_participant_codes_use_alphanumeric_mode(self):
+        """Test participant codes need no byte-mode segment."""
+        qr = qrcode.QRCode()
+        qr.add_data("A1B2C3D4")
+        assert [chunk.mode for chunk in qr.data_list] == [qrcode.util.MODE_ALPHA_NUM]
+
+    def test_cache_key_depends_on_profile(self):
+        """Test profiles with different settings do not share cache entries."""
+        assert cache_key("A", profile="standard") != cache_key("A", profile="robust")
+        assert cache_key("A", profile="standard") == cache_key("A", border=4)
@@ -2,6 +2,7 @@
 Unit tests for Flask routes and API endpoints.
 """
 
+import io
 import json
 from unittest.mock import MagicMock, patch
 
@@ -409,6 +410,225 @@ class TestDeliveryRoutes:
             assert response.status_code == 200
 
 
+class TestBulkSelectionRoutes:
+    """Test cases for bulk operations on selected participants."""
+
+    def _login(self, client):
+        with client.session_transaction() as sess:
+            sess["admin_logged_in"] = True
+            sess["admin_username"] = "admin"
+
+    def _create_participants(self, count):
+        participants = [
+            Participant(
+                nome=f"Participante {i}",
+                email=f"participante{i}@lightera.com",
+                qr_code=f"BULK{i:04d}",
+            )
+            for i in range(count)
+        ]
+        db.session.add_all(participants)
+        db.session.commit()
+        return [p.id for p in participants]
+
+    def test_bulk_checkin_counts(self, client, test_app, db_with_data):
+        """Test bulk check-in separates new, existing and unknown participants."""
+        with test_app.app_context():
+            self._login(client)
+            new_ids = self._create_participants(3)
+            checked_id = Participant.query.filter_by(qr_code="QR123456").first().id
+
+            response = client.post(
+                "/api/bulk_checkin",
+                json={
+                    "participant_ids": new_ids + [new_ids[0], checked_id, 99999],
+                    "station": "lote",
+                },
+            )
+            data = response.get_json()
+
+            assert data["success"] is True
+            assert data["stats"] == {"success": 3, "already_checked": 2, "errors": 1}
+            assert CheckIn.query.filter_by(station="lote").count() == 3
+
+    @pytest.mark.parametrize("threshold", [500, 2])
+    def test_export_selected_single_query_paths(self, client, test_app, threshold):
+        """Test export for both the IN clause and the staged-ids path."""
+        import pandas as pd
+
+        with test_app.app_context():
+            self._login(client)
+            ids = self._create_participants(5)
+            db.session.add(Dependent(nome="Filho", idade=5, participant_id=ids[1]))
+            db.session.add(CheckIn(participant_id=ids[1], station="main"))
+            db.session.commit()
+
+            with patch("utils.LARGE_SELECTION_THRESHOLD", threshold):
+                response = client.post(
+                    "/api/export_selected", json={"participant_ids": ids[:4]}
+                )
+
+            assert response.status_code == 200
+            df = pd.read_excel(io.BytesIO(response.data))
+            assert list(df["QR Code"]) == [
+                "BULK0000",
+                "BULK0001",
+                "BULK0002",
+                "BULK0003",
+            ]
+            assert list(df["Dependentes"]) == [0, 1, 0, 0]
+            assert df["Status"][1] == "Check-in realizado"
+            assert df["Estação"][1] == "main"
+
+    def test_bulk_checkin_large_selection(self, client, test_app):
+        """Test bulk check-in through the temporary table path."""
+        with test_app.app_context():
+            self._login(client)
+            ids = self._create_participants(10)
+
+            with patch("utils.LARGE_SELECTION_THRESHOLD", 3):
+                response = client.post(
+                    "/api/bulk_checkin", json={"participant_ids": ids}
+                )
+
+            assert response.get_json()["stats"]["success"] == 10
+            assert CheckIn.query.count() == 10
+
+
+class TestDeliveryQRCampaign:
+    """Test cases for queueing delivery QR code emails."""
+
+    def test_queue_and_progress(self, client, test_app):
+        """Test the route queues a campaign and reports per-state counts."""
+        from models import EmailCampaign, EmailOutbox
+
+        with test_app.app_context():
+            with client.session_transaction() as sess:
+                sess["admin_logged_in"] = True
+                sess["admin_username"] = "admin"
+            db.session.add_all(
+                [
+                    Participant(
+                        nome="Sem QR",
+                        email="semqr@lightera.com",
+                        matricula="M001",
+                        qr_code="",
+                    ),
+                    Participant(
+                        nome="Com QR",
+                        email="comqr@lightera.com",
+                        matricula="M002",
+                        qr_code="DLV0002",
+                    ),
+                    Participant(
+                        nome="Fora da lista",
+                        email="fora@lightera.com",
+                        qr_code="DLV0003",
+                    ),
+                ]
+            )
+            db.session.commit()
+
+            response = client.post("/api/send_delivery_qrcodes")
+            data = response.get_json()
+
+            assert response.status_code == 202
+            assert client.get(data["progress_url"]).get_json()["state"] == "queued"
+            assert data["queued"] == 2
+            assert data["generated"] == 1
+            assert Participant.query.filter_by(qr_code="").count() == 0
+            assert db.session.get(EmailCampaign, data["job_id"]).created_by == "admin"
+
+            row = EmailOutbox.query.filter_by(campaign_id=data["job_id"]).first()
+            row.status = "sent"
+            db.session.commit()
+
+            progress = client.get(data["progress_url"]).get_json()
+            assert progress["counts"] == {
+                "pending": 1,
+                "sending": 0,
+                "sent": 1,
+                "failed": 0,
+            }
+            assert progress["done"] is False
+            assert progress["state"] == "sending"
+
+            assert client.get("/api/send_delivery_qrcodes/999").status_code == 404
+
+    def test_requeue_after_spooling(self, client, test_app, tmp_path):
+        """Test a second campaign skips rows the spooler already rendered."""
+        from sqlalchemy import select
+
+        from models import EmailOutbox
+        from spool import spool_pending
+
+        with test_app.app_context():
+            with client.session_transaction() as sess:
+                sess["admin_logged_in"] = True
+            db.session.add(
+                Participant(
+                    nome="Com QR",
+                    email="comqr@lightera.com",
+                    matricula="M002",
+                    qr_code="DLV0002",
+                )
+            )
+            db.session.commit()
+
+            assert client.post("/api/send_delivery_qrcodes").get_json()["queued"] == 1
+            spool_pending("undokai@lightera.com", str(tmp_path), workers=1)
+            assert client.post("/api/send_delivery_qrcodes").get_json()["queued"] == 0
+
+            rows = db.session.execute(
+                select(EmailOutbox.status, EmailOutbox.payload_ref)
+            ).all()
+            assert [tuple(row) for row in rows] == [("pending", "1.eml")]
+
+
+class TestQRImageRoutes:
+    """Test cases for the binary QR image endpoint."""
+
+    def test_qr_png_with_immutable_caching(self, client, test_app, db_with_data):
+        """Test PNG bytes are served with a strong ETag and immutable caching."""
+        with test_app.app_context():
+            response = client.get("/qr/QR123456.png")
+
+            assert response.status_code == 200
+            assert response.mimetype == "image/png"
+            assert response.data.startswith(b"\x89PNG")
+            assert "immutable" in response.headers["Cache-Control"]
+            etag = response.headers["ETag"]
+            assert not etag.startswith("W/")
+
+            response = client.get("/qr/QR123456.png", headers={"If-None-Match": etag})
+            assert response.status_code == 304
+            assert response.data == b""
+
+    def test_qr_svg(self, client, test_app, db_with_data):
+        """Test the SVG variant of the endpoint."""
+        with test_app.app_context():
+            response = client.get("/qr/QR123456.svg")
+
+            assert response.status_code == 200
+            assert response.mimetype == "image/svg+xml"
+            assert b"<svg" in response.data
+
+    def test_qr_unknown_code(self, client, test_app):
+        """Test codes that belong to nobody are not rendered."""
+        with test_app.app_context():
+            response = client.get("/qr/NOPE0000.png")
+            assert response.status_code == 404
+
+    def test_lookup_returns_image_url(self, client, test_app, db_with_data):
+        """Test the lookup API references the image by URL."""
+        with test_app.app_context():
+            response = client.post(
+                "/api/lookup_participant_by_email",
+                json={"email": "joao.silva@lightera.com"},
+            )
+            assert response.get_json()["qr_image"] == "/qr/QR123456.png"
+
+
 class TestHealthEndpoint:
     """Test cases for health check endpoint."""
 
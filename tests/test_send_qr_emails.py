@@ -0,0 +1,108 @@
+"""
+Unit tests for queueing reminder emails in scripts/send_qr_emails.py.
+"""
+
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"
+    ),
+)
+
+from unittest.mock import patch
+
+import pytest
+from send_qr_emails import (
+    BUILDERS,
+    build_qr_message,
+    load_reminder_checkpoint,
+    queue_reminders,
+    run_worker,
+    save_reminder_checkpoint,
+)
+from sqlalchemy import select
+
+from app import db
+from models import EmailOutbox, Participant
+from outbox import enqueue_emails
+
+
+@pytest.fixture
+def participants(test_app):
+    with test_app.app_context():
+        rows = [
+            Participant(
+                nome=f"Participante {i}",
+                email=f"participante{i}@lightera.com",
+                qr_code=f"QR{i:06d}",
+            )
+            for i in range(3)
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+class TestQueueReminders:
+    """Test cases for chunked, checkpointed reminder queueing."""
+
+    def test_each_day_count_is_queued(self, test_app, participants, tmp_path):
+        """Test a pending 3-day reminder does not block the 1-day one."""
+        checkpoint = str(tmp_path / "checkpoint.json")
+        with test_app.app_context():
+            assert queue_reminders(3, chunk_size=2, checkpoint_path=checkpoint) == 3
+            assert queue_reminders(1, chunk_size=2, checkpoint_path=checkpoint) == 3
+            assert queue_reminders(1, chunk_size=2, checkpoint_path=checkpoint) == 0
+
+            rows = db.session.execute(
+                select(EmailOutbox.participant_id, EmailOutbox.payload_ref)
+            ).all()
+            assert sorted(rows) == sorted(
+                (participant_id, days)
+                for participant_id in participants
+                for days in ("1", "3")
+            )
+            assert not os.path.exists(checkpoint)
+
+    def test_resumes_after_checkpoint(self, test_app, participants, tmp_path):
+        """Test a rerun skips participants already scanned."""
+        checkpoint = str(tmp_path / "checkpoint.json")
+        save_reminder_checkpoint(1, participants[1], checkpoint)
+        assert load_reminder_checkpoint(1, checkpoint) == participants[1]
+        assert load_reminder_checkpoint(3, checkpoint) == 0
+
+        with test_app.app_context():
+            assert queue_reminders(1, checkpoint_path=checkpoint) == 1
+            assert db.session.scalars(select(EmailOutbox.participant_id)).all() == [
+                participants[2]
+            ]
+
+
+class TestWorker:
+    """Test cases for the long-running email worker."""
+
+    @patch("send_qr_emails.time.sleep")
+    @patch("send_qr_emails.process_queue")
+    @patch("send_qr_emails.spool_queue")
+    def test_runs_stages_only_when_due(
+        self, spool_queue, process_queue, sleep, test_app, participants
+    ):
+        """Test idle checks do nothing and queued emails are spooled and sent."""
+        run_worker(poll_interval=1, cycles=2)
+        spool_queue.assert_not_called()
+        assert sleep.call_count == 1
+
+        with test_app.app_context():
+            enqueue_emails(participants, "delivery_qr")
+            db.session.commit()
+        run_worker(rate=10, concurrency=2, poll_interval=1, cycles=1)
+
+        spool_queue.assert_called_once_with(None)
+        process_queue.assert_called_once_with(10, 2, None)
+
+    def test_delivery_qr_uses_the_spool(self):
+        """Test delivery list QR emails are built like the spooled QR emails."""
+        assert BUILDERS["delivery_qr"] is build_qr_message
@@ -0,0 +1,67 @@
+"""
+Unit tests for upgrading existing databases with scripts/setup_database.py.
+"""
+
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"
+    ),
+)
+
+from setup_database import upgrade_database
+from sqlalchemy import inspect, text
+
+from app import db
+from models import EmailLog, Participant
+
+
+def downgrade(connection):
+    """Recreate email_log and delivery_log as they were before outbox tracking"""
+    connection.execute(text("DROP TABLE email_log"))
+    connection.execute(
+        text(
+            "CREATE TABLE email_log (id INTEGER PRIMARY KEY, "
+            "participant_id INTEGER NOT NULL, email_type VARCHAR(50) NOT NULL, "
+            "subject VARCHAR(200), sent_at DATETIME, status VARCHAR(20), "
+            "opened_at DATETIME)"
+        )
+    )
+    connection.execute(text("DROP INDEX ux_delivery_log_delivered"))
+    connection.execute(text("DROP INDEX ix_participant_email"))
+
+
+class TestUpgradeDatabase:
+    """Test cases for the idempotent schema upgrade."""
+
+    def test_adds_missing_columns_and_indexes(self, test_app):
+        """Test an old schema gets new columns and indexes, keeping its rows."""
+        with test_app.app_context():
+            with db.engine.begin() as connection:
+                downgrade(connection)
+                connection.execute(
+                    text(
+                        "INSERT INTO email_log (participant_id, email_type) "
+                        "VALUES (1, 'qr_delivery')"
+                    )
+                )
+
+            changes = upgrade_database()
+
+            assert "column email_log.outbox_id" in changes
+            assert "index ux_delivery_log_delivered" in changes
+            assert "index ix_participant_email" in changes
+            inspector = inspect(db.engine)
+            assert "outbox_id" in {
+                column["name"] for column in inspector.get_columns("email_log")
+            }
+            assert EmailLog.query.one().outbox_id is None
+            assert Participant.query.count() == 0
+
+    def test_current_schema_is_left_alone(self, test_app):
+        """Test running the upgrade again changes nothing."""
+        with test_app.app_context():
+            assert upgrade_database() == []
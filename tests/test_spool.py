@@ -0,0 +1,166 @@
+"""
+Unit tests for the email spool.
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from app import db
+from mailer import RawMessage, SMTPPool
+from models import Dependent, EmailOutbox, Participant
+from outbox import enqueue_emails
+from spool import (
+    QR_SUBJECT,
+    compose_qr_message,
+    load_spooled_message,
+    prune_spool,
+    render_chunk,
+    spool_pending,
+)
+
+SENDER = "undokai@lightera.com"
+
+
+@pytest.fixture
+def spool_dir(tmp_path):
+    return str(tmp_path / "mail")
+
+
+@pytest.fixture
+def queued(test_app):
+    with test_app.app_context():
+        participants = [
+            Participant(
+                nome=f"Participante {i}",
+                email=f"participante{i}@lightera.com",
+                departamento="TI",
+                qr_code=f"UNDOKAI_SPOOL{i:04d}",
+            )
+            for i in range(3)
+        ]
+        db.session.add_all(participants)
+        db.session.flush()
+        db.session.add(
+            Dependent(nome="Filho", idade=8, participant_id=participants[0].id)
+        )
+        enqueue_emails([p.id for p in participants], "qr_delivery")
+        db.session.commit()
+        return [p.id for p in participants]
+
+
+class TestComposeMessage:
+    """Test cases for rendering QR code emails."""
+
+    def test_qr_code_is_inline_image(self):
+        """Test the HTML part references the QR code attached by CID."""
+        msg = compose_qr_message(
+            {
+                "nome": "Ana <b>",
+                "email": "ana@lightera.com",
+                "departamento": None,
+                "qr_code": "UNDOKAI_ANA",
+                "dependents": [{"nome": "Bia", "idade": 5}],
+            },
+            SENDER,
+        )
+
+        assert msg["To"] == "ana@lightera.com"
+        text = msg.get_body(("plain",)).get_content()
+        html = msg.get_body(("html",)).get_content()
+        assert "Bia (5 anos)" in text
+        assert "Ana &lt;b&gt;" in html
+
+        image = next(
+            part for part in msg.walk() if part.get_content_type() == "image/png"
+        )
+        cid = image["Content-ID"][1:-1]
+        assert f"cid:{cid}" in html
+        assert image.get_content().startswith(b"\x89PNG")
+
+
+class TestSpool:
+    """Test cases for the render and send stages."""
+
+    def test_render_chunk_writes_messages(self, test_app, spool_dir):
+        """Test every row is written as a complete message file."""
+        with test_app.app_context():
+            rows = [
+                {
+                    "outbox_id": 7,
+                    "nome": "Ana",
+                    "email": "ana@lightera.com",
+                    "departamento": "RH",
+                    "qr_code": "UNDOKAI_ANA",
+                    "dependents": [],
+                }
+            ]
+            assert render_chunk(rows, SENDER, spool_dir) == [(7, "7.eml")]
+            assert os.listdir(spool_dir) == ["7.eml"]
+
+            msg = load_spooled_message("7.eml", spool_dir)
+            assert msg["Subject"] == QR_SUBJECT
+            assert msg.sender == SENDER
+            assert msg.recipients == ["ana@lightera.com"]
+
+    def test_spool_pending_is_restartable(self, test_app, queued, spool_dir):
+        """Test queued rows are spooled once and recorded on the outbox row."""
+        with test_app.app_context():
+            assert spool_pending(SENDER, spool_dir, workers=1, chunk_size=2) == 3
+            assert spool_pending(SENDER, spool_dir, workers=1) == 0
+
+            refs = db.session.scalars(
+                db.select(EmailOutbox.payload_ref).order_by(EmailOutbox.id)
+            ).all()
+            assert sorted(os.listdir(spool_dir)) == sorted(refs)
+
+            first = load_spooled_message(refs[0], spool_dir)
+            assert b"Filho (8 anos)" in first.data
+
+    def test_delivery_qr_rows_are_spooled(self, test_app, queued, spool_dir):
+        """Test delivery list QR emails go through the spool as well."""
+        with test_app.app_context():
+            enqueue_emails(queued[:1], "delivery_qr")
+            db.session.commit()
+
+            assert spool_pending(SENDER, spool_dir, workers=1) == 4
+            row = EmailOutbox.query.filter_by(email_type="delivery_qr").one()
+            assert row.payload_ref == f"{row.id}.eml"
+
+    def test_prune_removes_finished_messages(self, test_app, queued, spool_dir):
+        """Test only files of sent or failed rows are deleted."""
+        with test_app.app_context():
+            spool_pending(SENDER, spool_dir, workers=1)
+            row = db.session.scalars(db.select(EmailOutbox).limit(1)).one()
+            row.status = "sent"
+            db.session.commit()
+
+            assert prune_spool(spool_dir) == 1
+            assert row.payload_ref not in os.listdir(spool_dir)
+            assert len(os.listdir(spool_dir)) == 2
+
+    @patch("mailer.smtplib.SMTP")
+    def test_pool_sends_raw_bytes(self, mock_smtp, test_app, spool_dir):
+        """Test spooled messages go out as stored, without re-serializing."""
+        with test_app.app_context():
+            rows = [
+                {
+                    "outbox_id": 1,
+                    "nome": "Ana",
+                    "email": "ana@lightera.com",
+                    "departamento": None,
+                    "qr_code": "UNDOKAI_ANA",
+                    "dependents": [],
+                }
+            ]
+            render_chunk(rows, SENDER, spool_dir)
+            msg = load_spooled_message("1.eml", spool_dir)
+
+        pool = SMTPPool("smtp.test", 587, SENDER, "secret", size=1)
+        pool.send_message(msg)
+
+        server = mock_smtp.return_value
+        server.sendmail.assert_called_once_with(SENDER, ["ana@lightera.com"], msg.data)
+        server.send_message.assert_not_called()
+        assert isinstance(msg, RawMessage)
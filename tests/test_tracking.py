@@ -0,0 +1,179 @@
+"""
+Unit tests for email open tracking.
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from models import EmailLog, EmailOutbox, Participant
+from spool import compose_qr_message
+from tracking import (
+    PIXEL_GIF,
+    OpenTracker,
+    open_token,
+    open_tracking_url,
+    read_open_token,
+)
+
+
+@pytest.fixture
+def sent_logs(test_app):
+    with test_app.app_context():
+        participant = Participant(
+            nome="Ana", email="ana@lightera.com", qr_code="UNDOKAI_ANA"
+        )
+        db.session.add(participant)
+        db.session.flush()
+        rows = [
+            EmailOutbox(participant_id=participant.id, email_type=email_type)
+            for email_type in ("qr_delivery", "reminder", "delivery_qr")
+        ]
+        db.session.add_all(rows)
+        db.session.flush()
+        db.session.add_all(
+            EmailLog(
+                participant_id=participant.id,
+                outbox_id=row.id,
+                email_type=row.email_type,
+            )
+            for row in rows
+        )
+        db.session.commit()
+        return [row.id for row in rows]
+
+
+def opened(outbox_id):
+    return db.session.scalar(
+        db.select(EmailLog.opened_at).where(EmailLog.outbox_id == outbox_id)
+    )
+
+
+class TestOpenTokens:
+    """Test cases for signed pixel URLs."""
+
+    def test_token_round_trip(self, test_app):
+        """Test tokens resolve to their outbox id and reject tampering."""
+        with test_app.app_context():
+            token = open_token(42)
+            assert read_open_token(token) == 42
+            assert read_open_token(token[:-1] + "x") is None
+            assert read_open_token("42") is None
+
+    def test_url_requires_base_url(self, test_app):
+        """Test no pixel is generated without a public base URL."""
+        with test_app.app_context():
+            assert open_tracking_url(1) is None
+            url = open_tracking_url(1, "https://undokai.test/")
+            assert url.startswith("https://undokai.test/email/open/")
+            assert url.endswith(".gif")
+
+    def test_pixel_embedded_in_html(self):
+        """Test the QR email carries the pixel when given one."""
+        msg = compose_qr_message(
+            {
+                "nome": "Ana",
+                "email": "ana@lightera.com",
+                "departamento": None,
+                "qr_code": "UNDOKAI_ANA",
+                "dependents": [],
+            },
+            "undokai@lightera.com",
+            open_url="https://undokai.test/email/open/abc.gif",
+        )
+        html = msg.get_body(("html",)).get_content()
+        assert '<img src="https://undokai.test/email/open/abc.gif"' in html
+
+
+class TestOpenTracker:
+    """Test cases for buffering and flushing opens."""
+
+    def test_flush_dedups_in_one_statement(self, test_app, sent_logs):
+        """Test repeat opens collapse and are written by one executemany."""
+        with test_app.app_context():
+            tracker = OpenTracker(interval=None)
+            first = datetime(2024, 12, 1, 10, 0)
+            tracker.record(sent_logs[0], first)
+            tracker.record(sent_logs[0], first + timedelta(minutes=5))
+            tracker.record(sent_logs[1], first)
+            assert tracker.pending() == 2
+
+            statements = []
+
+            def listener(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(db.engine, "before_cursor_execute", listener)
+            try:
+                assert tracker.flush() == 2
+            finally:
+                event.remove(db.engine, "before_cursor_execute", listener)
+
+            assert len([s for s in statements if s.startswith("UPDATE")]) == 1
+            assert opened(sent_logs[0]) == first
+            assert opened(sent_logs[2]) is None
+
+            # Already written: a later open is buffered but changes nothing
+            tracker.record(sent_logs[0])
+            assert tracker.flush() == 1
+            assert opened(sent_logs[0]) == first
+
+    def test_existing_open_is_kept(self, test_app, sent_logs):
+        """Test a second flush never overwrites the first open time."""
+        with test_app.app_context():
+            first = datetime(2024, 12, 1, 10, 0)
+            tracker = OpenTracker(interval=None)
+            tracker.record(sent_logs[0], first)
+            tracker.flush()
+
+            other = OpenTracker(interval=None)
+            other.record(sent_logs[0], first + timedelta(days=1))
+            other.flush()
+            assert opened(sent_logs[0]) == first
+
+    def test_open_before_log_is_kept(self, test_app, sent_logs):
+        """Test an open seen before the batch is logged waits for its row."""
+        with test_app.app_context():
+            row = EmailOutbox(participant_id=1, email_type="qr_delivery")
+            db.session.add(row)
+            db.session.commit()
+
+            tracker = OpenTracker(interval=None)
+            tracker.record(row.id)
+            tracker.record(sent_logs[0], datetime.utcnow() - timedelta(hours=1))
+            assert tracker.flush() == 1
+            assert tracker.pending() == 1
+
+            db.session.add(
+                EmailLog(participant_id=1, outbox_id=row.id, email_type="qr_delivery")
+            )
+            db.session.commit()
+            assert tracker.flush() == 1
+            assert opened(row.id) is not None
+
+    def test_unmatched_open_expires(self, test_app, sent_logs):
+        """Test opens of rows never logged are dropped after the window."""
+        with test_app.app_context():
+            tracker = OpenTracker(interval=None, match_window=60)
+            tracker.record(999, datetime.utcnow() - timedelta(minutes=2))
+            assert tracker.flush() == 1
+            assert tracker.pending() == 0
+
+    def test_pixel_route_buffers_open(self, client, test_app, sent_logs):
+        """Test the pixel answers with the GIF and buffers valid opens only."""
+        tracker = OpenTracker(interval=None)
+        with test_app.app_context(), patch("tracking.open_tracker", tracker):
+            response = client.get(f"/email/open/{open_token(sent_logs[1])}.gif")
+            assert response.status_code == 200
+            assert response.mimetype == "image/gif"
+            assert response.data == PIXEL_GIF
+            assert "no-store" in response.headers["Cache-Control"]
+
+            assert client.get("/email/open/forged.gif").data == PIXEL_GIF
+            assert tracker.pending() == 1
+
+            tracker.flush()
+            assert opened(sent_logs[1]) is not None
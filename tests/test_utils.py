@@ -5,13 +5,15 @@ Unit tests for utility functions.
 import base64
 import io
 from datetime import datetime, timedelta
-from unittest.mock import MagicMock, patch
+from unittest.mock import patch
 
 import pytest
 from PIL import Image
 
 from app import db
+from mailer import SMTP_TIMEOUT
 from models import CheckIn, DeliveryItem, Dependent, Participant
+from spool import QR_SUBJECT
 from utils import (
     create_sample_delivery_items,
     generate_qr_code,
@@ -81,7 +83,7 @@ class TestQRCodeGeneration:
 class TestEmailSending:
     """Test cases for email sending utilities."""
 
-    @patch("utils.smtplib.SMTP")
+    @patch("mailer.smtplib.SMTP")
     @patch.dict(
         "os.environ",
         {
@@ -95,8 +97,7 @@ class TestEmailSending:
         """Test successful email sending."""
         with test_app.app_context():
             # Mock SMTP server
-            mock_server = MagicMock()
-            mock_smtp.return_value.__enter__.return_value = mock_server
+            mock_server = mock_smtp.return_value
 
             # Add sample participant to database
             db.session.add(sample_participant)
@@ -109,12 +110,17 @@ class TestEmailSending:
             assert result is True
 
             # Verify SMTP calls
-            mock_smtp.assert_called_once_with("test.smtp.com", 587)
+            mock_smtp.assert_called_once_with(
+                "test.smtp.com", 587, timeout=SMTP_TIMEOUT
+            )
             mock_server.starttls.assert_called_once()
             mock_server.login.assert_called_once_with("test@lightera.com", "testpass")
             mock_server.send_message.assert_called_once()
+            # Same subject as the spooled QR code email
+            msg = mock_server.send_message.call_args[0][0]
+            assert msg["Subject"] == QR_SUBJECT
 
-    @patch("utils.smtplib.SMTP")
+    @patch("mailer.smtplib.SMTP")
     @patch.dict(
         "os.environ",
         {
@@ -128,8 +134,7 @@ class TestEmailSending:
         """Test email sending with QR code image attachment."""
         with test_app.app_context():
             # Mock SMTP server
-            mock_server = MagicMock()
-            mock_smtp.return_value.__enter__.return_value = mock_server
+            mock_server = mock_smtp.return_value
 
             # Add sample participant to database
             db.session.add(sample_participant)
@@ -162,7 +167,7 @@ class TestEmailSending:
             result = send_qr_email(sample_participant)
             assert result is False
 
-    @patch("utils.smtplib.SMTP")
+    @patch("mailer.smtplib.SMTP")
     @patch.dict(
         "os.environ",
         {
@@ -393,7 +398,7 @@ class TestStatistics:
 class TestUtilityIntegration:
     """Integration tests for utility functions working together."""
 
-    @patch("utils.smtplib.SMTP")
+    @patch("mailer.smtplib.SMTP")
     @patch.dict(
         "os.environ",
         {
@@ -407,8 +412,7 @@ class TestUtilityIntegration:
         """Test complete QR code generation and email workflow."""
         with test_app.app_context():
             # Mock SMTP server
-            mock_server = MagicMock()
-            mock_smtp.return_value.__enter__.return_value = mock_server
+            mock_server = mock_smtp.return_value
 
             # Create participant
             participant = Participant(
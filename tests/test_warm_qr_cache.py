@@ -0,0 +1,116 @@
+"""
+Unit tests for pre-rendering QR codes with scripts/warm_qr_cache.py.
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"
+    ),
+)
+
+import pytest
+from warm_qr_cache import (
+    load_checkpoint,
+    qr_cache,
+    render_chunk,
+    save_checkpoint,
+    warm_cache,
+)
+
+from app import db
+from models import Participant
+from qr_cache import QRCache
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    directory = str(tmp_path / "qr")
+    monkeypatch.setattr(qr_cache, "directory", directory)
+    return QRCache(directory=directory, max_entries=0)
+
+
+@pytest.fixture
+def participants(test_app):
+    with test_app.app_context():
+        rows = [
+            Participant(
+                nome=f"Participante {i}",
+                email=f"participante{i}@lightera.com",
+                qr_code=f"QR{i:06d}",
+            )
+            for i in range(3)
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [(row.id, row.qr_code) for row in rows]
+
+
+class TestCheckpoint:
+    """Test cases for the warm-up checkpoint file."""
+
+    def test_round_trip(self, tmp_path):
+        """Test a saved checkpoint is loaded back for the same parameters."""
+        path = str(tmp_path / "cache" / ".warm_checkpoint.json")
+        save_checkpoint(path, 42, 10, None, ["png"])
+
+        assert load_checkpoint(path, 10, None, ["png"]) == 42
+        assert not os.path.exists(f"{path}.tmp")
+
+    def test_other_parameters_start_over(self, tmp_path):
+        """Test a checkpoint of another size or format is ignored."""
+        path = str(tmp_path / ".warm_checkpoint.json")
+        save_checkpoint(path, 42, 10, None, ["png"])
+
+        assert load_checkpoint(path, 5, None, ["png"]) == 0
+        assert load_checkpoint(path, 10, None, ["png", "svg"]) == 0
+
+    def test_missing_or_corrupt(self, tmp_path):
+        """Test an unreadable checkpoint starts from the beginning."""
+        path = tmp_path / ".warm_checkpoint.json"
+        assert load_checkpoint(str(path), 10, None, ["png"]) == 0
+
+        path.write_text("{not json")
+        assert load_checkpoint(str(path), 10, None, ["png"]) == 0
+
+
+class TestWarmCache:
+    """Test cases for rendering participant QR codes into the store."""
+
+    def test_skips_stored_codes(self, store):
+        """Test codes already in the store are not rendered again."""
+        assert render_chunk(["A", "B"], 10, None, ("png",), store.directory) == 2
+        assert render_chunk(["A", "B", "C"], 10, None, ("png",), store.directory) == 1
+        assert store.contains("C", 10, None, "png")
+
+    def test_resumes_after_checkpoint(self, test_app, participants, store, tmp_path):
+        """Test only participants after the checkpoint are rendered."""
+        path = str(tmp_path / ".warm_checkpoint.json")
+        save_checkpoint(path, participants[1][0], 10, None, ["png"])
+
+        result = warm_cache(workers=1, checkpoint_path=path)
+
+        assert result["participants"] == 1
+        assert result["rendered"] == 1
+        assert [store.contains(code, 10, None, "png") for _, code in participants] == [
+            False,
+            False,
+            True,
+        ]
+        assert load_checkpoint(path, 10, None, ["png"]) == participants[2][0]
+        with open(path) as checkpoint_file:
+            assert json.load(checkpoint_file)["last_id"] == participants[2][0]
+
+    def test_restart_ignores_checkpoint(self, test_app, participants, store, tmp_path):
+        """Test resume=False scans every participant."""
+        path = str(tmp_path / ".warm_checkpoint.json")
+        save_checkpoint(path, participants[2][0], 10, None, ["png"])
+
+        result = warm_cache(workers=1, resume=False, checkpoint_path=path)
+
+        assert result["participants"] == 3
+        assert result["rendered"] == 3
@@ -0,0 +1,161 @@
+"""
+Email open tracking
+
+HTML emails embed a 1x1 GIF whose URL carries the signed id of the outbox
+row the message was sent from. The pixel endpoint only verifies the
+signature and records the open in an in-memory buffer, keeping the first
+open per row; a background thread flushes the buffer to EmailLog.opened_at
+every OPEN_FLUSH_INTERVAL seconds with a single executemany UPDATE, so a
+burst of opens after a campaign costs one transaction per interval rather
+than one per recipient. Rows already marked as opened are left untouched by
+the UPDATE, so repeated opens need no bookkeeping here.
+
+The pixel works as soon as a message is sent, but its EmailLog row is only
+written once the worker finishes the batch. Opens of rows without a log
+yet stay buffered for up to OPEN_MATCH_WINDOW seconds instead of being lost.
+"""
+
+import atexit
+import base64
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import bindparam, select, update
+
+# Public URL of the app used in email links (e.g. https://undokai.lightera.com);
+# emails carry no pixel when unset
+EMAIL_BASE_URL = os.environ.get("EMAIL_BASE_URL")
+OPEN_FLUSH_INTERVAL = float(os.environ.get("OPEN_FLUSH_INTERVAL", "5"))
+OPEN_MATCH_WINDOW = float(os.environ.get("OPEN_MATCH_WINDOW", "600"))
+
+PIXEL_GIF = base64.b64decode("R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+
+logger = logging.getLogger(__name__)
+
+
+def _serializer():
+    from app import app
+
+    return URLSafeSerializer(app.secret_key, salt="email-open")
+
+
+def open_token(outbox_id):
+    return _serializer().dumps(outbox_id)
+
+
+def read_open_token(token):
+    """Outbox id of a pixel token, or None when the signature is invalid"""
+    try:
+        outbox_id = _serializer().loads(token)
+    except BadSignature:
+        return None
+    return outbox_id if isinstance(outbox_id, int) else None
+
+
+def open_tracking_url(outbox_id, base_url=None):
+    """Pixel URL of an outbox row, or None when tracking is not configured"""
+    base_url = base_url or EMAIL_BASE_URL
+    if not base_url:
+        return None
+    return f"{base_url.rstrip('/')}/email/open/{open_token(outbox_id)}.gif"
+
+
+class OpenTracker:
+    """Buffers email opens and writes them to EmailLog in batches
+
+    With ``interval=None`` nothing is flushed automatically.
+    """
+
+    def __init__(self, interval=OPEN_FLUSH_INTERVAL, match_window=OPEN_MATCH_WINDOW):
+        self.interval = interval
+        self.match_window = match_window
+        self._lock = threading.Lock()
+        self._opens = {}
+        self._flusher = None
+        self._stop = threading.Event()
+
+    def record(self, outbox_id, opened_at=None):
+        with self._lock:
+            self._opens.setdefault(outbox_id, opened_at or datetime.utcnow())
+            start = self.interval is not None and self._flusher is None
+            if start:
+                self._flusher = threading.Thread(
+                    target=self._run, name="open-tracker", daemon=True
+                )
+        if start:
+            self._flusher.start()
+
+    def pending(self):
+        with self._lock:
+            return len(self._opens)
+
+    def flush(self):
+        """Write buffered opens in one statement; returns the opens settled
+
+        Opens whose EmailLog row does not exist yet are kept for the next
+        flush until they are ``match_window`` seconds old.
+        """
+        from app import app, db
+        from models import EmailLog
+
+        with self._lock:
+            opens, self._opens = self._opens, {}
+        if not opens:
+            return 0
+
+        try:
+            with app.app_context():
+                email_log = EmailLog.__table__
+                db.session.execute(
+                    update(email_log)
+                    .where(
+                        email_log.c.outbox_id == bindparam("b_outbox_id"),
+                        email_log.c.opened_at.is_(None),
+                    )
+                    .values(opened_at=bindparam("b_opened_at")),
+                    [
+                        {"b_outbox_id": outbox_id, "b_opened_at": opened_at}
+                        for outbox_id, opened_at in opens.items()
+                    ],
+                )
+                logged = set(
+                    db.session.scalars(
+                        select(email_log.c.outbox_id).where(
+                            email_log.c.outbox_id.in_(list(opens))
+                        )
+                    )
+                )
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"Failed to record {len(opens)} email opens: {str(e)}")
+            # Keep them for the next flush
+            with self._lock:
+                for outbox_id, opened_at in opens.items():
+                    self._opens.setdefault(outbox_id, opened_at)
+            return 0
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.match_window)
+        waiting = {
+            outbox_id: opened_at
+            for outbox_id, opened_at in opens.items()
+            if outbox_id not in logged and opened_at >= cutoff
+        }
+        with self._lock:
+            for outbox_id, opened_at in waiting.items():
+                self._opens.setdefault(outbox_id, opened_at)
+        return len(opens) - len(waiting)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+open_tracker = OpenTracker()
+atexit.register(open_tracker.close)
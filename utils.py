@@ -1,92 +1,119 @@
 import base64
-import io
-import os
-import smtplib
+import uuid
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
-import qrcode
+from sqlalchemy import Integer, bindparam, column, func, select, table, text
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from mailer import get_smtp_pool
+from spool import QR_SUBJECT
 
 # Import app and db only when needed to avoid circular imports
 
+# Selections above this size are staged in a temporary table (or a Postgres
+# array) instead of being expanded into one IN (...) clause
+LARGE_SELECTION_THRESHOLD = 500
 
-def generate_qr_code(data, size=10, border=4):
-    """Generate QR code and return as base64 string"""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=size,
-        border=border,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
 
-    img = qr.make_image(fill_color="black", back_color="white")
+def generate_qr_code(data, size=10, border=None):
+    """Generate QR code and return as base64 string
 
-    # Convert to base64
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
+    ``border`` defaults to the quiet zone of the configured QR profile.
+    """
+    from qr_cache import qr_cache
 
-    img_str = base64.b64encode(buffer.getvalue()).decode()
+    img_str = base64.b64encode(qr_cache.get(data, size, border)).decode()
     return f"data:image/png;base64,{img_str}"
 
 
+def generate_unique_qr_codes(count):
+    """Generate ``count`` participant QR codes not used by anyone yet
+
+    Candidates are checked against the database in batches, so a whole
+    import or registration batch costs a handful of queries.
+    """
+    from app import db
+    from models import Participant
+
+    codes = set()
+    while len(codes) < count:
+        candidates = {
+            str(uuid.uuid4())[:8].upper() for _ in range(count - len(codes))
+        } - codes
+        batch = list(candidates)
+        for start in range(0, len(batch), LARGE_SELECTION_THRESHOLD):
+            taken = db.session.scalars(
+                select(Participant.qr_code).where(
+                    Participant.qr_code.in_(
+                        batch[start : start + LARGE_SELECTION_THRESHOLD]
+                    )
+                )
+            )
+            candidates.difference_update(taken)
+        codes |= candidates
+    return list(codes)
+
+
+def build_qr_email(participant, sender, qr_image_data=None):
+    """Build the QR code email of a participant
+
+    ``qr_image_data`` is an optional data URL attached as the QR image.
+    """
+    msg = MIMEMultipart()
+    msg["From"] = sender
+    msg["To"] = participant.email
+    msg["Subject"] = QR_SUBJECT
+
+    # Email body
+    body = f"""
+    Olá {participant.nome},
+    
+    Sua inscrição para o UNDOKAI 2025 foi confirmada!
+    
+    QR Code de Acesso: {participant.qr_code}
+    
+    Dependentes: {len(participant.dependents)}
+    
+    Apresente este QR Code na entrada do evento para realizar seu check-in.
+    
+    Atenciosamente,
+    Equipe Lightera
+    """
+
+    msg.attach(MIMEText(body, "plain"))
+
+    # Attach QR code image if provided
+    if qr_image_data:
+        # Convert base64 to bytes
+        img_data = base64.b64decode(qr_image_data.split(",")[1])
+        img = MIMEImage(img_data)
+        img.add_header(
+            "Content-Disposition",
+            f"attachment; filename=qr_code_{participant.qr_code}.png",
+        )
+        msg.attach(img)
+
+    return msg
+
+
 def send_qr_email(participant, qr_image_data=None):
     """Send QR code via email"""
     from app import app
 
     try:
-        smtp_server = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.environ.get("SMTP_PORT", "587"))
-        smtp_username = os.environ.get("SMTP_USERNAME")
-        smtp_password = os.environ.get("SMTP_PASSWORD")
-
-        if not all([smtp_username, smtp_password]):
+        pool = get_smtp_pool()
+        if pool is None:
             app.logger.warning("Email credentials not configured")
             return False
 
-        msg = MIMEMultipart()
-        msg["From"] = smtp_username
-        msg["To"] = participant.email
-        msg["Subject"] = f"UNDOKAI 2025 - Seu QR Code de Acesso"
-
-        # Email body
-        body = f"""
-        Olá {participant.nome},
-        
-        Sua inscrição para o UNDOKAI 2025 foi confirmada!
-        
-        QR Code de Acesso: {participant.qr_code}
-        
-        Dependentes: {len(participant.dependents)}
-        
-        Apresente este QR Code na entrada do evento para realizar seu check-in.
-        
-        Atenciosamente,
-        Equipe Lightera
-        """
-
-        msg.attach(MIMEText(body, "plain"))
-
-        # Attach QR code image if provided
-        if qr_image_data:
-            # Convert base64 to bytes
-            img_data = base64.b64decode(qr_image_data.split(",")[1])
-            img = MIMEImage(img_data)
-            img.add_header(
-                "Content-Disposition",
-                f"attachment; filename=qr_code_{participant.qr_code}.png",
-            )
-            msg.attach(img)
+        msg = build_qr_email(participant, pool.username, qr_image_data)
 
-        # Send email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.send_message(msg)
+        # Send email over a pooled connection
+        pool.send_message(msg)
 
         app.logger.info(f"QR code email sent to {participant.email}")
         return True
@@ -226,3 +253,111 @@ def get_checkin_statistics():
         "department_stats": dict(dept_stats),
         "hourly_checkins": hourly_checkins,
     }
+
+
+def normalize_participant_ids(participant_ids):
+    """Return the unique integer ids from a request payload, keeping order"""
+    ids = []
+    seen = set()
+    for participant_id in participant_ids:
+        try:
+            participant_id = int(participant_id)
+        except (TypeError, ValueError):
+            continue
+        if participant_id not in seen:
+            seen.add(participant_id)
+            ids.append(participant_id)
+    return ids
+
+
+@contextmanager
+def staged_ids(ids):
+    """Yield a selectable with an ``id`` column holding the given ids
+
+    Small selections yield None so callers can use a plain IN clause. Large
+    ones are passed as a single array parameter on Postgres, or bulk inserted
+    into a temporary table on other databases.
+    """
+    from app import db
+
+    if len(ids) <= LARGE_SELECTION_THRESHOLD:
+        yield None
+        return
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        yield select(
+            func.unnest(bindparam("selected_ids", ids, type_=ARRAY(Integer))).label(
+                "id"
+            )
+        ).subquery("selected_ids")
+        return
+
+    connection = db.session.connection()
+    connection.execute(
+        text(
+            "CREATE TEMPORARY TABLE IF NOT EXISTS selected_ids (id INTEGER PRIMARY KEY)"
+        )
+    )
+    connection.execute(text("DELETE FROM selected_ids"))
+    connection.execute(
+        text("INSERT INTO selected_ids (id) VALUES (:id)"), [{"id": i} for i in ids]
+    )
+    try:
+        yield table("selected_ids", column("id"))
+    finally:
+        connection.execute(text("DELETE FROM selected_ids"))
+
+
+def fetch_selected_participants(participant_ids):
+    """Load participants with their first check-in and dependents count
+
+    Runs a single statement regardless of the selection size and returns
+    one row mapping per existing participant.
+    """
+    from app import db
+    from models import CheckIn, Dependent, Participant
+
+    ids = normalize_participant_ids(participant_ids)
+    if not ids:
+        return []
+
+    first_checkin = (
+        select(CheckIn.participant_id, func.min(CheckIn.id).label("checkin_id"))
+        .group_by(CheckIn.participant_id)
+        .subquery()
+    )
+    dependents = (
+        select(
+            Dependent.participant_id,
+            func.count(Dependent.id).label("dependents_count"),
+        )
+        .group_by(Dependent.participant_id)
+        .subquery()
+    )
+
+    stmt = (
+        select(
+            Participant.id,
+            Participant.nome,
+            Participant.email,
+            Participant.telefone,
+            Participant.departamento,
+            Participant.matricula,
+            Participant.qr_code,
+            CheckIn.checkin_time,
+            CheckIn.station,
+            func.coalesce(dependents.c.dependents_count, 0).label("dependents_count"),
+        )
+        .select_from(Participant)
+        .outerjoin(first_checkin, first_checkin.c.participant_id == Participant.id)
+        .outerjoin(CheckIn, CheckIn.id == first_checkin.c.checkin_id)
+        .outerjoin(dependents, dependents.c.participant_id == Participant.id)
+        .order_by(Participant.id)
+    )
+
+    with staged_ids(ids) as selected:
+        if selected is None:
+            stmt = stmt.where(Participant.id.in_(ids))
+        else:
+            stmt = stmt.join(selected, selected.c.id == Participant.id)
+        return db.session.execute(stmt).mappings().all()